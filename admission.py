@@ -0,0 +1,184 @@
+"""
+admission.py - Admission control cho các lệnh phân tích nặng
+
+Trận lớn -> nhiều người cùng gõ !phantich. Không có giới hạn thì mỗi lệnh
+chạy nguyên pipeline (Football-Data, The Odds API, model, AI) độc lập, quota
+API cháy nhanh và độ trễ tăng không giới hạn. Module này cung cấp:
+
+- RateLimits: giới hạn số lệnh theo cửa sổ trượt cho từng user / guild
+- AdmissionGate: tối đa `max_concurrent` pipeline chạy cùng lúc, hàng đợi
+  có giới hạn xếp theo priority (!phantich trước, mô phỏng cả mùa sau);
+  hàng đợi đầy hoặc chờ quá `max_wait` -> Busy để bot trả lời "đang bận".
+  Lệnh rẻ (!stats, !lichdau, !analyze...) không đi qua gate nên không bao
+  giờ phải xếp hàng sau các pipeline nặng
+- InFlight: các yêu cầu trùng key (cùng một trận) cùng chờ một future thay
+  vì mỗi yêu cầu chạy pipeline riêng
+
+Chỉ dùng trong event loop (không thread-safe, không cần lock).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_MAX_CONCURRENT = int(os.getenv('ANALYSIS_MAX_CONCURRENT', '3'))
+ANALYSIS_MAX_QUEUE = int(os.getenv('ANALYSIS_MAX_QUEUE', '12'))
+ANALYSIS_MAX_WAIT = 90.0  # giây chờ tối đa trong hàng đợi
+
+# (số lệnh, cửa sổ giây) cho mỗi phạm vi
+USER_RATE_LIMIT = (4, 60.0)
+GUILD_RATE_LIMIT = (20, 60.0)
+
+# Số nhỏ được phục vụ trước
+PRIORITY_ANALYSIS = 0
+PRIORITY_BULK = 1
+
+
+class Busy(Exception):
+    """Hàng đợi đầy hoặc chờ quá lâu - yêu cầu bị từ chối (shed load)."""
+
+
+class RateLimited(Exception):
+    """User / guild vượt giới hạn; retry_after = số giây nên chờ."""
+
+    def __init__(self, scope: str, retry_after: float):
+        super().__init__(f'Rate limited ({scope}), retry after {retry_after:.0f}s')
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+class RateLimits:
+    """Sliding-window limits per scope, e.g. {'user': (4, 60), 'guild': (20, 60)}."""
+
+    def __init__(self, limits: Optional[Dict[str, Tuple[int, float]]] = None):
+        self.limits = limits or {'user': USER_RATE_LIMIT, 'guild': GUILD_RATE_LIMIT}
+        self._hits: Dict[Tuple[str, Hashable], Deque[float]] = {}
+
+    def _window(self, scope: str, key: Hashable, now: float) -> Deque[float]:
+        window = self.limits[scope][1]
+        hits = self._hits.setdefault((scope, key), deque())
+        while hits and hits[0] <= now - window:
+            hits.popleft()
+        return hits
+
+    def admit(self, now: Optional[float] = None, **keys: Hashable) -> None:
+        """
+        Count one request for every given scope (admit(user=..., guild=...)); keys that
+        are None are skipped. Raises RateLimited without counting if any scope is full.
+        """
+        now = time.monotonic() if now is None else now
+        windows = []
+        for scope, key in keys.items():
+            if key is None or scope not in self.limits:
+                continue
+            limit, window = self.limits[scope]
+            hits = self._window(scope, key, now)
+            if len(hits) >= limit:
+                raise RateLimited(scope, hits[0] + window - now)
+            windows.append(hits)
+        for hits in windows:
+            hits.append(now)
+        # Dọn các key không còn lượt nào trong cửa sổ
+        if len(self._hits) > 1024:
+            self._hits = {k: v for k, v in self._hits.items() if v and v[-1] > now - self.limits[k[0]][1]}
+
+
+class AdmissionGate:
+    """Bounded concurrency with a bounded priority queue in front of it."""
+
+    def __init__(self, max_concurrent: int = ANALYSIS_MAX_CONCURRENT, max_queue: int = ANALYSIS_MAX_QUEUE,
+                 max_wait: float = ANALYSIS_MAX_WAIT):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.running = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def would_wait(self) -> bool:
+        return self.running >= self.max_concurrent or bool(self._waiters)
+
+    async def acquire(self, priority: int = PRIORITY_ANALYSIS) -> None:
+        if not self.would_wait():
+            self.running += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise Busy(f'queue full ({self.running} running, {len(self._waiters)} queued)')
+        entry = (priority, next(self._seq), asyncio.get_running_loop().create_future())
+        heapq.heappush(self._waiters, entry)
+        try:
+            await asyncio.wait_for(asyncio.shield(entry[2]), timeout=self.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if entry[2].done() and not entry[2].cancelled():
+                # Slot được trao đúng lúc hết giờ / bị huỷ: trả lại cho người kế tiếp
+                self.release()
+            else:
+                entry[2].cancel()
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise Busy(f'waited more than {self.max_wait:.0f}s') from None
+
+    def release(self) -> None:
+        """Hand the slot to the best waiter, or free it."""
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.running -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_ANALYSIS):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class InFlight:
+    """Share one result between concurrent requests for the same key."""
+
+    def __init__(self):
+        self._futures: Dict[Hashable, asyncio.Future] = {}
+
+    def claim(self, key: Hashable) -> Tuple[bool, asyncio.Future]:
+        """(True, future) for the first caller (the leader), (False, future) for followers."""
+        future = self._futures.get(key)
+        if future is not None:
+            return False, future
+        future = asyncio.get_running_loop().create_future()
+        self._futures[key] = future
+        return True, future
+
+    def resolve(self, key: Hashable, result: Any = None, error: Optional[BaseException] = None) -> None:
+        """Leader publishes its result (or error) and the key is released."""
+        future = self._futures.pop(key, None)
+        if future is None or future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+            future.exception()  # không follower nào chờ thì cũng không cảnh báo
+        else:
+            future.set_result(result)
+
+    @staticmethod
+    async def join(future: asyncio.Future) -> Any:
+        """Await a leader's result; cancelling one follower does not cancel the others."""
+        return await asyncio.shield(future)
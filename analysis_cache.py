@@ -0,0 +1,117 @@
+"""
+analysis_cache.py - LRU + TTL cache for complete match analyses
+
+Một lần `!phantich` chạy stats, features, hai model, Poisson và AI. Kết quả
+được cache theo (đội nhà chuẩn, đội khách chuẩn, phiên bản odds, hash model)
+nên cache tự vô hiệu khi odds hoặc model thay đổi.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from team_names import canonical_team_name
+
+ANALYSIS_CACHE_TTL = 30 * 60  # 30 phút
+ANALYSIS_CACHE_SIZE = 256
+
+# Các trường odds ảnh hưởng tới kết quả phân tích
+_ODDS_VERSION_FIELDS = ('source', 'handicap_value', 'home_odds', 'away_odds', 'asian_handicap')
+
+
+class TTLCache:
+    """Thread-safe LRU cache with a per-entry time-to-live."""
+
+    def __init__(self, maxsize: int = 128, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+            return default if item is None else item[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+def odds_snapshot_version(odds_data: Optional[Dict[str, Any]]) -> str:
+    """Hash ổn định của snapshot odds; mock odds bỏ qua timestamp (luôn là now())."""
+    if not odds_data:
+        return 'none'
+    snap = {k: odds_data.get(k) for k in _ODDS_VERSION_FIELDS}
+    if odds_data.get('source') != 'mock':
+        snap['timestamp'] = odds_data.get('timestamp')
+    raw = json.dumps(snap, sort_keys=True, default=str)
+    return hashlib.md5(raw.encode()).hexdigest()[:12]
+
+
+_FILE_HASHES: Dict[str, Tuple[Tuple[int, int], str]] = {}
+
+
+def file_fingerprint(path: str) -> str:
+    """Hash nội dung file, chỉ đọc lại khi mtime/size thay đổi."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return 'missing'
+    sig = (st.st_mtime_ns, st.st_size)
+    cached = _FILE_HASHES.get(path)
+    if cached and cached[0] == sig:
+        return cached[1]
+    h = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    digest = h.hexdigest()
+    _FILE_HASHES[path] = (sig, digest)
+    return digest
+
+
+def bundle_hash(paths: Iterable[str]) -> str:
+    """Hash gộp của một nhóm file (model, scaler, features, strengths...)."""
+    h = hashlib.md5()
+    for p in paths:
+        h.update(p.encode())
+        h.update(file_fingerprint(p).encode())
+    return h.hexdigest()[:12]
+
+
+def make_analysis_key(home_team: str, away_team: str,
+                      odds_data: Optional[Dict[str, Any]], model_version: str) -> Tuple[str, str, str, str]:
+    return (canonical_team_name(home_team), canonical_team_name(away_team),
+            odds_snapshot_version(odds_data), model_version)
@@ -0,0 +1,147 @@
+"""
+artifact_cache.py - Content-fingerprinted cache for derived artifacts
+
+Artifacts derived from master_dataset.csv (feature lists, scalers,
+calibration, Poisson strengths) are keyed by a fingerprint of their source
+files' content plus a code version string. A manifest records the key each
+artifact was built with, so a stale artifact is rebuilt automatically and an
+unchanged one is neither recomputed nor re-read from disk.
+
+Nội dung file được hash qua `analysis_cache.file_fingerprint` (chỉ đọc lại
+khi mtime/size đổi).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import pickle
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from analysis_cache import bundle_hash, file_fingerprint
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_PATH = 'artifact_manifest.json'
+
+_LOCK = threading.RLock()
+# path -> (key hoặc fingerprint file, value) cho các artifact đã nạp
+_MEMORY: Dict[str, Tuple[str, Any]] = {}
+
+
+def _pickle_load(path: str) -> Any:
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def _pickle_save(path: str, value: Any) -> None:
+    with open(path, 'wb') as f:
+        pickle.dump(value, f)
+
+
+def fingerprint(sources: Iterable[str], version: str, params: Optional[Dict[str, Any]] = None) -> str:
+    """Key of an artifact: content of its source files + code version + build parameters."""
+    h = hashlib.md5()
+    h.update(bundle_hash(sources).encode())
+    h.update(str(version).encode())
+    h.update(json.dumps(params or {}, sort_keys=True, default=str).encode())
+    return h.hexdigest()[:16]
+
+
+def _read_manifest() -> Dict[str, Dict[str, Any]]:
+    try:
+        with open(MANIFEST_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _record(path: str, key: str, version: str) -> None:
+    manifest = _read_manifest()
+    manifest[path] = {'key': key, 'version': str(version), 'built_at': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    tmp = f'{MANIFEST_PATH}.tmp'
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp, MANIFEST_PATH)
+    except OSError as e:
+        logger.warning(f'Cannot write artifact manifest: {e}')
+
+
+def _save_atomic(path: str, value: Any, saver: Callable[[str, Any], None]) -> None:
+    tmp = f'{path}.tmp'
+    saver(tmp, value)
+    os.replace(tmp, path)
+
+
+def is_stale(path: str, sources: Iterable[str], version: str, params: Optional[Dict[str, Any]] = None) -> bool:
+    """True when the artifact is missing or was built from other sources / code."""
+    if not os.path.exists(path):
+        return True
+    entry = _read_manifest().get(path)
+    return entry is None or entry.get('key') != fingerprint(sources, version, params)
+
+
+def store_artifact(path: str, value: Any, sources: Iterable[str], version: str,
+                   params: Optional[Dict[str, Any]] = None,
+                   saver: Callable[[str, Any], None] = _pickle_save) -> None:
+    """Write an artifact built elsewhere (e.g. during training) and record its key."""
+    key = fingerprint(sources, version, params)
+    with _LOCK:
+        _save_atomic(path, value, saver)
+        _record(path, key, version)
+        _MEMORY[path] = (key, value)
+
+
+def cached_artifact(path: str, builder: Callable[[], Any], sources: Iterable[str], version: str,
+                    params: Optional[Dict[str, Any]] = None,
+                    loader: Callable[[str], Any] = _pickle_load,
+                    saver: Callable[[str, Any], None] = _pickle_save) -> Any:
+    """
+    Return the artifact at `path`, building it with `builder()` only when its
+    sources, code version or params changed since it was last built.
+    """
+    sources = list(sources)
+    key = fingerprint(sources, version, params)
+    with _LOCK:
+        memo = _MEMORY.get(path)
+        if memo is not None and memo[0] == key and os.path.exists(path):
+            return memo[1]
+        if not is_stale(path, sources, version, params):
+            try:
+                value = loader(path)
+                _MEMORY[path] = (key, value)
+                return value
+            except Exception as e:
+                logger.warning(f'Cannot load artifact {path}, rebuilding: {e}')
+        logger.info(f'Rebuilding artifact {path} (sources or code version changed)')
+        value = builder()
+        _save_atomic(path, value, saver)
+        _record(path, key, version)
+        _MEMORY[path] = (key, value)
+        return value
+
+
+def load_artifact(path: str, default: Any = None, loader: Callable[[str], Any] = _pickle_load) -> Any:
+    """
+    Read an artifact once and reuse it until the file content changes.
+    Returns `default` when the file is missing or unreadable.
+    """
+    fp = file_fingerprint(path)
+    if fp == 'missing':
+        return default
+    with _LOCK:
+        memo = _MEMORY.get(path)
+        if memo is not None and memo[0] == fp:
+            return memo[1]
+        try:
+            value = loader(path)
+        except Exception as e:
+            logger.warning(f'Cannot load artifact {path}: {e}')
+            return default
+        _MEMORY[path] = (fp, value)
+        return value
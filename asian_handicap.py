@@ -0,0 +1,100 @@
+"""
+asian_handicap.py - Asian handicap probabilities from the goal-difference distribution
+
+Handicap convention matches `handicap_value` in odds data: the line is added to
+the home team's goals (home -0.5 means home must win). Quarter lines (±0.25,
+±0.75, ...) split the stake across the two neighbouring lines, so every bet
+settles as one of win / half-win / push / half-loss / loss.
+
+All lines are priced in one matrix product over the goal-difference vector of a
+fixture (or a batch of fixtures), e.g. `MatchDistribution.goal_diff`.
+"""
+
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+# Tất cả các mốc kèo từ -3 đến +3, bước 0.25
+AH_LINES = np.round(np.arange(-3.0, 3.0 + 1e-9, 0.25), 2)
+OUTCOMES = ('win', 'half_win', 'push', 'half_loss', 'loss')
+
+
+def _outcome_codes(margin: np.ndarray) -> np.ndarray:
+    """Map margin (goal diff + line, multiple of 0.25) to an index into OUTCOMES."""
+    quarters = np.clip(np.rint(np.asarray(margin) * 4).astype(int), -2, 2)
+    return 2 - quarters
+
+
+@lru_cache(maxsize=32)
+def _outcome_tensor(max_goals: int, lines: tuple) -> np.ndarray:
+    """One-hot (2*max_goals+1, len(lines) * 5) table: goal diff -> outcome per line."""
+    diffs = np.arange(-max_goals, max_goals + 1)
+    codes = _outcome_codes(diffs[:, None] + np.asarray(lines)[None, :])
+    table = np.zeros((len(diffs), len(lines), len(OUTCOMES)))
+    d_idx, l_idx = np.indices(codes.shape)
+    table[d_idx, l_idx, codes] = 1.0
+    table.setflags(write=False)
+    return table.reshape(len(diffs), -1)
+
+
+def handicap_probabilities(goal_diff: np.ndarray, lines: Sequence[float] = AH_LINES) -> np.ndarray:
+    """
+    Outcome probabilities for a home bet on every line.
+
+    goal_diff: shape (2G+1,) or (N, 2G+1); goal_diff[..., k] = P(home - away = k - G).
+    Returns shape (len(lines), 5) or (N, len(lines), 5), columns ordered as OUTCOMES.
+    The away bet on the same line is the reversed outcome axis.
+    """
+    goal_diff = np.asarray(goal_diff, dtype=float)
+    max_goals = (goal_diff.shape[-1] - 1) // 2
+    lines = tuple(float(l) for l in lines)
+    flat = goal_diff @ _outcome_tensor(max_goals, lines)
+    return flat.reshape(goal_diff.shape[:-1] + (len(lines), len(OUTCOMES)))
+
+
+def fair_odds(probs: np.ndarray) -> np.ndarray:
+    """
+    Decimal odds with zero expected value for the home side, per line.
+
+    Solves (win + half_win/2) * (odds - 1) = loss + half_loss/2; pushes refund
+    the stake. For the away side pass probs[..., ::-1].
+    """
+    probs = np.asarray(probs, dtype=float)
+    gain = probs[..., 0] + 0.5 * probs[..., 1]
+    lose = probs[..., 4] + 0.5 * probs[..., 3]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(gain > 0, 1.0 + lose / gain, np.inf)
+
+
+def handicap_ladder(goal_diff: np.ndarray, lines: Sequence[float] = AH_LINES) -> List[Dict[str, Any]]:
+    """Per-line dicts (home perspective) with outcome probabilities and fair odds for one fixture."""
+    probs = handicap_probabilities(goal_diff, lines)
+    home_odds = fair_odds(probs)
+    away_odds = fair_odds(probs[:, ::-1])
+    ladder = []
+    for i, line in enumerate(lines):
+        row = {'line': float(line)}
+        row.update({name: float(p) for name, p in zip(OUTCOMES, probs[i])})
+        row['fair_odds_home'] = float(home_odds[i])
+        row['fair_odds_away'] = float(away_odds[i])
+        ladder.append(row)
+    return ladder
+
+
+def fair_line(ladder: List[Dict[str, Any]]) -> Optional[float]:
+    """Line where the home side is closest to an even-money bet."""
+    if not ladder:
+        return None
+    best = min(ladder, key=lambda r: abs(np.log(r['fair_odds_home'] / r['fair_odds_away'])))
+    return best['line']
+
+
+def settle_handicap(home_goals: int, away_goals: int, line: float, side: str = 'home') -> str:
+    """Outcome of a handicap bet (line applied to home goals) for 'home' or 'away'."""
+    code = int(_outcome_codes((home_goals - away_goals) + float(line)))
+    if side == 'away':
+        code = len(OUTCOMES) - 1 - code
+    return OUTCOMES[code]
@@ -8,24 +8,40 @@ Bot Discord có khả năng:
 Lệnh:
 - !lichdau: Hiển thị lịch thi đấu 7 ngày tới
 - !phantich <Đội A> vs <Đội B>: Phân tích trận đấu và đưa ra khuyến nghị
+- !mophong [số lần]: Mô phỏng Monte Carlo phần còn lại của mùa giải
 - !help: Hiển thị hướng dẫn sử dụng
+
+Vòng lặp nền tự động chốt kết quả các predictions đang chờ (~2 giờ sau giờ bóng lăn).
+Lịch thi đấu được đồng bộ dần vào fixtures.db (fixture_store.py); !lichdau và
+việc chốt kết quả đọc từ đó thay vì gọi API mỗi lần.
+Mọi bước blocking (HTTP, database, model) chạy qua offload.py, ngoài event loop.
 """
 
 import os
+import asyncio
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Optional, Dict, Any, List
 
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from dotenv import load_dotenv
 import requests
 
 # Import các module tự tạo
-from predictor import predict_match, predict_total_goals, predict_correct_score, predict_multiline_ou
+from predictor import predict_match, predict_total_goals, predict_correct_score, predict_multiline_ou, predict_asian_handicap, build_match_distribution, model_bundle_hash
 from data_collector import get_team_stats, get_odds_data
 from prediction_tracker import log_prediction, get_stats
 from ai_helper import generate_ai_insight
+from analysis_cache import TTLCache, make_analysis_key, bundle_hash, ANALYSIS_CACHE_SIZE, ANALYSIS_CACHE_TTL
+from asian_handicap import settle_handicap
+from season_simulator import simulate_season, parse_season_matches, settled_gameweek, N_SIMULATIONS
+from poisson_model import CACHE_PATH as POISSON_STRENGTHS_PATH, ONLINE_PATH as POISSON_ONLINE_PATH
+from settlement_scheduler import SettlementScheduler, retry_after_seconds
+import offload
+from admission import AdmissionGate, Busy, InFlight, RateLimited, RateLimits, PRIORITY_ANALYSIS, PRIORITY_BULK
+from fixture_store import get_fixture_store
+from team_names import canonical_team_name
 
 # Load environment variables
 load_dotenv()
@@ -89,6 +105,38 @@ PREMIER_LEAGUE_ID = 'PL'
 odds_cache: Dict[str, Dict[str, Any]] = {}
 CACHE_DURATION = 3600 * 3  # 3 giờ
 
+# Cache toàn bộ kết quả !phantich, key = (đội nhà, đội khách, phiên bản odds, hash model)
+analysis_cache = TTLCache(maxsize=ANALYSIS_CACHE_SIZE, ttl=ANALYSIS_CACHE_TTL)
+
+# Khoảng cách tối thiểu giữa hai lần sửa embed !phantich (Discord rate limit ~5 lần/5s)
+EMBED_EDIT_INTERVAL = 1.2
+
+# Admission control cho các pipeline nặng (!phantich, !mophong): giới hạn song song,
+# hàng đợi có priority, rate limit theo user/guild và gộp yêu cầu trùng trận
+analysis_gate = AdmissionGate()
+analysis_rate_limits = RateLimits()
+analysis_inflight = InFlight()
+
+# Cache mô phỏng mùa giải, key = (vòng đấu đã chốt, hash strengths, số lần mô phỏng)
+season_cache = TTLCache(maxsize=4, ttl=7 * 24 * 3600)
+MAX_SIMULATIONS = 200_000
+
+# Tự động chốt kết quả: chu kỳ kiểm tra (phút) và kênh đăng tóm tắt (tùy chọn)
+SETTLEMENT_TICK_MINUTES = 10
+SETTLEMENT_CHANNEL_ID = os.getenv('SETTLEMENT_CHANNEL_ID')
+settlement_scheduler = SettlementScheduler()
+# Chỉ dùng phần backoff khi Football-Data báo lỗi / hết quota
+fixture_sync_scheduler = SettlementScheduler()
+
+# Nhãn kết quả kèo chấp (góc nhìn cửa đã chọn)
+_HANDICAP_OUTCOME_LABELS = {
+    'win': '✅ Thắng',
+    'half_win': '✅ Thắng nửa',
+    'push': '🟡 Hòa kèo',
+    'half_loss': '❌ Thua nửa',
+    'loss': '❌ Thua',
+}
+
 # Khởi tạo bot
 intents = discord.Intents.default()
 intents.message_content = True
@@ -107,6 +155,117 @@ async def on_ready():
             name="Ngoại Hạng Anh ⚽"
         )
     )
+    if FOOTBALL_DATA_API_KEY and not fixture_sync_loop.is_running():
+        fixture_sync_loop.start()
+    if FOOTBALL_DATA_API_KEY and not settlement_loop.is_running():
+        settlement_loop.start()
+
+
+@bot.before_invoke
+async def _start_command_deadline(ctx: commands.Context):
+    """Deadline cho các bước offload của lệnh (tính từ lúc interaction được tạo nếu có)"""
+    interaction = getattr(ctx, 'interaction', None)
+    offload.start_deadline(started_at=interaction.created_at.timestamp() if interaction is not None else None)
+
+
+@tasks.loop(minutes=SETTLEMENT_TICK_MINUTES)
+async def fixture_sync_loop():
+    """
+    Đồng bộ lịch thi đấu vào fixtures.db: cả mùa mỗi ngày, 7 ngày tới mỗi 6 giờ,
+    các ngày có trận đang đá mỗi tick - chỉ gọi API cho khoảng ngày tới hạn.
+    """
+    now = datetime.now(timezone.utc)
+    if fixture_sync_scheduler.backoff_until is not None and now < fixture_sync_scheduler.backoff_until:
+        return
+    try:
+        await offload.run_io(get_fixture_store().sync, FOOTBALL_DATA_API_KEY, now, stage='fixture_sync')
+        fixture_sync_scheduler.record_success(now)
+    except (requests.exceptions.RequestException, offload.StageTimeout) as e:
+        wait = fixture_sync_scheduler.record_failure(now, retry_after_seconds(e))
+        logger.warning(f'Đồng bộ lịch thi đấu: lỗi API ({e}), thử lại sau {wait}')
+    except Exception as e:
+        logger.error(f'Lỗi trong vòng lặp đồng bộ lịch thi đấu: {e}', exc_info=True)
+
+
+@fixture_sync_loop.before_loop
+async def _before_fixture_sync_loop():
+    await bot.wait_until_ready()
+
+
+def _finished_matches(days_back: int) -> List[Dict[str, Any]]:
+    """Trận đã kết thúc: từ fixtures.db nếu đã đồng bộ, nếu không thì gọi API"""
+    from prediction_tracker import fetch_finished_matches
+    store = get_fixture_store()
+    if store.is_fresh():
+        return store.finished(days_back)
+    return fetch_finished_matches(FOOTBALL_DATA_API_KEY, days_back)
+
+
+@tasks.loop(minutes=SETTLEMENT_TICK_MINUTES)
+async def settlement_loop():
+    """
+    Tự động chốt kết quả các predictions đang chờ.
+    Chỉ gọi API khi tới lịch (kickoff + ~2 giờ), backoff khi provider báo lỗi / hết quota;
+    HTTP và ghi database chạy ngoài event loop.
+    """
+    from prediction_tracker import pending_kickoffs, settle_from_matches
+    try:
+        now = datetime.now(timezone.utc)
+        kickoffs, has_unknown = await offload.run_io(pending_kickoffs, stage='store')
+        if not settlement_scheduler.is_due(now, kickoffs, has_unknown):
+            return
+        
+        try:
+            matches = await offload.run_io(_finished_matches, settlement_scheduler.lookback_days,
+                                           stage='football_data')
+        except (requests.exceptions.RequestException, offload.StageTimeout) as e:
+            wait = settlement_scheduler.record_failure(now, retry_after_seconds(e))
+            logger.warning(f'Tự động chốt kết quả: lỗi API ({e}), thử lại sau {wait}')
+            return
+        settlement_scheduler.record_success(now)
+        
+        settled = await offload.run_io(settle_from_matches, matches, stage='settle')
+        if settled:
+            logger.info(f'Tự động chốt {len(settled)} kết quả')
+            await _post_settlement_summary(settled)
+    except Exception as e:
+        logger.error(f'Lỗi trong vòng lặp chốt kết quả: {e}', exc_info=True)
+
+
+@settlement_loop.before_loop
+async def _before_settlement_loop():
+    await bot.wait_until_ready()
+
+
+async def _post_settlement_summary(settled: List[Dict[str, Any]]) -> None:
+    """Đăng tóm tắt các kết quả vừa chốt lên SETTLEMENT_CHANNEL_ID (nếu được cấu hình)"""
+    if not SETTLEMENT_CHANNEL_ID:
+        return
+    channel = bot.get_channel(int(SETTLEMENT_CHANNEL_ID))
+    if channel is None:
+        logger.warning(f'Không tìm thấy kênh SETTLEMENT_CHANNEL_ID={SETTLEMENT_CHANNEL_ID}')
+        return
+    
+    lines = []
+    for p in settled[:10]:
+        label = _HANDICAP_OUTCOME_LABELS.get(p.get('handicap_outcome'), '•')
+        lines.append(f"{label} {p['home_team']} {p.get('home_goals')}-{p.get('away_goals')} {p['away_team']}")
+    if len(settled) > 10:
+        lines.append(f'... và {len(settled) - 10} trận khác')
+    
+    embed = discord.Embed(
+        title='🏁 Đã Chốt Kết Quả',
+        description='\n'.join(lines),
+        color=discord.Color.green()
+    )
+    stats = await offload.run_io(get_stats, stage='store')
+    if stats and stats.get('completed_predictions', 0) > 0:
+        embed.add_field(
+            name='Độ chính xác hiện tại',
+            value=f"{stats['accuracy']:.1%} ({stats['correct_predictions']}/{stats['graded_predictions']})",
+            inline=False
+        )
+    await channel.send(embed=embed)
 
 
 def get_football_data(endpoint: str, params: Optional[Dict] = None) -> Optional[Dict]:
@@ -143,17 +302,24 @@ async def schedule(ctx: commands.Context):
     date_from = datetime.now().strftime('%Y-%m-%d')
     date_to = (datetime.now() + timedelta(days=7)).strftime('%Y-%m-%d')
     
-    # Gọi API
-    data = get_football_data(
-        f'/competitions/{PREMIER_LEAGUE_ID}/matches',
-        params={'dateFrom': date_from, 'dateTo': date_to}
-    )
-    
-    if not data or 'matches' not in data:
-        await ctx.send('❌ Không thể lấy lịch thi đấu. Vui lòng thử lại sau.')
-        return
-    
-    matches = data['matches']
+    # Đọc từ fixtures.db; chỉ gọi API khi store chưa được đồng bộ
+    store = get_fixture_store()
+    if await offload.run_io(store.is_fresh, stage='store'):
+        matches = await offload.run_io(store.upcoming, days=7, stage='store')
+    else:
+        data = await offload.run_io(
+            get_football_data,
+            f'/competitions/{PREMIER_LEAGUE_ID}/matches',
+            params={'dateFrom': date_from, 'dateTo': date_to},
+            stage='football_data'
+        )
+        
+        if not data or 'matches' not in data:
+            await ctx.send('❌ Không thể lấy lịch thi đấu. Vui lòng thử lại sau.')
+            return
+        
+        matches = data['matches']
+        await offload.run_io(store.upsert, matches, stage='store')
     
     if not matches:
         await ctx.send('📅 Không có trận đấu nào trong 7 ngày tới.')
@@ -204,6 +370,430 @@ async def schedule(ctx: commands.Context):
     await ctx.send(embed=embed)
 
 
+def _get_odds_cached(home_team: str, away_team: str) -> Optional[Dict[str, Any]]:
+    """Lấy dữ liệu kèo từ The Odds API (với cache 3 giờ)"""
+    cache_key = f"{home_team}_vs_{away_team}"
+    current_time = datetime.now().timestamp()
+    
+    if cache_key in odds_cache and (current_time - odds_cache[cache_key]['timestamp']) < CACHE_DURATION:
+        logger.info(f'Sử dụng cache cho kèo: {cache_key}')
+        return odds_cache[cache_key]['data']
+    
+    odds_data = get_odds_data(home_team, away_team, ODDS_API_KEY)
+    if odds_data:
+        odds_cache[cache_key] = {
+            'data': odds_data,
+            'timestamp': current_time
+        }
+    return odds_data
+
+
+def _stage_stats(home_team: str, away_team: str) -> Optional[tuple]:
+    """Giai đoạn 1: lấy dữ liệu thống kê từ Football-Data.org"""
+    home_stats = get_team_stats(home_team, FOOTBALL_DATA_API_KEY)
+    away_stats = get_team_stats(away_team, FOOTBALL_DATA_API_KEY)
+    if not home_stats or not away_stats:
+        return None
+    return home_stats, away_stats
+
+
+def _stage_markets(home_stats: Dict[str, Any], away_stats: Dict[str, Any],
+                   odds_data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Giai đoạn 3: tổng bàn, O/U đa mốc, tỉ số và bảng kèo chấp từ cùng một phân phối Poisson"""
+    goals_result = predict_total_goals(home_stats, away_stats, odds_data)
+    cached_goals = goals_result.get('predicted_goals') if goals_result else None
+    distribution = build_match_distribution(home_stats, away_stats, odds_data, predicted_goals=cached_goals)
+    return {
+        'goals_result': goals_result,
+        'multiline_ou': predict_multiline_ou(home_stats, away_stats, odds_data, distribution=distribution),
+        'correct_score': predict_correct_score(home_stats, away_stats, distribution=distribution),
+        'handicap_ladder': predict_asian_handicap(home_stats, away_stats, odds_data, distribution=distribution),
+    }
+
+
+def _stage_ai(home_team: str, away_team: str, home_stats: Dict[str, Any], away_stats: Dict[str, Any],
+              analysis: Dict[str, Any]) -> Optional[str]:
+    """Giai đoạn 4: AI narrative (optional, chậm nhất nên chạy cuối)"""
+    prediction_result = analysis['prediction_result']
+    goals_result = analysis['goals_result']
+    correct_score = analysis['correct_score']
+    if not (prediction_result and analysis['multiline_ou']):
+        return None
+    try:
+        return generate_ai_insight(
+            home_team, away_team,
+            home_stats, away_stats,
+            prediction_result['recommendation'], prediction_result['confidence'],
+            ou_text=goals_result['over_under_recommendation'] if goals_result else None,
+            ou_conf=goals_result['ou_confidence'] if goals_result else None,
+            correct_score=correct_score['best_correct_score'] if correct_score else None
+        )
+    except Exception as e:
+        logger.debug(f'AI insight failed: {e}')
+        return None
+
+
+def _empty_analysis() -> Dict[str, Any]:
+    return {
+        'prediction_result': None,
+        'goals_result': None,
+        'multiline_ou': None,
+        'correct_score': None,
+        'handicap_ladder': None,
+        'ai_text': None,
+    }
+
+
+def run_analysis(home_team: str, away_team: str,
+                 odds_data: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Chạy toàn bộ pipeline phân tích: stats -> kèo chấp -> tổng bàn/O/U -> tỉ số -> AI.
+    
+    Returns:
+        Dict kết quả (có thể cache) hoặc None nếu không lấy được stats
+    """
+    stats = _stage_stats(home_team, away_team)
+    if stats is None:
+        return None
+    home_stats, away_stats = stats
+    analysis = _empty_analysis()
+    analysis['prediction_result'] = predict_match(home_stats, away_stats, odds_data)
+    analysis.update(_stage_markets(home_stats, away_stats, odds_data))
+    analysis['ai_text'] = _stage_ai(home_team, away_team, home_stats, away_stats, analysis)
+    return analysis
+
+
+class ThrottledEmbedEditor:
+    """
+    Sửa một message embed theo từng giai đoạn nhưng không quá một lần mỗi
+    `min_interval` giây (tránh rate limit của Discord). Bản cập nhật bị
+    hoãn sẽ được gửi sau; bản mới hơn thay thế bản đang chờ.
+    """
+
+    def __init__(self, message: discord.Message, min_interval: float = EMBED_EDIT_INTERVAL):
+        self.message = message
+        self.min_interval = min_interval
+        self._last_edit = 0.0
+        self._pending: Optional[discord.Embed] = None
+        self._timer: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    async def update(self, embed: discord.Embed, final: bool = False) -> None:
+        self._pending = embed
+        wait = self._last_edit + self.min_interval - asyncio.get_running_loop().time()
+        if wait <= 0:
+            await self._flush()
+        elif final:
+            if self._timer:
+                self._timer.cancel()
+            await asyncio.sleep(wait)
+            await self._flush()
+        elif self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._delayed_flush(wait))
+
+    async def _delayed_flush(self, wait: float) -> None:
+        await asyncio.sleep(wait)
+        await self._flush()
+
+    async def _flush(self) -> None:
+        async with self._lock:
+            embed, self._pending = self._pending, None
+            if embed is None:
+                return
+            await self.message.edit(embed=embed)
+            self._last_edit = asyncio.get_running_loop().time()
+
+
+def _progress_embed(home_team: str, away_team: str, odds_data: Optional[Dict[str, Any]],
+                    step: str) -> discord.Embed:
+    """Embed tạm trong lúc chờ dự đoán kèo chấp"""
+    embed = discord.Embed(
+        title='🔮 Đang phân tích...',
+        description=f'**{home_team}** ⚔️ **{away_team}**',
+        color=discord.Color.blue()
+    )
+    if odds_data and 'asian_handicap' in odds_data:
+        embed.add_field(name='📊 Kèo Chấp Châu Á', value=f"```{odds_data['asian_handicap']}```", inline=False)
+    embed.add_field(name='⏳ Tiến trình', value=step, inline=False)
+    return embed
+
+
+def _log_analysis(home_team: str, away_team: str, analysis: Dict[str, Any],
+                  odds_data: Optional[Dict[str, Any]]) -> None:
+    """Log prediction for tracking"""
+    prediction_result = analysis['prediction_result']
+    goals_result = analysis['goals_result']
+    if not prediction_result:
+        return
+    try:
+        # Parse OU pick if available
+        ou_line = 2.5
+        ou_pick = None
+        ou_conf = None
+        predicted_goals = None
+        if goals_result:
+            predicted_goals = goals_result.get('predicted_goals')
+            ou_text = goals_result.get('over_under_recommendation', '')
+            ou_conf = goals_result.get('ou_confidence')
+            if 'Over 2.5' in ou_text:
+                ou_pick = 'Over'
+            elif 'Under 2.5' in ou_text:
+                ou_pick = 'Under'
+
+        log_prediction(
+            home_team=home_team,
+            away_team=away_team,
+            prediction=prediction_result['prediction'],
+            confidence=prediction_result['confidence'],
+            handicap_value=odds_data.get('handicap_value', 0) if odds_data else 0,
+            odds_data=odds_data,
+            ou_line=ou_line,
+            ou_pick=ou_pick,
+            ou_confidence=ou_conf,
+            predicted_goals=predicted_goals,
+        )
+    except Exception as e:
+        logger.warning(f'Could not log prediction: {e}')
+
+
+def _format_handicap_ladder(handicap_ladder: Dict[str, Any], width: int = 4) -> str:
+    """Bảng các mốc kèo quanh mốc nhà cái (hoặc kèo công bằng), góc nhìn đội nhà"""
+    center = handicap_ladder.get('market_line')
+    if center is None:
+        center = handicap_ladder['fair_line']
+    rows = [r for r in handicap_ladder['ladder'] if abs(r['line'] - center) <= width * 0.25 + 1e-9]
+    table = "```\n"
+    table += "Kèo   | Thắng | +½   | Hòa  | -½   | Thua  | Odds\n"
+    table += "------+-------+------+------+------+-------+-----\n"
+    for r in rows:
+        mark = '*' if r['line'] == handicap_ladder.get('market_line') else ' '
+        table += (f"{r['line']:+5.2f}{mark}| {r['win']*100:4.1f}% |{r['half_win']*100:4.1f}% |"
+                  f"{r['push']*100:4.1f}% |{r['half_loss']*100:4.1f}% | {r['loss']*100:4.1f}% | {min(r['fair_odds_home'], 99):.2f}\n")
+    table += "```"
+    return table
+
+
+def build_analysis_embed(home_team: str, away_team: str, analysis: Dict[str, Any],
+                         odds_data: Optional[Dict[str, Any]], pending: Optional[str] = None) -> discord.Embed:
+    """Tạo embed kết quả từ dict phân tích (pending: mô tả các phần còn đang tính)"""
+    prediction_result = analysis['prediction_result']
+    goals_result = analysis['goals_result']
+    multiline_ou = analysis['multiline_ou']
+    correct_score = analysis['correct_score']
+    handicap_ladder = analysis.get('handicap_ladder')
+    ai_text = analysis['ai_text']
+    
+    result_embed = discord.Embed(
+        title='🔮 Phân Tích Trận Đấu',
+        description=f'**{home_team}** ⚔️ **{away_team}**',
+        color=discord.Color.gold()
+    )
+    
+    # Thông tin kèo
+    if odds_data and 'asian_handicap' in odds_data:
+        result_embed.add_field(
+            name='📊 Kèo Chấp Châu Á',
+            value=f"```{odds_data['asian_handicap']}```",
+            inline=False
+        )
+    
+    # Khuyến nghị
+    recommendation = prediction_result['recommendation']
+    confidence = prediction_result['confidence']
+    
+    # Icon theo độ tin cậy
+    if confidence >= 0.7:
+        confidence_icon = '🟢'
+    elif confidence >= 0.55:
+        confidence_icon = '🟡'
+    else:
+        confidence_icon = '🟠'
+    
+    # Clamp confidence hiển thị để tránh overconfidence nếu model bias
+    display_conf = min(confidence, 0.92)
+    recommendation_display = recommendation + (" (mock odds)" if (odds_data and odds_data.get('source') == 'mock') else "")
+    result_embed.add_field(
+        name='💡 Khuyến Nghị',
+        value=f"```{recommendation_display}```",
+        inline=False
+    )
+    
+    result_embed.add_field(
+        name=f'{confidence_icon} Độ Tin Cậy',
+        value=f"```{display_conf:.1%}```",
+        inline=True
+    )
+    
+    # Dự đoán tổng bàn thắng với multi-line O/U
+    if goals_result:
+        ou_recommendation = goals_result['over_under_recommendation']
+        ou_confidence = goals_result['ou_confidence']
+    
+        # Icon theo độ tin cậy O/U
+        if ou_confidence >= 0.65:
+            ou_icon = '🟢'
+        elif ou_confidence >= 0.5:
+            ou_icon = '🟡'
+        else:
+            ou_icon = '🟠'
+    
+        result_embed.add_field(
+            name='⚽ Dự Đoán Tổng Bàn Thắng',
+            value=f"```{ou_recommendation}```",
+            inline=False
+        )
+    
+        result_embed.add_field(
+            name=f'{ou_icon} Độ Tin Cậy O/U 2.5',
+            value=f"```{ou_confidence:.1%}```",
+            inline=True
+        )
+        
+    # Bảng O/U đa mốc
+    if multiline_ou:
+        ou_table = "```\n"
+        ou_table += "Mốc  | Over    | Under   | Gợi ý\n"
+        ou_table += "-----+---------+---------+-------\n"
+        for line in ['1.5', '2.5', '3.5']:
+            data = multiline_ou.get(line, {})
+            over_p = data.get('over_prob', 0) * 100
+            under_p = data.get('under_prob', 0) * 100
+            rec = data.get('recommendation', '-')
+            ou_table += f"{line:4s} | {over_p:5.1f}% | {under_p:5.1f}% | {rec}\n"
+        ou_table += "```"
+        result_embed.add_field(
+            name='📊 Phân Tích O/U Đa Mốc',
+            value=ou_table,
+            inline=False
+        )
+
+        # Tỉ số chính xác (Poisson)
+        if correct_score:
+            best = correct_score['best_correct_score']
+            best_p = correct_score['best_correct_score_prob']
+            top_lines = "\n".join([f"{s}: {p*100:.1f}%" for s,p in correct_score['top_scorelines']])
+            result_embed.add_field(
+                name='🎯 Dự Đoán Tỉ Số (Poisson)',
+                value=f"```Gợi ý: {best} ({best_p*100:.1f}%)\nTop 5:\n{top_lines}```",
+                inline=False
+            )
+
+        # Bảng kèo chấp quanh mốc nhà cái
+        if handicap_ladder:
+            result_embed.add_field(
+                name=f"📐 Bảng Kèo Chấp (Poisson) - kèo công bằng {handicap_ladder['fair_line']:+g}",
+                value=_format_handicap_ladder(handicap_ladder),
+                inline=False
+            )
+
+        # AI narrative (optional)
+        if ai_text:
+            result_embed.add_field(
+                name='🧠 AI Phân Tích',
+                value=ai_text[:1000],  # Discord field limit safety
+                inline=False
+            )
+    
+    # Thêm thống kê nếu có
+    if 'stats_summary' in prediction_result:
+        stats = prediction_result['stats_summary']
+        result_embed.add_field(
+            name='📈 Thống Kê',
+            value=stats,
+            inline=False
+        )
+    
+    if pending:
+        result_embed.add_field(
+            name='⏳ Đang xử lý',
+            value=pending,
+            inline=False
+        )
+    
+    # Disclaimer
+    result_embed.set_footer(
+        text='⚠️ Dự đoán chỉ mang tính tham khảo dựa trên thống kê, không phải lời khuyên đầu tư. '
+             'Vui lòng cân nhắc kỹ trước khi đưa ra quyết định.'
+    )
+    return result_embed
+
+
+async def _analysis_pipeline(editor: 'ThrottledEmbedEditor', home_team: str,
+                             away_team: str) -> Optional[tuple]:
+    """
+    Chạy (hoặc lấy từ cache) phân tích một trận, cập nhật embed theo từng giai đoạn.
+    
+    Returns:
+        (analysis, odds_data), hoặc None nếu đã báo lỗi cho người dùng
+    """
+    # Lấy dữ liệu kèo trước: snapshot odds là một phần của cache key
+    odds_data = await offload.run_io(_get_odds_cached, home_team, away_team, stage='odds')
+    
+    if not odds_data:
+        await editor.update(discord.Embed(
+            title='⚠️ Cảnh báo',
+            description='Không thể lấy dữ liệu kèo cược. Tiếp tục phân tích với dữ liệu thống kê...',
+            color=discord.Color.orange()
+        ))
+    
+    model_hash = await offload.run_io(model_bundle_hash, stage='artifacts')
+    cache_key = make_analysis_key(home_team, away_team, odds_data, model_hash)
+    analysis = analysis_cache.get(cache_key)
+    if analysis is not None:
+        logger.info(f'Sử dụng cache phân tích: {cache_key}')
+        _log_analysis(home_team, away_team, analysis, odds_data)
+        await editor.update(build_analysis_embed(home_team, away_team, analysis, odds_data), final=True)
+        return analysis, odds_data
+    
+    # Phân tích theo giai đoạn, cập nhật embed sau mỗi giai đoạn (có throttle).
+    # Giai đoạn 1: thống kê
+    stats = await offload.run_io(_stage_stats, home_team, away_team, stage='stats')
+    if stats is None:
+        await editor.update(discord.Embed(
+            title='❌ Lỗi',
+            description='Không thể tìm thấy dữ liệu cho một hoặc cả hai đội. Vui lòng kiểm tra tên đội.',
+            color=discord.Color.red()
+        ), final=True)
+        return None
+    home_stats, away_stats = stats
+    await editor.update(_progress_embed(home_team, away_team, odds_data,
+                                        '✅ Thống kê & kèo\n⏳ Dự đoán kèo chấp...'))
+    
+    # Giai đoạn 2: dự đoán kèo chấp (model)
+    analysis = _empty_analysis()
+    analysis['prediction_result'] = await offload.run_cpu(predict_match, home_stats, away_stats, odds_data,
+                                                          stage='predict')
+    if not analysis['prediction_result']:
+        await editor.update(discord.Embed(
+            title='❌ Lỗi',
+            description='Không thể thực hiện dự đoán. Model có thể chưa được huấn luyện.',
+            color=discord.Color.red()
+        ), final=True)
+        return None
+    await editor.update(build_analysis_embed(home_team, away_team, analysis, odds_data,
+                                             pending='Đang tính tổng bàn, O/U và tỉ số...'))
+    
+    # Giai đoạn 3: tổng bàn, O/U, tỉ số, bảng kèo chấp
+    analysis.update(await offload.run_cpu(_stage_markets, home_stats, away_stats, odds_data, stage='markets'))
+    ai_pending = 'Đang viết phân tích AI...' if os.getenv('GOOGLE_API_KEY') else None
+    await editor.update(build_analysis_embed(home_team, away_team, analysis, odds_data, pending=ai_pending),
+                        final=ai_pending is None)
+    
+    # Giai đoạn 4: AI narrative (chậm nhất)
+    if ai_pending:
+        try:
+            analysis['ai_text'] = await offload.run_io(_stage_ai, home_team, away_team, home_stats, away_stats,
+                                                       analysis, stage='ai')
+        except offload.StageTimeout as e:
+            # AI là tùy chọn: quá hạn thì trả kết quả không có phần AI
+            logger.warning(f'Bỏ qua AI insight: {e}')
+        await editor.update(build_analysis_embed(home_team, away_team, analysis, odds_data), final=True)
+    
+    analysis_cache.set(cache_key, analysis)
+    _log_analysis(home_team, away_team, analysis, odds_data)
+    return analysis, odds_data
+
+
 @bot.command(name='phantich')
 async def analyze(ctx: commands.Context, *, match_input: str):
     """
@@ -212,8 +802,6 @@ async def analyze(ctx: commands.Context, *, match_input: str):
     
     Ví dụ: !phantich Arsenal vs Manchester United
     """
-    await ctx.typing()
-    
     # Parse input
     if ' vs ' not in match_input.lower():
         await ctx.send('❌ Định dạng không đúng. Sử dụng: `!phantich <Đội A> vs <Đội B>`')
@@ -227,6 +815,15 @@ async def analyze(ctx: commands.Context, *, match_input: str):
     home_team = teams[0].strip()
     away_team = teams[1].strip()
     
+    try:
+        analysis_rate_limits.admit(user=ctx.author.id, guild=ctx.guild.id if ctx.guild else None)
+    except RateLimited as e:
+        who = 'Server này' if e.scope == 'guild' else 'Bạn'
+        await ctx.send(f'⏳ {who} đang gửi quá nhiều yêu cầu phân tích. Thử lại sau {e.retry_after:.0f} giây.')
+        return
+    
+    await ctx.typing()
+    
     # Tạo embed loading
     loading_embed = discord.Embed(
         title='🔮 Đang phân tích...',
@@ -234,235 +831,58 @@ async def analyze(ctx: commands.Context, *, match_input: str):
         color=discord.Color.blue()
     )
     loading_msg = await ctx.send(embed=loading_embed)
+    editor = ThrottledEmbedEditor(loading_msg)
+    
+    # Cùng một trận đang được phân tích -> chờ chung kết quả thay vì chạy lại pipeline
+    fixture_key = (canonical_team_name(home_team), canonical_team_name(away_team))
+    leader, shared = analysis_inflight.claim(fixture_key)
     
     try:
-        # Bước 1: Lấy dữ liệu thống kê từ Football-Data.org
-        home_stats = get_team_stats(home_team, FOOTBALL_DATA_API_KEY)
-        away_stats = get_team_stats(away_team, FOOTBALL_DATA_API_KEY)
-        
-        if not home_stats or not away_stats:
-            await loading_msg.edit(embed=discord.Embed(
-                title='❌ Lỗi',
-                description='Không thể tìm thấy dữ liệu cho một hoặc cả hai đội. Vui lòng kiểm tra tên đội.',
-                color=discord.Color.red()
-            ))
+        if not leader:
+            await editor.update(_progress_embed(home_team, away_team, None,
+                                                '⏳ Trận này đang được phân tích cho người khác, chờ kết quả...'))
+            result = await InFlight.join(shared)
+            if result is None:
+                await editor.update(discord.Embed(
+                    title='❌ Lỗi',
+                    description='Không thể phân tích trận này. Vui lòng kiểm tra tên đội.',
+                    color=discord.Color.red()
+                ), final=True)
+                return
+            analysis, odds_data = result
+            _log_analysis(home_team, away_team, analysis, odds_data)
+            await editor.update(build_analysis_embed(home_team, away_team, analysis, odds_data), final=True)
             return
         
-        # Bước 2: Lấy dữ liệu kèo từ The Odds API (với cache)
-        cache_key = f"{home_team}_vs_{away_team}"
-        current_time = datetime.now().timestamp()
-        
-        if cache_key in odds_cache and (current_time - odds_cache[cache_key]['timestamp']) < CACHE_DURATION:
-            odds_data = odds_cache[cache_key]['data']
-            logger.info(f'Sử dụng cache cho kèo: {cache_key}')
-        else:
-            odds_data = get_odds_data(home_team, away_team, ODDS_API_KEY)
-            if odds_data:
-                odds_cache[cache_key] = {
-                    'data': odds_data,
-                    'timestamp': current_time
-                }
-        
-        if not odds_data:
-            await loading_msg.edit(embed=discord.Embed(
-                title='⚠️ Cảnh báo',
-                description='Không thể lấy dữ liệu kèo cược. Tiếp tục phân tích với dữ liệu thống kê...',
-                color=discord.Color.orange()
-            ))
-        
-        # Bước 3: Dự đoán bằng model
-        prediction_result = predict_match(home_stats, away_stats, odds_data)
-        
-        # Bước 3.5: Dự đoán tổng bàn thắng (có cache sử dụng ở predictor)
-        goals_result = predict_total_goals(home_stats, away_stats, odds_data)
-        cached_goals = goals_result.get('predicted_goals') if goals_result else None
-        
-        # Bước 3.6: Dự đoán multi-line O/U (1.5, 2.5, 3.5)
-        multiline_ou = predict_multiline_ou(home_stats, away_stats, odds_data, predicted_goals=cached_goals)
-
-        # Bước 3.7: Dự đoán tỉ số chính xác (Poisson)
-        correct_score = predict_correct_score(home_stats, away_stats, predicted_goals=cached_goals)
-        
-        # Log prediction for tracking
-        if prediction_result:
-            try:
-                # Parse OU pick if available
-                ou_line = 2.5
-                ou_pick = None
-                ou_conf = None
-                predicted_goals = None
-                if goals_result:
-                    predicted_goals = goals_result.get('predicted_goals')
-                    ou_text = goals_result.get('over_under_recommendation', '')
-                    ou_conf = goals_result.get('ou_confidence')
-                    if 'Over 2.5' in ou_text:
-                        ou_pick = 'Over'
-                    elif 'Under 2.5' in ou_text:
-                        ou_pick = 'Under'
-
-                log_prediction(
-                    home_team=home_team,
-                    away_team=away_team,
-                    prediction=prediction_result['prediction'],
-                    confidence=prediction_result['confidence'],
-                    handicap_value=odds_data.get('handicap_value', 0) if odds_data else 0,
-                    odds_data=odds_data,
-                    ou_line=ou_line,
-                    ou_pick=ou_pick,
-                    ou_confidence=ou_conf,
-                    predicted_goals=predicted_goals,
-                )
-            except Exception as e:
-                logger.warning(f'Could not log prediction: {e}')
-        
-        if not prediction_result:
-            await loading_msg.edit(embed=discord.Embed(
-                title='❌ Lỗi',
-                description='Không thể thực hiện dự đoán. Model có thể chưa được huấn luyện.',
-                color=discord.Color.red()
-            ))
-            return
-        
-        # Bước 4: Tạo embed kết quả
-        result_embed = discord.Embed(
-            title='🔮 Phân Tích Trận Đấu',
-            description=f'**{home_team}** ⚔️ **{away_team}**',
-            color=discord.Color.gold()
-        )
-        
-        # Thông tin kèo
-        if odds_data and 'asian_handicap' in odds_data:
-            result_embed.add_field(
-                name='📊 Kèo Chấp Châu Á',
-                value=f"```{odds_data['asian_handicap']}```",
-                inline=False
-            )
-        
-        # Khuyến nghị
-        recommendation = prediction_result['recommendation']
-        confidence = prediction_result['confidence']
-        
-        # Icon theo độ tin cậy
-        if confidence >= 0.7:
-            confidence_icon = '🟢'
-        elif confidence >= 0.55:
-            confidence_icon = '🟡'
-        else:
-            confidence_icon = '🟠'
-        
-        # Clamp confidence hiển thị để tránh overconfidence nếu model bias
-        display_conf = min(confidence, 0.92)
-        recommendation_display = recommendation + (" (mock odds)" if (odds_data and odds_data.get('source') == 'mock') else "")
-        result_embed.add_field(
-            name='💡 Khuyến Nghị',
-            value=f"```{recommendation_display}```",
-            inline=False
-        )
-        
-        result_embed.add_field(
-            name=f'{confidence_icon} Độ Tin Cậy',
-            value=f"```{display_conf:.1%}```",
-            inline=True
-        )
-        
-        # Dự đoán tổng bàn thắng với multi-line O/U
-        if goals_result:
-            predicted_goals = goals_result['predicted_goals']
-            ou_recommendation = goals_result['over_under_recommendation']
-            ou_confidence = goals_result['ou_confidence']
-        
-            # Icon theo độ tin cậy O/U
-            if ou_confidence >= 0.65:
-                ou_icon = '🟢'
-            elif ou_confidence >= 0.5:
-                ou_icon = '🟡'
-            else:
-                ou_icon = '🟠'
-        
-            result_embed.add_field(
-                name='⚽ Dự Đoán Tổng Bàn Thắng',
-                value=f"```{ou_recommendation}```",
-                inline=False
-            )
-        
-            result_embed.add_field(
-                name=f'{ou_icon} Độ Tin Cậy O/U 2.5',
-                value=f"```{ou_confidence:.1%}```",
-                inline=True
-            )
-            
-        # Bảng O/U đa mốc
-        if multiline_ou:
-            ou_table = "```\n"
-            ou_table += "Mốc  | Over    | Under   | Gợi ý\n"
-            ou_table += "-----+---------+---------+-------\n"
-            for line in ['1.5', '2.5', '3.5']:
-                data = multiline_ou.get(line, {})
-                over_p = data.get('over_prob', 0) * 100
-                under_p = data.get('under_prob', 0) * 100
-                rec = data.get('recommendation', '-')
-                ou_table += f"{line:4s} | {over_p:5.1f}% | {under_p:5.1f}% | {rec}\n"
-            ou_table += "```"
-            result_embed.add_field(
-                name='📊 Phân Tích O/U Đa Mốc',
-                value=ou_table,
-                inline=False
-            )
-
-            # Tỉ số chính xác (Poisson)
-            if correct_score:
-                best = correct_score['best_correct_score']
-                best_p = correct_score['best_correct_score_prob']
-                top_lines = "\n".join([f"{s}: {p*100:.1f}%" for s,p in correct_score['top_scorelines']])
-                result_embed.add_field(
-                    name='🎯 Dự Đoán Tỉ Số (Poisson)',
-                    value=f"```Gợi ý: {best} ({best_p*100:.1f}%)\nTop 5:\n{top_lines}```",
-                    inline=False
-                )
-
-            # AI narrative (optional)
-            try:
-                ai_text = generate_ai_insight(
-                    home_team, away_team,
-                    home_stats, away_stats,
-                    recommendation, confidence,
-                    ou_text=ou_recommendation if goals_result else None,
-                    ou_conf=ou_confidence if goals_result else None,
-                    correct_score=best if correct_score else None
-                )
-                if ai_text:
-                    result_embed.add_field(
-                        name='🧠 AI Phân Tích',
-                        value=ai_text[:1000],  # Discord field limit safety
-                        inline=False
-                    )
-            except Exception as e:
-                logger.debug(f'AI insight failed: {e}')
-        
-        # Thêm thống kê nếu có
-        if 'stats_summary' in prediction_result:
-            stats = prediction_result['stats_summary']
-            result_embed.add_field(
-                name='📈 Thống Kê',
-                value=stats,
-                inline=False
-            )
-        
-        # Disclaimer
-        result_embed.set_footer(
-            text='⚠️ Dự đoán chỉ mang tính tham khảo dựa trên thống kê, không phải lời khuyên đầu tư. '
-                 'Vui lòng cân nhắc kỹ trước khi đưa ra quyết định.'
-        )
-        
-        await loading_msg.edit(embed=result_embed)
-        
+        try:
+            if analysis_gate.would_wait():
+                await editor.update(_progress_embed(
+                    home_team, away_team, None,
+                    f'⏳ Đang xếp hàng ({analysis_gate.running} đang chạy, {analysis_gate.queued} đang chờ)...'))
+            async with analysis_gate.slot(PRIORITY_ANALYSIS):
+                result = await _analysis_pipeline(editor, home_team, away_team)
+        except asyncio.CancelledError:
+            analysis_inflight.resolve(fixture_key, error=Busy('analysis cancelled'))
+            raise
+        except Exception as e:
+            analysis_inflight.resolve(fixture_key, error=e)
+            raise
+        analysis_inflight.resolve(fixture_key, result)
+        
+    except Busy as e:
+        logger.warning(f'Từ chối !phantich {home_team} vs {away_team}: {e}')
+        await editor.update(discord.Embed(
+            title='⏳ Bot đang bận',
+            description='Đang có quá nhiều yêu cầu phân tích. Vui lòng thử lại sau ít phút.',
+            color=discord.Color.orange()
+        ), final=True)
     except Exception as e:
         logger.error(f'Lỗi khi phân tích trận đấu: {e}', exc_info=True)
-        await loading_msg.edit(embed=discord.Embed(
+        await editor.update(discord.Embed(
             title='❌ Lỗi',
             description=f'Đã xảy ra lỗi khi phân tích: {str(e)}',
             color=discord.Color.red()
-        ))
+        ), final=True)
 
 
 @bot.command(name='stats_ou')
@@ -470,8 +890,8 @@ async def stats_ou(ctx: commands.Context, line: float = 2.5):
     """Hiển thị độ chính xác lịch sử cho kèo Over/Under ở line (mặc định 2.5)."""
     from prediction_tracker import get_ou_accuracy, get_ou_stats
     try:
-        acc = get_ou_accuracy(line)
-        all_lines = get_ou_stats([1.5, 2.5, 3.5])
+        acc = await offload.run_io(get_ou_accuracy, line, stage='store')
+        all_lines = await offload.run_io(get_ou_stats, [1.5, 2.5, 3.5], stage='store')
         embed = discord.Embed(
             title='📊 Thống Kê O/U',
             description=f'Độ chính xác dựa trên các trận đã hoàn thành',
@@ -485,6 +905,83 @@ async def stats_ou(ctx: commands.Context, line: float = 2.5):
         await ctx.send(f'Không thể lấy thống kê: {e}')
 
 
+def _season_matches() -> Optional[List[Dict[str, Any]]]:
+    """Lịch/kết quả cả mùa: từ fixtures.db nếu đã đồng bộ, nếu không thì gọi API"""
+    store = get_fixture_store()
+    if store.is_fresh():
+        matches = store.season()
+        # fixtures.db giữ cả các mùa trước: chỉ lấy mùa mới nhất
+        latest = (matches[-1].get('season') or {}).get('id') if matches else None
+        if latest is not None:
+            matches = [m for m in matches if (m.get('season') or {}).get('id') == latest]
+        if matches:
+            return matches
+    data = get_football_data(f'/competitions/{PREMIER_LEAGUE_ID}/matches')
+    if not data or 'matches' not in data:
+        return None
+    return data['matches']
+
+
+def _simulate_matches(matches: List[Dict[str, Any]], n_sims: int) -> Dict[str, Any]:
+    """Mô phỏng phần còn lại của mùa từ danh sách trận (cache tới khi có vòng đấu mới được chốt)"""
+    cache_key = (settled_gameweek(matches), bundle_hash([POISSON_STRENGTHS_PATH, POISSON_ONLINE_PATH]), n_sims)
+    result = season_cache.get(cache_key)
+    if result is not None:
+        logger.info(f'Sử dụng cache mô phỏng mùa giải: {cache_key}')
+        return result
+    played, remaining = parse_season_matches(matches)
+    result = simulate_season(played, remaining, n_sims=n_sims)
+    result['settled_gameweek'] = cache_key[0]
+    season_cache.set(cache_key, result)
+    return result
+
+
+@bot.command(name='mophong')
+async def simulate_command(ctx: commands.Context, n_sims: int = N_SIMULATIONS):
+    """
+    Lệnh !mophong [số lần] - Mô phỏng Monte Carlo phần còn lại của mùa giải.
+    Xác suất vô địch, top 4, xuống hạng và điểm kỳ vọng của từng đội.
+    """
+    try:
+        analysis_rate_limits.admit(user=ctx.author.id, guild=ctx.guild.id if ctx.guild else None)
+    except RateLimited as e:
+        await ctx.send(f'⏳ Đang có quá nhiều yêu cầu. Thử lại sau {e.retry_after:.0f} giây.')
+        return
+    await ctx.typing()
+    n_sims = max(1_000, min(int(n_sims), MAX_SIMULATIONS))
+    try:
+        # Mô phỏng cả mùa nhường chỗ cho !phantich trong hàng đợi
+        async with analysis_gate.slot(PRIORITY_BULK):
+            matches = await offload.run_io(_season_matches, stage='fixtures')
+            if not matches:
+                await ctx.send('❌ Không thể lấy lịch thi đấu mùa giải. Vui lòng thử lại sau.')
+                return
+            result = await offload.run_cpu(_simulate_matches, matches, n_sims, stage='simulate')
+        
+        table = "```\n"
+        table += "#  Đội             Điểm  VĐ     Top4   XH\n"
+        for i, r in enumerate(result['table'], 1):
+            table += (f"{i:<2} {r['team'][:15]:15s} {r['expected_points']:5.1f} "
+                      f"{r['title_prob']*100:5.1f}% {r['top4_prob']*100:5.1f}% {r['relegation_prob']*100:5.1f}%\n")
+        table += "```"
+        
+        embed = discord.Embed(
+            title='🎲 Mô Phỏng Mùa Giải Ngoại Hạng Anh',
+            description=(f"{result['n_sims']:,} lần mô phỏng {result['remaining_fixtures']} trận còn lại "
+                         f"(đã chốt vòng {result.get('settled_gameweek', 0)})"),
+            color=discord.Color.dark_blue()
+        )
+        embed.add_field(name='📊 Bảng xếp hạng dự kiến', value=table, inline=False)
+        embed.set_footer(text='Điểm = điểm kỳ vọng cuối mùa | VĐ = vô địch | XH = xuống hạng. Mô hình Poisson, chỉ mang tính tham khảo.')
+        await ctx.send(embed=embed)
+    except Busy as e:
+        logger.warning(f'Từ chối !mophong: {e}')
+        await ctx.send('⏳ Bot đang bận với nhiều yêu cầu phân tích. Vui lòng thử lại sau ít phút.')
+    except Exception as e:
+        logger.error(f'Error simulating season: {e}', exc_info=True)
+        await ctx.send(f'❌ Lỗi khi mô phỏng: {str(e)}')
+
+
 @bot.command(name='fetchresults')
 async def fetch_results_command(ctx: commands.Context, days: int = 7):
     """
@@ -508,7 +1005,8 @@ async def fetch_results_command(ctx: commands.Context, days: int = 7):
         )
         loading_msg = await ctx.send(embed=loading_embed)
         
-        updated_count = auto_fetch_results(FOOTBALL_DATA_API_KEY, days_back=days)
+        updated_count = await offload.run_io(auto_fetch_results, FOOTBALL_DATA_API_KEY, days_back=days,
+                                             stage='fetch_results')
         
         if updated_count > 0:
             embed = discord.Embed(
@@ -519,11 +1017,11 @@ async def fetch_results_command(ctx: commands.Context, days: int = 7):
             
             # Get updated stats
             from prediction_tracker import get_stats
-            stats = get_stats()
+            stats = await offload.run_io(get_stats, stage='store')
             if stats and stats.get('completed_predictions', 0) > 0:
                 embed.add_field(
                     name='Độ chính xác hiện tại',
-                    value=f"{stats['accuracy']:.1%} ({stats['correct_predictions']}/{stats['completed_predictions']})",
+                    value=f"{stats['accuracy']:.1%} ({stats['correct_predictions']}/{stats['graded_predictions']})",
                     inline=False
                 )
         else:
@@ -545,31 +1043,28 @@ async def analyze_command(ctx: commands.Context):
     """
     Hiển thị báo cáo phân tích prediction accuracy và bias.
     """
-    import json
+    from prediction_tracker import get_accuracy_summary, get_rolling_summaries, load_predictions
     await ctx.typing()
     
     try:
-        if not os.path.exists('predictions_log.json'):
+        summary = await offload.run_io(get_accuracy_summary, stage='store')
+        if not summary or not summary['total_predictions']:
             await ctx.send('❌ Chưa có prediction nào được lưu.')
             return
         
-        with open('predictions_log.json', 'r', encoding='utf-8') as f:
-            predictions = json.load(f)
-        
-        completed = [p for p in predictions if p.get('actual_result') is not None]
-        
-        if not completed:
+        n_completed = summary['completed_predictions']
+        if not n_completed:
             await ctx.send('⚠️ Chưa có trận nào hoàn thành. Dùng `!fetchresults` để tự động cập nhật kết quả.')
             return
         
-        # Main stats embed
-        total = len(completed)
-        correct = sum(1 for p in completed if p.get('correct'))
-        accuracy = correct / total
+        # Main stats embed (hòa kèo không tính vào accuracy), đọc từ aggregates
+        total = summary['graded_predictions']
+        correct = summary['correct_predictions']
+        accuracy = summary['accuracy']
         
         embed = discord.Embed(
             title='📊 Báo Cáo Phân Tích Predictions',
-            description=f'Phân tích {len(predictions)} predictions ({total} đã hoàn thành)',
+            description=f"Phân tích {summary['total_predictions']} predictions ({n_completed} đã hoàn thành)",
             color=discord.Color.gold()
         )
         
@@ -582,16 +1077,14 @@ async def analyze_command(ctx: commands.Context):
         )
         
         # By confidence level
-        high_conf = [p for p in completed if p.get('confidence', 0) >= 0.7]
-        med_conf = [p for p in completed if 0.55 <= p.get('confidence', 0) < 0.7]
+        high_conf = summary['confidence']['high']
+        med_conf = summary['confidence']['medium']
         
         conf_text = []
-        if high_conf:
-            high_acc = sum(1 for p in high_conf if p.get('correct')) / len(high_conf)
-            conf_text.append(f"Cao (≥70%): {high_acc:.1%} ({len(high_conf)} trận)")
-        if med_conf:
-            med_acc = sum(1 for p in med_conf if p.get('correct')) / len(med_conf)
-            conf_text.append(f"Trung (55-70%): {med_acc:.1%} ({len(med_conf)} trận)")
+        if high_conf['count']:
+            conf_text.append(f"Cao (≥70%): {high_conf['accuracy']:.1%} ({high_conf['count']} trận)")
+        if med_conf['count']:
+            conf_text.append(f"Trung (55-70%): {med_conf['accuracy']:.1%} ({med_conf['count']} trận)")
         
         if conf_text:
             embed.add_field(
@@ -601,16 +1094,11 @@ async def analyze_command(ctx: commands.Context):
             )
         
         # O/U Analysis
-        ou_completed = [p for p in completed if p.get('ou_pick') and p.get('ou_actual') and p.get('ou_actual') != 'Push']
+        ou = summary['ou']
+        over_ratio = ou['over_ratio']
         
-        if ou_completed:
-            ou_correct = sum(1 for p in ou_completed if p.get('ou_correct'))
-            ou_accuracy = ou_correct / len(ou_completed)
-            
-            over_picks = sum(1 for p in ou_completed if p.get('ou_pick') == 'Over')
-            over_ratio = over_picks / len(ou_completed)
-            
-            ou_text = [f"Accuracy: **{ou_accuracy:.1%}** ({ou_correct}/{len(ou_completed)})"]
+        if ou['count']:
+            ou_text = [f"Accuracy: **{ou['accuracy']:.1%}** ({ou['correct']}/{ou['count']})"]
             
             # Bias detection
             if over_ratio > 0.65:
@@ -621,15 +1109,10 @@ async def analyze_command(ctx: commands.Context):
                 ou_text.append(f"✅ Cân bằng: {over_ratio:.1%} Over / {(1-over_ratio):.1%} Under")
             
             # Win rate by pick
-            over_preds = [p for p in ou_completed if p.get('ou_pick') == 'Over']
-            under_preds = [p for p in ou_completed if p.get('ou_pick') == 'Under']
-            
-            if over_preds:
-                over_wr = sum(1 for p in over_preds if p.get('ou_correct')) / len(over_preds)
-                ou_text.append(f"Over WR: {over_wr:.1%}")
-            if under_preds:
-                under_wr = sum(1 for p in under_preds if p.get('ou_correct')) / len(under_preds)
-                ou_text.append(f"Under WR: {under_wr:.1%}")
+            if ou['over']['count']:
+                ou_text.append(f"Over WR: {ou['over']['accuracy']:.1%}")
+            if ou['under']['count']:
+                ou_text.append(f"Under WR: {ou['under']['accuracy']:.1%}")
             
             embed.add_field(
                 name='🎯 Over/Under Analysis',
@@ -638,29 +1121,41 @@ async def analyze_command(ctx: commands.Context):
             )
         
         # Goals prediction accuracy
-        goals_completed = [p for p in completed 
-                          if p.get('predicted_goals') is not None 
-                          and p.get('home_goals') is not None]
+        goals = summary['goals']
         
-        if goals_completed:
-            errors = []
-            for p in goals_completed:
-                predicted = p.get('predicted_goals', 0)
-                actual = (p.get('home_goals', 0) or 0) + (p.get('away_goals', 0) or 0)
-                errors.append(abs(predicted - actual))
-            
-            mae = sum(errors) / len(errors)
+        if goals['count']:
             embed.add_field(
                 name='⚽ Dự Đoán Tổng Bàn',
-                value=f'MAE: **{mae:.2f}** bàn/trận\n({len(goals_completed)} trận)',
+                value=f"MAE: **{goals['mae']:.2f}** bàn/trận\n({goals['count']} trận)",
                 inline=True
             )
         
+        # Rolling windows (cộng từ metric buckets theo ngày/tuần)
+        rolling = await offload.run_io(get_rolling_summaries, stage='store') or {}
+        rolling_text = []
+        for label, window in (('7 ngày', '7d'), ('30 ngày', '30d'), ('90 ngày', '90d'), ('Mùa này', 'season')):
+            stats = rolling.get(window)
+            if not stats or not stats['completed_predictions']:
+                continue
+            line = f"{label}: {stats['accuracy']:.1%} ({stats['graded_predictions']} trận)"
+            if stats['ou']['count']:
+                line += f" | O/U {stats['ou']['accuracy']:.1%}"
+            if stats['goals']['count']:
+                line += f" | MAE {stats['goals']['mae']:.2f}"
+            rolling_text.append(line)
+        
+        if rolling_text:
+            embed.add_field(
+                name='🗓️ Theo Thời Gian',
+                value='\n'.join(rolling_text),
+                inline=False
+            )
+        
         # Recent results (last 5)
-        recent = completed[-5:] if len(completed) > 5 else completed
+        recent = await offload.run_io(load_predictions, completed_only=True, limit=5, stage='store')
         recent_text = []
         for p in reversed(recent):
-            icon = '✅' if p.get('correct') else '❌'
+            icon = '🟡' if p.get('correct') is None else ('✅' if p.get('correct') else '❌')
             score = f"{p.get('home_goals', '?')}-{p.get('away_goals', '?')}"
             recent_text.append(f"{icon} {p['home_team'][:15]} vs {p['away_team'][:15]} ({score})")
         
@@ -673,15 +1168,12 @@ async def analyze_command(ctx: commands.Context):
         
         # Footer with tips
         tips = []
-        if len(completed) < 20:
+        if n_completed < 20:
             tips.append('💡 Cần thêm dữ liệu (ít nhất 20 trận) để phân tích chi tiết.')
         
-        if ou_completed and over_ratio > 0.65:
-            over_preds_list = [p for p in ou_completed if p.get('ou_pick') == 'Over']
-            if over_preds_list:
-                over_wr_check = sum(1 for p in over_preds_list if p.get('ou_correct')) / len(over_preds_list)
-                if over_wr_check < 0.5:
-                    tips.append('⚠️ Model nghiêng Over nhưng win rate thấp. Cân nhắc hạ alpha.')
+        if ou['count'] and over_ratio > 0.65:
+            if ou['over']['count'] and ou['over']['accuracy'] < 0.5:
+                tips.append('⚠️ Model nghiêng Over nhưng win rate thấp. Cân nhắc hạ alpha.')
         
         if tips:
             embed.set_footer(text=' | '.join(tips))
@@ -701,30 +1193,16 @@ async def update_result_command(ctx: commands.Context, home_team: str, away_team
     Ví dụ: !updateresult Arsenal "Manchester United" 2 1
     Hoặc: !updateresult Arsenal ManchesterUnited 2 1
     """
-    from prediction_tracker import update_result
-    import json
+    from prediction_tracker import count_predictions, find_pending_predictions, update_result
     await ctx.typing()
     
     try:
-        # Load predictions
-        if not os.path.exists('predictions_log.json'):
+        if not await offload.run_io(count_predictions, stage='store'):
             await ctx.send('❌ Chưa có prediction nào được lưu.')
             return
         
-        with open('predictions_log.json', 'r', encoding='utf-8') as f:
-            predictions = json.load(f)
-        
-        # Find matching prediction (most recent)
-        # Normalize team names for matching
-        home_norm = home_team.lower().replace(' ', '').replace('_', '')
-        away_norm = away_team.lower().replace(' ', '').replace('_', '')
-        
-        candidates = []
-        for p in predictions:
-            p_home = p['home_team'].lower().replace(' ', '').replace('_', '')
-            p_away = p['away_team'].lower().replace(' ', '').replace('_', '')
-            if p_home == home_norm and p_away == away_norm and p.get('actual_result') is None:
-                candidates.append(p)
+        # Find matching prediction (most recent), tra theo tên đội đã chuẩn hóa
+        candidates = await offload.run_io(find_pending_predictions, home_team, away_team, stage='store')
         
         if not candidates:
             await ctx.send(f'❌ Không tìm thấy prediction cho trận **{home_team}** vs **{away_team}** (hoặc đã cập nhật rồi).')
@@ -736,18 +1214,20 @@ async def update_result_command(ctx: commands.Context, home_team: str, away_team
         handicap = pred.get('handicap_value', 0.0) or 0.0
         
         # Update
-        is_correct = update_result(pred_id, home_goals, away_goals, handicap)
+        is_correct = await offload.run_io(update_result, pred_id, home_goals, away_goals, handicap, stage='store')
+        outcome = settle_handicap(home_goals, away_goals, handicap,
+                                  side='home' if pred['prediction'] == 1 else 'away')
         
         # Build response
         embed = discord.Embed(
             title='✅ Đã Cập Nhật Kết Quả',
             description=f'**{home_team}** {home_goals}-{away_goals} **{away_team}**',
-            color=discord.Color.green() if is_correct else discord.Color.red()
+            color=discord.Color.gold() if is_correct is None else (discord.Color.green() if is_correct else discord.Color.red())
         )
         
         embed.add_field(
             name='Kèo chấp',
-            value=f'{pred["home_team"]} {handicap:+.1f}',
+            value=f'{pred["home_team"]} {handicap:+g}',
             inline=True
         )
         
@@ -759,7 +1239,7 @@ async def update_result_command(ctx: commands.Context, home_team: str, away_team
         
         embed.add_field(
             name='Kết quả',
-            value=f'{"✅ Đúng" if is_correct else "❌ Sai"}',
+            value=_HANDICAP_OUTCOME_LABELS[outcome],
             inline=True
         )
         
@@ -775,11 +1255,11 @@ async def update_result_command(ctx: commands.Context, home_team: str, away_team
         
         # Get updated stats
         from prediction_tracker import get_stats
-        stats = get_stats()
+        stats = await offload.run_io(get_stats, stage='store')
         if stats and stats.get('completed_predictions', 0) > 0:
             embed.add_field(
                 name='Độ chính xác hiện tại',
-                value=f"{stats['accuracy']:.1%} ({stats['correct_predictions']}/{stats['completed_predictions']})",
+                value=f"{stats['accuracy']:.1%} ({stats['correct_predictions']}/{stats['graded_predictions']})",
                 inline=False
             )
         
@@ -812,6 +1292,13 @@ async def help_command(ctx: commands.Context):
         inline=False
     )
     
+    embed.add_field(
+        name='🎲 !mophong [số lần]',
+        value='Mô phỏng phần còn lại của mùa giải: xác suất vô địch, top 4, xuống hạng và điểm kỳ vọng.\n'
+              'Ví dụ: `!mophong 100000`',
+        inline=False
+    )
+    
     embed.add_field(
         name='📊 !stats',
         value='Xem độ chính xác dự đoán tổng thể của bot.',
@@ -862,7 +1349,7 @@ async def stats_command(ctx: commands.Context):
     await ctx.typing()
     
     try:
-        stats = get_stats()
+        stats = await offload.run_io(get_stats, stage='store')
         
         if not stats:
             await ctx.send('📊 Chưa có dữ liệu prediction nào được lưu.')
@@ -900,7 +1387,7 @@ async def stats_command(ctx: commands.Context):
             
             embed.add_field(
                 name=f'{accuracy_icon} Độ chính xác',
-                value=f"**{accuracy:.1%}** ({correct}/{stats['completed_predictions']})",
+                value=f"**{accuracy:.1%}** ({correct}/{stats['graded_predictions']})",
                 inline=True
             )
             
@@ -908,7 +1395,7 @@ async def stats_command(ctx: commands.Context):
             if 'recent_10' in stats and stats['recent_10']:
                 recent_text = []
                 for p in stats['recent_10'][-5:]:  # Last 5
-                    icon = '✅' if p['correct'] else '❌'
+                    icon = '🟡' if p['correct'] is None else ('✅' if p['correct'] else '❌')
                     recent_text.append(f"{icon} {p['home_team']} vs {p['away_team']}")
                 
                 embed.add_field(
@@ -999,6 +1486,9 @@ async def on_command_error(ctx: commands.Context, error: Exception):
         await ctx.send('❌ Thiếu tham số. Sử dụng `!huongdan` để xem hướng dẫn.')
     elif isinstance(error, commands.CommandNotFound):
         await ctx.send('❌ Lệnh không tồn tại. Sử dụng `!huongdan` để xem danh sách lệnh.')
+    elif isinstance(getattr(error, 'original', None), offload.StageTimeout):
+        logger.warning(f'Lệnh {ctx.command} quá thời gian: {error.original}')
+        await ctx.send('⏱️ Lệnh xử lý quá lâu và đã bị huỷ. Vui lòng thử lại sau.')
     else:
         logger.error(f'Lỗi không xử lý được: {error}', exc_info=True)
         await ctx.send('❌ Đã xảy ra lỗi khi thực hiện lệnh.')
@@ -1063,6 +1553,11 @@ def main():
         bot.run(DISCORD_TOKEN)
     except Exception as e:
         logger.error(f'Lỗi khi khởi chạy bot: {e}')
+    finally:
+        # Ghi nốt các prediction còn trong hàng đợi write-behind
+        from prediction_store import shutdown as shutdown_prediction_store
+        offload.shutdown()
+        shutdown_prediction_store()
 
 
 if __name__ == '__main__':
@@ -1,6 +1,6 @@
 import os
 from data_collector import get_team_stats, get_odds_data
-from predictor import predict_match, predict_total_goals, predict_multiline_ou, predict_correct_score
+from predictor import predict_match, predict_total_goals, predict_multiline_ou, predict_correct_score, build_match_distribution
 
 FOOTBALL_DATA_API_KEY = os.getenv('FOOTBALL_DATA_API_KEY')
 ODDS_API_KEY = os.getenv('ODDS_API_KEY')
@@ -21,8 +21,9 @@ def run_one(home, away):
     pred = predict_match(home_stats, away_stats, odds_data)
     goals = predict_total_goals(home_stats, away_stats, odds_data)
     cached_goals = goals.get('predicted_goals') if goals else None
-    ou_multi = predict_multiline_ou(home_stats, away_stats, odds_data, predicted_goals=cached_goals)
-    cs = predict_correct_score(home_stats, away_stats, predicted_goals=cached_goals)
+    dist = build_match_distribution(home_stats, away_stats, odds_data, predicted_goals=cached_goals)
+    ou_multi = predict_multiline_ou(home_stats, away_stats, odds_data, distribution=dist)
+    cs = predict_correct_score(home_stats, away_stats, distribution=dist)
 
     return {
         'match': f"{home} vs {away}",
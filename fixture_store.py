@@ -0,0 +1,312 @@
+"""
+fixture_store.py - Local store of Premier League fixtures with incremental sync
+
+!lichdau, result settlement and the background loops read fixtures from a
+small SQLite database (fixtures.db) instead of calling Football-Data on
+every command. sync() keeps it current while fetching as little as possible:
+
+- the whole season once per FULL_SYNC_INTERVAL (catches postponements and
+  fixtures moved to another date)
+- the upcoming window (today .. today + UPCOMING_DAYS) every UPCOMING_REFRESH
+- only the days that have a started-but-unfinished fixture every
+  ACTIVE_REFRESH, so live matches move TIMED -> IN_PLAY -> FINISHED quickly
+
+A fixture row is only rewritten when the API's lastUpdated (or status /
+score) changed; every status change is recorded in fixture_transitions.
+Like prediction_store, writes run in BEGIN IMMEDIATE transactions on a WAL
+database so the bot and a separate worker can share the file.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from team_names import canonical_team_name
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = 'fixtures.db'
+BUSY_TIMEOUT_SECONDS = 30.0
+API_URL = 'https://api.football-data.org/v4/competitions/PL/matches'
+
+FULL_SYNC_INTERVAL = timedelta(hours=24)
+UPCOMING_REFRESH = timedelta(hours=6)
+ACTIVE_REFRESH = timedelta(minutes=10)
+UPCOMING_DAYS = 7
+# Trận đã bắt đầu nhưng chưa FINISHED quá lâu (hoãn giữa chừng...) thì để full sync xử lý
+ACTIVE_LOOKBACK = timedelta(days=2)
+
+FINAL_STATUSES = ('FINISHED', 'AWARDED', 'CANCELLED')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fixtures (
+    id INTEGER PRIMARY KEY,
+    utc_date TEXT NOT NULL,
+    matchday INTEGER,
+    status TEXT NOT NULL,
+    home_team TEXT,
+    away_team TEXT,
+    home_key TEXT,
+    away_key TEXT,
+    home_goals INTEGER,
+    away_goals INTEGER,
+    last_updated TEXT,
+    synced_at TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_fixtures_date ON fixtures (utc_date);
+CREATE INDEX IF NOT EXISTS idx_fixtures_status ON fixtures (status, utc_date);
+CREATE INDEX IF NOT EXISTS idx_fixtures_teams ON fixtures (home_key, away_key);
+CREATE TABLE IF NOT EXISTS fixture_transitions (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    fixture_id INTEGER NOT NULL,
+    from_status TEXT,
+    to_status TEXT NOT NULL,
+    at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _utc(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def _row(match: Dict[str, Any], now: datetime) -> Dict[str, Any]:
+    score = (match.get('score') or {}).get('fullTime') or {}
+    home = (match.get('homeTeam') or {}).get('name') or ''
+    away = (match.get('awayTeam') or {}).get('name') or ''
+    return {
+        'id': int(match['id']),
+        'utc_date': _utc(match['utcDate']).astimezone(timezone.utc).isoformat(),
+        'matchday': match.get('matchday'),
+        'status': match.get('status') or 'SCHEDULED',
+        'home_team': home,
+        'away_team': away,
+        'home_key': canonical_team_name(home),
+        'away_key': canonical_team_name(away),
+        'home_goals': score.get('home'),
+        'away_goals': score.get('away'),
+        'last_updated': match.get('lastUpdated'),
+        'synced_at': now.isoformat(),
+        'data': json.dumps(match, ensure_ascii=False),
+    }
+
+
+def fetch_matches(api_key: str, date_from: Optional[date] = None, date_to: Optional[date] = None) -> List[Dict[str, Any]]:
+    """
+    Trận PL từ Football-Data (cả mùa nếu không truyền khoảng ngày).
+    Lỗi HTTP / mạng được raise để caller tự backoff.
+    """
+    import requests
+
+    params = {}
+    if date_from is not None:
+        params = {'dateFrom': date_from.isoformat(), 'dateTo': (date_to or date_from).isoformat()}
+    response = requests.get(API_URL, headers={'X-Auth-Token': api_key}, params=params, timeout=10)
+    response.raise_for_status()
+    return response.json().get('matches', [])
+
+
+class FixtureStore:
+    """SQLite-backed fixture list for one competition."""
+
+    def __init__(self, path: str = DB_PATH):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_SECONDS, check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.execute(f'PRAGMA busy_timeout={int(BUSY_TIMEOUT_SECONDS * 1000)}')
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        with self._transaction():
+            for statement in _SCHEMA.split(';'):
+                if statement.strip():
+                    self._conn.execute(statement)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+
+    # ------------------------------------------------------------------ writes
+
+    def upsert(self, matches: List[Dict[str, Any]], now: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        Merge API matches into the store. Unchanged fixtures are skipped.
+
+        Returns:
+            {'inserted': n, 'updated': n, 'unchanged': n, 'transitions': [(id, from, to), ...]}
+        """
+        now = now or datetime.now(timezone.utc)
+        result = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'transitions': []}
+        if not matches:
+            return result
+        with self._transaction():
+            for match in matches:
+                row = _row(match, now)
+                found = self._conn.execute(
+                    'SELECT status, last_updated, utc_date, home_goals, away_goals FROM fixtures WHERE id = ?',
+                    (row['id'],)).fetchone()
+                if found is not None and found == (row['status'], row['last_updated'], row['utc_date'],
+                                                   row['home_goals'], row['away_goals']):
+                    result['unchanged'] += 1
+                    continue
+                names = ', '.join(row)
+                marks = ', '.join(f':{k}' for k in row)
+                self._conn.execute(f'INSERT OR REPLACE INTO fixtures ({names}) VALUES ({marks})', row)
+                old_status = found[0] if found is not None else None
+                if old_status != row['status']:
+                    self._conn.execute(
+                        'INSERT INTO fixture_transitions (fixture_id, from_status, to_status, at) VALUES (?, ?, ?, ?)',
+                        (row['id'], old_status, row['status'], now.isoformat()))
+                    if old_status is not None:
+                        result['transitions'].append((row['id'], old_status, row['status']))
+                result['updated' if found is not None else 'inserted'] += 1
+        return result
+
+    def _get_meta(self, key: str) -> Optional[datetime]:
+        with self._lock:
+            row = self._conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return datetime.fromisoformat(row[0]) if row else None
+
+    def _set_meta(self, key: str, when: datetime) -> None:
+        with self._transaction():
+            self._conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, when.isoformat()))
+
+    # ------------------------------------------------------------------- sync
+
+    def _active_days(self, now: datetime) -> Optional[Tuple[date, date]]:
+        marks = ', '.join('?' for _ in FINAL_STATUSES)
+        with self._lock:
+            row = self._conn.execute(
+                f'SELECT MIN(utc_date), MAX(utc_date) FROM fixtures '
+                f'WHERE status NOT IN ({marks}) AND utc_date BETWEEN ? AND ?',
+                (*FINAL_STATUSES, (now - ACTIVE_LOOKBACK).isoformat(), now.isoformat())).fetchone()
+        if not row or row[0] is None:
+            return None
+        return _utc(row[0]).date(), _utc(row[1]).date()
+
+    def plan_sync(self, now: Optional[datetime] = None) -> List[Tuple[str, Optional[date], Optional[date]]]:
+        """Ranges due for a fetch as [(kind, date_from, date_to)]; kind 'full' has no dates."""
+        now = now or datetime.now(timezone.utc)
+
+        def due(kind: str, interval: timedelta) -> bool:
+            last = self._get_meta(f'synced:{kind}')
+            return last is None or now - last >= interval
+
+        if due('full', FULL_SYNC_INTERVAL):
+            return [('full', None, None)]
+        plan = []
+        if due('upcoming', UPCOMING_REFRESH):
+            today = now.date()
+            plan.append(('upcoming', today, today + timedelta(days=UPCOMING_DAYS)))
+        active = self._active_days(now)
+        if active is not None and due('active', ACTIVE_REFRESH):
+            plan.append(('active', *active))
+        return plan
+
+    def sync(self, api_key: str, now: Optional[datetime] = None,
+             fetch: Callable[..., List[Dict[str, Any]]] = fetch_matches) -> Dict[str, Any]:
+        """
+        Fetch only the ranges that are due and merge them. Errors from `fetch`
+        propagate (nothing is marked as synced), so the caller can back off.
+
+        Returns:
+            {'ranges': [kind, ...], 'inserted', 'updated', 'unchanged', 'transitions'}
+        """
+        now = now or datetime.now(timezone.utc)
+        summary = {'ranges': [], 'inserted': 0, 'updated': 0, 'unchanged': 0, 'transitions': []}
+        for kind, date_from, date_to in self.plan_sync(now):
+            matches = fetch(api_key, date_from, date_to)
+            result = self.upsert(matches, now)
+            self._set_meta(f'synced:{kind}', now)
+            if kind == 'full':
+                # Full sync đã bao gồm các cửa sổ nhỏ
+                self._set_meta('synced:upcoming', now)
+                self._set_meta('synced:active', now)
+            summary['ranges'].append(kind)
+            for key in ('inserted', 'updated', 'unchanged'):
+                summary[key] += result[key]
+            summary['transitions'].extend(result['transitions'])
+        if summary['ranges']:
+            logger.info(f"Fixture sync {summary['ranges']}: {summary['inserted']} mới, {summary['updated']} thay đổi, "
+                        f"{len(summary['transitions'])} chuyển trạng thái")
+        return summary
+
+    def is_fresh(self, now: Optional[datetime] = None) -> bool:
+        """True while the store has been synced within FULL_SYNC_INTERVAL."""
+        now = now or datetime.now(timezone.utc)
+        last = self._get_meta('synced:full')
+        return last is not None and now - last < FULL_SYNC_INTERVAL
+
+    # ------------------------------------------------------------------- reads
+
+    def _matches(self, sql: str, params=()) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def between(self, start: datetime, end: datetime) -> List[Dict[str, Any]]:
+        """Fixtures kicking off in [start, end), in kickoff order (API match dicts)."""
+        return self._matches('SELECT data FROM fixtures WHERE utc_date >= ? AND utc_date < ? ORDER BY utc_date, id',
+                             (start.astimezone(timezone.utc).isoformat(), end.astimezone(timezone.utc).isoformat()))
+
+    def upcoming(self, now: Optional[datetime] = None, days: int = UPCOMING_DAYS) -> List[Dict[str, Any]]:
+        """Fixtures from today (UTC) through today + days."""
+        now = now or datetime.now(timezone.utc)
+        start = datetime.combine(now.date(), datetime.min.time(), tzinfo=timezone.utc)
+        return self.between(start, start + timedelta(days=days + 1))
+
+    def finished(self, days_back: int = 7, now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """FINISHED fixtures of the last `days_back` days, same shape as the API's matches."""
+        now = now or datetime.now(timezone.utc)
+        start = datetime.combine(now.date() - timedelta(days=days_back), datetime.min.time(), tzinfo=timezone.utc)
+        return self._matches("SELECT data FROM fixtures WHERE status = 'FINISHED' AND utc_date >= ? "
+                             "ORDER BY utc_date, id", (start.isoformat(),))
+
+    def season(self) -> List[Dict[str, Any]]:
+        return self._matches('SELECT data FROM fixtures ORDER BY utc_date, id')
+
+    def find(self, home_team: str, away_team: str) -> List[Dict[str, Any]]:
+        """Fixtures between two teams (normalized names), in kickoff order."""
+        return self._matches('SELECT data FROM fixtures WHERE home_key = ? AND away_key = ? ORDER BY utc_date',
+                             (canonical_team_name(home_team), canonical_team_name(away_team)))
+
+    def transitions(self, fixture_id: int) -> List[Tuple[Optional[str], str, str]]:
+        """Status history of one fixture as [(from, to, at)]."""
+        with self._lock:
+            return self._conn.execute(
+                'SELECT from_status, to_status, at FROM fixture_transitions WHERE fixture_id = ? ORDER BY seq',
+                (fixture_id,)).fetchall()
+
+
+_STORE: Optional[FixtureStore] = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_fixture_store() -> FixtureStore:
+    """Shared store for DB_PATH."""
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None or _STORE.path != DB_PATH:
+            _STORE = FixtureStore(DB_PATH)
+        return _STORE
@@ -11,7 +11,7 @@ Module này chứa toàn bộ logic để:
 
 import os
 import logging
-from typing import Tuple, Dict, Any
+from typing import Tuple, Dict, Any, List, Optional
 import pickle
 
 import pandas as pd
@@ -22,6 +22,8 @@ from sklearn.linear_model import LogisticRegression, LinearRegression
 from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, classification_report, mean_squared_error, mean_absolute_error, r2_score
 
+from artifact_cache import cached_artifact, store_artifact
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -31,6 +33,10 @@ MODEL_PATH = 'epl_prediction_model.pkl'
 SCALER_PATH = 'scaler.pkl'
 GOALS_MODEL_PATH = 'epl_goals_model.pkl'
 GOALS_SCALER_PATH = 'goals_scaler.pkl'
+MATCH_FEATURES_PATH = 'match_features.pkl'
+GOALS_FEATURES_PATH = 'goals_features.pkl'
+# Phiên bản code sinh artifact (feature list, scaler); tăng khi prepare_data thay đổi
+ARTIFACT_CODE_VERSION = '1'
 
 
 def load_dataset() -> pd.DataFrame:
@@ -127,9 +133,8 @@ def train_models(X_train, X_test, y_train, y_test) -> Dict[str, Any]:
     X_train_scaled = scaler.fit_transform(X_train)
     X_test_scaled = scaler.transform(X_test)
     
-    # Lưu scaler
-    with open(SCALER_PATH, 'wb') as f:
-        pickle.dump(scaler, f)
+    # Lưu scaler (kèm fingerprint dataset trong artifact manifest)
+    store_artifact(SCALER_PATH, scaler, [DATASET_PATH], ARTIFACT_CODE_VERSION)
     logger.info(f'Đã lưu scaler vào {SCALER_PATH}')
     
     # Định nghĩa các models
@@ -198,12 +203,13 @@ def train_models(X_train, X_test, y_train, y_test) -> Dict[str, Any]:
     return results
 
 
-def save_best_model(results: Dict[str, Any]) -> None:
+def save_best_model(results: Dict[str, Any], feature_columns: Optional[List[str]] = None) -> None:
     """
     Lưu model tốt nhất dựa trên F1 score
     
     Args:
         results: Dictionary chứa kết quả của tất cả models
+        feature_columns: Danh sách cột đã dùng để train (None -> lấy từ artifact cache)
     """
     # Tìm model tốt nhất
     best_model_name = max(results, key=lambda x: results[x]['f1'])
@@ -220,16 +226,15 @@ def save_best_model(results: Dict[str, Any]) -> None:
         pickle.dump(best_model, f)
     
     logger.info(f'✅ Đã lưu model vào {MODEL_PATH}')
-    # Lưu danh sách features dùng cho model chính
+    # Lưu danh sách features dùng cho model chính; chỉ chuẩn bị lại dataset khi
+    # không có sẵn cột và artifact cũ đã lỗi thời (dataset/code thay đổi)
     try:
-        with open('match_features.pkl', 'wb') as f:
-            # best model was trained on X_train_scaled -> original columns preserved earlier in prepare_data
-            # We can reload dataset and re-run prepare_data quickly to capture columns
-            df = load_dataset()
-            if not df.empty:
-                X_tmp, _y_tmp = prepare_data(df)
-                pickle.dump(X_tmp.columns.tolist(), f)
-                logger.info(f'Đã lưu danh sách features (match) vào match_features.pkl')
+        if feature_columns is not None:
+            store_artifact(MATCH_FEATURES_PATH, list(feature_columns), [DATASET_PATH], ARTIFACT_CODE_VERSION)
+        else:
+            cached_artifact(MATCH_FEATURES_PATH, lambda: prepare_data(load_dataset())[0].columns.tolist(),
+                            [DATASET_PATH], ARTIFACT_CODE_VERSION)
+        logger.info(f'Đã lưu danh sách features (match) vào {MATCH_FEATURES_PATH}')
     except Exception as e:
         logger.warning(f'Không thể lưu danh sách features match: {e}')
 
@@ -293,9 +298,8 @@ def train_goals_models(X_train, X_test, y_train, y_test) -> Dict[str, Any]:
     X_train_scaled = scaler.fit_transform(X_train)
     X_test_scaled = scaler.transform(X_test)
     
-    # Lưu scaler
-    with open(GOALS_SCALER_PATH, 'wb') as f:
-        pickle.dump(scaler, f)
+    # Lưu scaler (kèm fingerprint dataset trong artifact manifest)
+    store_artifact(GOALS_SCALER_PATH, scaler, [DATASET_PATH], ARTIFACT_CODE_VERSION)
     logger.info(f'Đã lưu goals scaler vào {GOALS_SCALER_PATH}')
     
     # Định nghĩa các models (regression)
@@ -356,12 +360,13 @@ def train_goals_models(X_train, X_test, y_train, y_test) -> Dict[str, Any]:
     return results
 
 
-def save_best_goals_model(results: Dict[str, Any]) -> None:
+def save_best_goals_model(results: Dict[str, Any], feature_columns: Optional[List[str]] = None) -> None:
     """
     Lưu model tốt nhất dự đoán tổng bàn (dựa trên MAE thấp nhất)
     
     Args:
         results: Dictionary chứa kết quả của tất cả models
+        feature_columns: Danh sách cột đã dùng để train (None -> lấy từ artifact cache)
     """
     # Tìm model tốt nhất (MAE thấp nhất)
     best_model_name = min(results, key=lambda x: results[x]['mae'])
@@ -382,12 +387,12 @@ def save_best_goals_model(results: Dict[str, Any]) -> None:
     logger.info(f'✅ Đã lưu goals model vào {GOALS_MODEL_PATH}')
     # Lưu danh sách features dùng cho goals model
     try:
-        df = load_dataset()
-        if not df.empty:
-            Xg_tmp, yg_tmp = prepare_goals_data(df)
-            with open('goals_features.pkl', 'wb') as f:
-                pickle.dump(Xg_tmp.columns.tolist(), f)
-            logger.info('Đã lưu danh sách features (goals) vào goals_features.pkl')
+        if feature_columns is not None:
+            store_artifact(GOALS_FEATURES_PATH, list(feature_columns), [DATASET_PATH], ARTIFACT_CODE_VERSION)
+        else:
+            cached_artifact(GOALS_FEATURES_PATH, lambda: prepare_goals_data(load_dataset())[0].columns.tolist(),
+                            [DATASET_PATH], ARTIFACT_CODE_VERSION)
+        logger.info(f'Đã lưu danh sách features (goals) vào {GOALS_FEATURES_PATH}')
     except Exception as e:
         logger.warning(f'Không thể lưu danh sách features goals: {e}')
 
@@ -482,7 +487,7 @@ def main():
     results = train_models(X_train, X_test, y_train, y_test)
     
     # Save best model
-    save_best_model(results)
+    save_best_model(results, feature_columns=X.columns.tolist())
     
     # === TRAIN MODEL DỰ ĐOÁN TỔNG BÀN THẮNG ===
     logger.info('\n\n=== BẮT ĐẦU TRAINING MODEL DỰ ĐOÁN TỔNG BÀN THẮNG ===\n')
@@ -506,7 +511,7 @@ def main():
         goals_results = train_goals_models(X_train_g, X_test_g, y_train_g, y_test_g)
         
         # Save best goals model
-        save_best_goals_model(goals_results)
+        save_best_goals_model(goals_results, feature_columns=X_goals.columns.tolist())
     
     logger.info('\n=== KẾT THÚC TRAINING ===')
     logger.info('Cả 2 models đã sẵn sàng:')
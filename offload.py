@@ -0,0 +1,132 @@
+"""
+offload.py - Chạy các bước blocking của bot ngoài event loop
+
+Các lệnh Discord gọi HTTP (requests), đọc/ghi SQLite, load pickle và chạy
+model sklearn / Poisson - tất cả đều blocking. Module này tách chúng khỏi
+event loop:
+
+- run_io(): pool thread riêng, có giới hạn, cho HTTP / database / file
+- run_cpu(): pool riêng cho inference và mô phỏng, để vài lệnh !phantich
+  nặng không chiếm hết thread của các lệnh I/O nhẹ (và ngược lại)
+- mỗi bước có timeout riêng (STAGE_TIMEOUTS); quá hạn -> StageTimeout
+- mỗi lệnh có deadline (start_deadline); interaction của Discord hết hạn
+  sau 15 phút nên các bước sau deadline bị huỷ thay vì chạy cho một
+  response không còn gửi được. Việc đang xếp hàng trong pool bị huỷ luôn,
+  việc đã chạy thì chạy nốt nhưng kết quả bị bỏ.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+IO_WORKERS = int(os.getenv('BOT_IO_WORKERS', '8'))
+CPU_WORKERS = int(os.getenv('BOT_CPU_WORKERS', str(min(4, os.cpu_count() or 1))))
+
+# Timeout (giây) theo bước; bước không có trong bảng dùng DEFAULT_TIMEOUT
+DEFAULT_TIMEOUT = 30.0
+STAGE_TIMEOUTS = {
+    'odds': 20.0,
+    'stats': 30.0,
+    'predict': 20.0,
+    'markets': 30.0,
+    'ai': 45.0,
+    'football_data': 20.0,
+    'fixtures': 30.0,
+    'fixture_sync': 60.0,
+    'fetch_results': 60.0,
+    'settle': 120.0,
+    'store': 15.0,
+    'artifacts': 10.0,
+    'simulate': 180.0,
+}
+
+# Interaction token của Discord sống 15 phút; để dư một chút cho lần gửi cuối
+INTERACTION_LIFETIME = 15 * 60
+COMMAND_DEADLINE = INTERACTION_LIFETIME - 30
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar('offload_deadline', default=None)
+
+_io_pool: Optional[ThreadPoolExecutor] = None
+_cpu_pool: Optional[ThreadPoolExecutor] = None
+
+
+class StageTimeout(asyncio.TimeoutError):
+    """Một bước chạy quá timeout của nó hoặc quá deadline của lệnh."""
+
+    def __init__(self, stage: str, timeout: float):
+        super().__init__(f"Bước '{stage}' quá thời gian ({timeout:.0f}s)")
+        self.stage = stage
+        self.timeout = timeout
+
+
+def _pools() -> tuple:
+    global _io_pool, _cpu_pool
+    if _io_pool is None:
+        _io_pool = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix='bot-io')
+    if _cpu_pool is None:
+        _cpu_pool = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix='bot-cpu')
+    return _io_pool, _cpu_pool
+
+
+def start_deadline(seconds: float = COMMAND_DEADLINE, started_at: Optional[float] = None) -> None:
+    """
+    Đặt deadline cho lệnh đang chạy (theo task hiện tại). started_at: thời điểm
+    (time.time()) interaction được tạo, để tính theo tuổi thật của interaction.
+    """
+    _deadline.set((started_at if started_at is not None else time.time()) + seconds)
+
+
+def remaining() -> Optional[float]:
+    """Số giây còn lại tới deadline của lệnh, None nếu không có deadline."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.time()
+
+
+async def _run(pool: ThreadPoolExecutor, stage: str, timeout: Optional[float],
+               func: Callable[..., Any], args, kwargs) -> Any:
+    limit = STAGE_TIMEOUTS.get(stage, DEFAULT_TIMEOUT) if timeout is None else timeout
+    left = remaining()
+    if left is not None:
+        if left <= 0:
+            raise StageTimeout(stage, 0)
+        limit = min(limit, left)
+
+    loop = asyncio.get_running_loop()
+    # Giữ contextvars như asyncio.to_thread
+    call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+    started = time.perf_counter()
+    try:
+        return await asyncio.wait_for(loop.run_in_executor(pool, call), timeout=limit)
+    except asyncio.TimeoutError:
+        logger.warning(f"Bước '{stage}' bị huỷ sau {time.perf_counter() - started:.1f}s (giới hạn {limit:.0f}s)")
+        raise StageTimeout(stage, limit) from None
+
+
+async def run_io(func: Callable[..., Any], *args, stage: str = 'io', timeout: Optional[float] = None,
+                 **kwargs) -> Any:
+    """Chạy func(*args, **kwargs) blocking I/O trong pool I/O, với timeout của `stage`."""
+    return await _run(_pools()[0], stage, timeout, func, args, kwargs)
+
+
+async def run_cpu(func: Callable[..., Any], *args, stage: str = 'cpu', timeout: Optional[float] = None,
+                  **kwargs) -> Any:
+    """Chạy func(*args, **kwargs) nặng CPU (inference, mô phỏng) trong pool CPU."""
+    return await _run(_pools()[1], stage, timeout, func, args, kwargs)
+
+
+def shutdown(wait: bool = False) -> None:
+    """Đóng các pool (huỷ việc còn xếp hàng)."""
+    global _io_pool, _cpu_pool
+    for pool in (_io_pool, _cpu_pool):
+        if pool is not None:
+            pool.shutdown(wait=wait, cancel_futures=True)
+    _io_pool = _cpu_pool = None
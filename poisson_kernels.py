@@ -0,0 +1,246 @@
+"""
+poisson_kernels.py - Vectorized probability kernels for the Poisson score model
+
+Low-level NumPy kernels used by poisson_model:
+- poisson_pmf: recurrence p[k] = p[k-1] * lam / k (no factorials), batched
+- totals_from_matrix / totals_convolve: total-goals distribution from a score
+  matrix (diagonal sums) or from two independent pmfs (convolution)
+- top_k_scorelines: argpartition top-k, only the k winners are formatted
+- adaptive_max_goals: smallest truncation whose lost tail mass is below a
+  tolerance for the given lambdas
+- skellam_pmf: closed-form goal-difference distribution of two independent
+  Poisson variables (modified Bessel function, scipy optional)
+
+Run `python poisson_kernels.py` for a benchmark against the previous
+pure-Python implementations.
+"""
+
+from __future__ import annotations
+
+from functools import lru_cache
+from math import exp
+from typing import List, Tuple
+
+import numpy as np
+
+try:
+    from scipy.special import ive
+except ImportError:  # scipy optional: Skellam falls back to a pmf correlation
+    ive = None
+
+DEFAULT_TAIL_TOL = 1e-9
+MAX_GOALS_CAP = 30
+# Dưới ngưỡng này vòng lặp truy hồi tốn overhead hơn là tính Bessel cho mọi bậc
+SKELLAM_RECURRENCE_MIN_ROWS = 8
+
+
+def poisson_pmf(lams, max_goals: int) -> np.ndarray:
+    """(N, max_goals+1) pmf table via the multiplicative recurrence."""
+    lams = np.atleast_1d(np.asarray(lams, dtype=float))
+    k = np.arange(1, max_goals + 1, dtype=float)
+    steps = np.empty((len(lams), max_goals + 1))
+    steps[:, 0] = np.exp(-lams)
+    steps[:, 1:] = lams[:, None] / k[None, :]
+    return np.cumprod(steps, axis=1)
+
+
+def poisson_tail(lams, max_goals: int) -> np.ndarray:
+    """P(X > max_goals) for each lambda."""
+    return np.clip(1.0 - poisson_pmf(lams, max_goals).sum(axis=1), 0.0, 1.0)
+
+
+def adaptive_max_goals(lam_home, lam_away, tol: float = DEFAULT_TAIL_TOL,
+                       min_goals: int = 0, cap: int = MAX_GOALS_CAP) -> int:
+    """
+    Smallest G (>= min_goals, <= cap) such that the joint mass lost by
+    truncating both teams at G goals is below tol for every fixture.
+    """
+    # Đuôi P(X > G) tăng theo lambda nên chỉ cần xét lambda lớn nhất;
+    # mất mát của ma trận <= tail_home + tail_away, chia đều tol cho hai phía
+    lam = float(max(np.max(lam_home), np.max(lam_away)))
+    p = exp(-lam)
+    cdf = p
+    g = 0
+    while g < cap and (g < min_goals or 1.0 - cdf > tol / 2.0):
+        g += 1
+        p *= lam / g
+        cdf += p
+    return g
+
+
+@lru_cache(maxsize=64)
+def _shear_index(max_goals: int) -> Tuple[np.ndarray, np.ndarray]:
+    i, j = np.indices((max_goals + 1, max_goals + 1))
+    return i.ravel(), (i + j).ravel()
+
+
+def totals_from_matrix(mats: np.ndarray) -> np.ndarray:
+    """Total-goals distribution (sum of anti-diagonals) of one matrix or an (N, G+1, G+1) batch."""
+    single = mats.ndim == 2
+    if single:
+        mats = mats[None]
+    n, g1, _ = mats.shape
+    rows, cols = _shear_index(g1 - 1)
+    sheared = np.zeros((n, g1, 2 * g1 - 1))
+    sheared[:, rows, cols] = mats.reshape(n, -1)
+    totals = sheared.sum(axis=1)
+    return totals[0] if single else totals
+
+
+def totals_convolve(ph: np.ndarray, pa: np.ndarray) -> np.ndarray:
+    """Total-goals distribution of independent home/away pmfs (batched convolution)."""
+    ph = np.atleast_2d(ph)
+    pa = np.atleast_2d(pa)
+    g1 = ph.shape[1]
+    out = np.zeros((ph.shape[0], 2 * g1 - 1))
+    for k in range(g1):
+        out[:, k:k + g1] += ph[:, k:k + 1] * pa
+    return out
+
+
+def diff_correlate(ph: np.ndarray, pa: np.ndarray) -> np.ndarray:
+    """Goal-difference distribution of independent pmfs; column k is P(home - away = k - G)."""
+    ph = np.atleast_2d(ph)
+    pa = np.atleast_2d(pa)
+    g1 = ph.shape[1]
+    out = np.zeros((ph.shape[0], 2 * g1 - 1))
+    for j in range(g1):
+        out[:, g1 - 1 - j:2 * g1 - 1 - j] += ph * pa[:, j:j + 1]
+    return out
+
+
+def _skellam_upper(lh: np.ndarray, la: np.ndarray, max_diff: int) -> np.ndarray:
+    """
+    (N, max_diff+1) P(home - away = k) for k = 0..max_diff.
+
+    Seeds the two top orders exactly with the Bessel form
+    P(D = k) = exp(-(sqrt(lh) - sqrt(la))^2) * (lh/la)^(k/2) * ive(k, 2*sqrt(lh*la))
+    and fills the rest with the downward recurrence
+    lh * P(k-1) = k * P(k) + la * P(k+1), which is stable in that direction.
+    """
+    top = np.array([max_diff, max_diff + 1], dtype=float)
+    seed = (np.exp(-(np.sqrt(lh) - np.sqrt(la)) ** 2)[:, None] * np.sqrt(lh / la)[:, None] ** top
+            * ive(top, 2.0 * np.sqrt(lh * la)[:, None]))
+    out = np.empty((len(lh), max_diff + 2))
+    out[:, max_diff:] = seed
+    for k in range(max_diff, 0, -1):
+        out[:, k - 1] = (k * out[:, k] + la * out[:, k + 1]) / lh
+    # Hạt giống underflow (lambda gần 0): tính lại các hàng đó bằng tương quan pmf
+    bad = ~(seed[:, 0] > 0) | ~np.isfinite(out[:, 0])
+    if bad.any():
+        g = adaptive_max_goals(lh[bad], la[bad], min_goals=max_diff)
+        diff = diff_correlate(poisson_pmf(lh[bad], g), poisson_pmf(la[bad], g))
+        out[bad, :max_diff + 1] = diff[:, g:g + max_diff + 1]
+    return out[:, :max_diff + 1]
+
+
+def skellam_pmf(lam_home, lam_away, max_diff: int) -> np.ndarray:
+    """
+    (N, 2*max_diff+1) Skellam pmf; column k is P(home - away = k - max_diff).
+
+    Few fixtures: the Bessel form for every order. Batches: two Bessel
+    evaluations per side and fixture plus an O(max_diff) recurrence; the away
+    side uses P(D = -k | lh, la) = P(D = k | la, lh). Without scipy the
+    independent pmfs are correlated instead.
+    """
+    lh = np.asarray(lam_home, dtype=float).reshape(-1)
+    la = np.asarray(lam_away, dtype=float).reshape(-1)
+    if lh.shape != la.shape:
+        lh, la = np.broadcast_arrays(lh, la)
+    if ive is None:
+        g = adaptive_max_goals(lh, la, min_goals=max_diff)
+        diff = diff_correlate(poisson_pmf(lh, g), poisson_pmf(la, g))
+        return diff[:, g - max_diff:g + max_diff + 1]
+    n = len(lh)
+    if n < SKELLAM_RECURRENCE_MIN_ROWS:
+        # Dạng Bessel trực tiếp cho mọi bậc, trong không gian log để tránh inf * 0
+        k = np.arange(-max_diff, max_diff + 1, dtype=float)
+        with np.errstate(divide='ignore'):
+            log_p = (-(np.sqrt(lh) - np.sqrt(la)) ** 2)[:, None] + (k / 2.0) * np.log(lh / la)[:, None] \
+                + np.log(ive(np.abs(k), 2.0 * np.sqrt(lh * la)[:, None]))
+        return np.exp(log_p)
+    upper = _skellam_upper(np.concatenate([lh, la]), np.concatenate([la, lh]), max_diff)
+    return np.concatenate([upper[n:, :0:-1], upper[:n]], axis=1)
+
+
+def top_k_scorelines(mat: np.ndarray, n: int = 5) -> List[Tuple[str, float]]:
+    """Top-n scorelines of one matrix; ties keep row-major order."""
+    g1 = mat.shape[1]
+    flat = mat.ravel()
+    n = min(n, flat.size)
+    part = np.argpartition(-flat, n - 1)[:n]
+    order = np.lexsort((part, -flat[part]))
+    return [(f"{k // g1}-{k % g1}", float(flat[k])) for k in part[order]]
+
+
+if __name__ == '__main__':
+    import timeit
+    from math import factorial
+
+    # Previous implementations (per-element factorial, nested loops, full sort)
+    def _legacy_pmf(lmbda, k):
+        return (lmbda ** k) * exp(-lmbda) / factorial(k)
+
+    def _legacy_matrix(lh, la, g):
+        i = np.arange(0, g + 1)
+        return np.outer(np.array([_legacy_pmf(lh, k) for k in i]), np.array([_legacy_pmf(la, k) for k in i]))
+
+    def _legacy_totals(prob):
+        g = prob.shape[0] - 1
+        totals = np.zeros(2 * g + 1)
+        for h in range(g + 1):
+            for a in range(g + 1):
+                totals[h + a] += prob[h, a]
+        return totals
+
+    def _legacy_top(prob, n=5):
+        g = prob.shape[0] - 1
+        pairs = [(f"{h}-{a}", float(prob[h, a])) for h in range(g + 1) for a in range(g + 1)]
+        pairs.sort(key=lambda x: x[1], reverse=True)
+        return pairs[:n]
+
+    lh, la, g = 1.7, 1.2, 10
+    m = _legacy_matrix(lh, la, g)
+    _i, _j = np.indices((g + 1, g + 1))
+    _diff_reducer = np.zeros(((g + 1) ** 2, 2 * g + 1))
+    _diff_reducer[np.arange((g + 1) ** 2), (_i - _j + g).ravel()] = 1.0
+    assert np.allclose(poisson_pmf([lh, la], g)[0][:, None] * poisson_pmf([lh, la], g)[1][None, :], m)
+    assert np.allclose(totals_from_matrix(m), _legacy_totals(m))
+    assert top_k_scorelines(m) == _legacy_top(m)
+
+    def bench(label, fn, number=2000):
+        t = timeit.timeit(fn, number=number) / number * 1e6
+        print(f"{label:42s} {t:9.1f} us")
+
+    print(f"Single fixture, G={g}")
+    bench('legacy matrix (factorial per cell)', lambda: _legacy_matrix(lh, la, g))
+    bench('kernel matrix (recurrence)', lambda: np.multiply.outer(*poisson_pmf([lh, la], g)))
+    bench('legacy totals (double loop)', lambda: _legacy_totals(m))
+    bench('kernel totals (diagonal sums)', lambda: totals_from_matrix(m))
+    bench('legacy top-5 (format + sort all)', lambda: _legacy_top(m))
+    bench('kernel top-5 (argpartition)', lambda: top_k_scorelines(m))
+    bench('adaptive_max_goals', lambda: adaptive_max_goals(lh, la))
+
+    rng = np.random.default_rng(0)
+    lams_h, lams_a = rng.uniform(0.5, 3.5, 380), rng.uniform(0.5, 3.0, 380)
+    print("\nFull season (380 fixtures)")
+    bench('legacy matrices + totals', lambda: [_legacy_totals(_legacy_matrix(a, b, g)) for a, b in zip(lams_h, lams_a)], number=5)
+    bench('kernel pmfs + convolution', lambda: totals_convolve(poisson_pmf(lams_h, g), poisson_pmf(lams_a, g)), number=200)
+
+    print("\nGoal difference, single fixture (G=10)")
+    bench('matrix + diagonal reducer', lambda: np.multiply.outer(*poisson_pmf([lh, la], g)).ravel() @ _diff_reducer)
+    bench('skellam_pmf (closed form)', lambda: skellam_pmf(lh, la, g))
+    gs = adaptive_max_goals(lams_h, lams_a)
+    _i, _j = np.indices((gs + 1, gs + 1))
+    _season_reducer = np.zeros(((gs + 1) ** 2, 2 * gs + 1))
+    _season_reducer[np.arange((gs + 1) ** 2), (_i - _j + gs).ravel()] = 1.0
+    print(f"Goal difference, full season (380 fixtures, adaptive G={gs})")
+    bench('matrices + diagonal reducer', lambda: (poisson_pmf(lams_h, gs)[:, :, None]
+                                                  * poisson_pmf(lams_a, gs)[:, None, :]).reshape(380, -1) @ _season_reducer,
+          number=100)
+    bench('skellam_pmf (closed form)', lambda: skellam_pmf(lams_h, lams_a, gs), number=100)
+
+    for lam in (1.5, 3.0, 5.0):
+        g_auto = adaptive_max_goals(lam, lam)
+        print(f"lambda={lam}: tail lost at G=6 {2 * poisson_tail(lam, 6)[0]:.2e}, "
+              f"adaptive G={g_auto} loses {2 * poisson_tail(lam, g_auto)[0]:.2e}")
@@ -1,93 +1,576 @@
 """
-poisson_model.py - Poisson-based scoreline probability model (Dixon-Coles style)
+poisson_model.py - Poisson-based scoreline probability model (Dixon-Coles)
 
 Provides utilities to fit team attack/defense strengths from historical dataset
-and to compute scoreline probabilities for a given match-up.
+and to compute scoreline probabilities for a given match-up. Strengths are fit
+by Dixon-Coles maximum likelihood (with the low-score rho correction and
+optional time decay) when scipy is available, otherwise by ratio averages.
+
+The fitted strengths (poisson_strengths.pkl, shipped with the repo) are only
+rewritten by full fits. Results settled online live in a separate, untracked
+overlay (ONLINE_PATH) layered over that fit; readers use the overlay while it
+was built on the current fit, and it is rebuilt when the fit changes.
 """
 
 from __future__ import annotations
 
+import copy
+import logging
 import os
 import pickle
-from typing import Dict, Tuple
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from math import exp
+from typing import Dict, Iterable, Optional, Sequence, Tuple
 
 import numpy as np
 import pandas as pd
-from math import exp, factorial
+
+from artifact_cache import fingerprint, load_artifact
+from poisson_kernels import (poisson_pmf, totals_from_matrix, top_k_scorelines,
+                             adaptive_max_goals, skellam_pmf, DEFAULT_TAIL_TOL)
+
+try:
+    from scipy.optimize import minimize
+except ImportError:  # scipy optional: fall back to ratio strengths
+    minimize = None
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
 
 DATASET_PATH = 'master_dataset.csv'
 CACHE_PATH = 'poisson_strengths.pkl'
+# Trạng thái online (kết quả đã chốt + các bước SGD), không track trong git
+ONLINE_PATH = os.getenv('POISSON_ONLINE_PATH', 'poisson_online.pkl')
+# Tăng khi thay đổi cách fit làm kết quả khác đi (cache sẽ tự fit lại)
+STRENGTHS_CODE_VERSION = '2'
 
+# Online updates: bước gradient mỗi kết quả, refit toàn bộ sau N cập nhật
+ONLINE_LEARNING_RATE = 0.03
+REFIT_EVERY = 20
+_MAX_APPLIED_KEYS = 5000
+_CACHE_LOCK = threading.Lock()
 
-def _poisson_pmf(lmbda: float, k: int) -> float:
-    return (lmbda ** k) * exp(-lmbda) / factorial(k)
+
+def match_weights(df: pd.DataFrame, half_life_days: Optional[float] = None,
+                  reference_date=None) -> np.ndarray:
+    """
+    Exponential time-decay weight per match: 0.5 ** (age_days / half_life_days).
+    Age is measured from reference_date (default: latest match in df). Without
+    a half-life, or without a parseable Date column, every match weighs 1.
+    """
+    if not half_life_days or 'Date' not in df.columns:
+        return np.ones(len(df))
+    dates = pd.to_datetime(df['Date'], dayfirst=True, errors='coerce')
+    if dates.isna().all():
+        return np.ones(len(df))
+    dates = dates.fillna(dates.min())
+    ref = pd.Timestamp(reference_date) if reference_date is not None else dates.max()
+    age_days = np.clip((ref - dates).dt.days.to_numpy(dtype=float), 0.0, None)
+    return np.power(0.5, age_days / float(half_life_days))
 
 
-def compute_strengths(df: pd.DataFrame) -> Tuple[Dict[str, Dict[str, float]], float, float]:
+def compute_strengths(df: pd.DataFrame, half_life_days: Optional[float] = None,
+                      seasons: Optional[Iterable] = None,
+                      reference_date=None) -> Tuple[Dict[str, Dict[str, float]], float, float]:
     """
     Compute team attack/defense strengths using league averages.
     Returns (strengths, mu_home, mu_away)
     strengths[team] = {
        'home_attack', 'home_defense', 'away_attack', 'away_defense'
     }
+
+    All rates come from one weighted group-by over home and away rows.
+    half_life_days enables exponential time decay by match date; seasons
+    restricts the data to the given Season values (e.g. [2223, 2324]).
     """
     # Filter needed columns
     cols = ['HomeTeam', 'AwayTeam', 'FTHG', 'FTAG']
-    df = df.dropna(subset=cols)[cols].copy()
+    if seasons is not None and 'Season' in df.columns:
+        wanted = {str(s) for s in seasons}
+        df = df[df['Season'].astype(str).isin(wanted)]
+    df = df.dropna(subset=cols)
 
-    # League averages
-    mu_home = df['FTHG'].mean()
-    mu_away = df['FTAG'].mean()
+    w = match_weights(df, half_life_days, reference_date)
+    hg = df['FTHG'].to_numpy(dtype=float)
+    ag = df['FTAG'].to_numpy(dtype=float)
 
-    strengths: Dict[str, Dict[str, float]] = {}
+    # League averages (weighted)
+    total_w = w.sum()
+    mu_home = float((w * hg).sum() / total_w) if total_w > 0 else 0.0
+    mu_away = float((w * ag).sum() / total_w) if total_w > 0 else 0.0
 
     teams = pd.unique(pd.concat([df['HomeTeam'], df['AwayTeam']]))
+    home = pd.DataFrame({'w': w, 'gf': w * hg, 'ga': w * ag}).groupby(df['HomeTeam'].to_numpy()).sum().reindex(teams, fill_value=0.0)
+    away = pd.DataFrame({'w': w, 'gf': w * ag, 'ga': w * hg}).groupby(df['AwayTeam'].to_numpy()).sum().reindex(teams, fill_value=0.0)
 
-    for team in teams:
-        home_matches = df[df['HomeTeam'] == team]
-        away_matches = df[df['AwayTeam'] == team]
+    def _rate(frame: pd.DataFrame, col: str) -> np.ndarray:
+        weight = frame['w'].to_numpy()
+        return np.divide(frame[col].to_numpy(), weight, out=np.zeros(len(frame)), where=weight > 0)
 
-        # Avoid division by zero
-        home_count = max(1, len(home_matches))
-        away_count = max(1, len(away_matches))
+    def _relative(rate: np.ndarray, mu: float) -> np.ndarray:
+        return rate / mu if mu > 0 else np.ones_like(rate)
 
-        home_gf = home_matches['FTHG'].sum() / home_count
-        home_ga = home_matches['FTAG'].sum() / home_count
-        away_gf = away_matches['FTAG'].sum() / away_count
-        away_ga = away_matches['FTHG'].sum() / away_count
+    home_attack = _relative(_rate(home, 'gf'), mu_home)
+    home_defense = _relative(_rate(home, 'ga'), mu_away)
+    away_attack = _relative(_rate(away, 'gf'), mu_away)
+    away_defense = _relative(_rate(away, 'ga'), mu_home)
 
-        strengths[team] = {
-            'home_attack': (home_gf / mu_home) if mu_home > 0 else 1.0,
-            'home_defense': (home_ga / mu_away) if mu_away > 0 else 1.0,
-            'away_attack': (away_gf / mu_away) if mu_away > 0 else 1.0,
-            'away_defense': (away_ga / mu_home) if mu_home > 0 else 1.0,
+    strengths: Dict[str, Dict[str, float]] = {
+        team: {
+            'home_attack': float(home_attack[i]),
+            'home_defense': float(home_defense[i]),
+            'away_attack': float(away_attack[i]),
+            'away_defense': float(away_defense[i]),
         }
+        for i, team in enumerate(teams)
+    }
 
     return strengths, mu_home, mu_away
 
 
-def load_or_fit_strengths(force: bool = False) -> Tuple[Dict[str, Dict[str, float]], float, float]:
-    if not force and os.path.exists(CACHE_PATH):
+def _dc_unpack(theta: np.ndarray, n_teams: int):
+    attack = theta[:n_teams]
+    defense = theta[n_teams:2 * n_teams]
+    intercept, home, rho = theta[2 * n_teams:]
+    return attack, defense, intercept, home, rho
+
+
+def _dc_neg_loglik(theta: np.ndarray, home_idx: np.ndarray, away_idx: np.ndarray,
+                   x: np.ndarray, y: np.ndarray, w: np.ndarray, n_teams: int) -> Tuple[float, np.ndarray]:
+    """
+    Weighted Dixon-Coles negative log-likelihood and its gradient.
+
+    log lam = intercept + home + attack[h] + defense[a]
+    log mu  = intercept + attack[a] + defense[h]
+    tau corrects the 0-0, 0-1, 1-0 and 1-1 cells with rho. Two quadratic
+    penalties pin sum(attack) = sum(defense) = 0 (the likelihood is flat
+    along those directions otherwise).
+    """
+    attack, defense, intercept, home, rho = _dc_unpack(theta, n_teams)
+    log_lam = intercept + home + attack[home_idx] + defense[away_idx]
+    log_mu = intercept + attack[away_idx] + defense[home_idx]
+    lam = np.exp(log_lam)
+    mu = np.exp(log_mu)
+
+    c00 = (x == 0) & (y == 0)
+    c01 = (x == 0) & (y == 1)
+    c10 = (x == 1) & (y == 0)
+    c11 = (x == 1) & (y == 1)
+    tau = np.ones_like(lam)
+    tau[c00] = 1.0 - lam[c00] * mu[c00] * rho
+    tau[c01] = 1.0 + lam[c01] * rho
+    tau[c10] = 1.0 + mu[c10] * rho
+    tau[c11] = 1.0 - rho
+    tau = np.maximum(tau, 1e-10)
+
+    # d log(tau) / d lam, d mu, d rho
+    dtau_lam = np.zeros_like(lam)
+    dtau_mu = np.zeros_like(lam)
+    dtau_rho = np.zeros_like(lam)
+    dtau_lam[c00] = -mu[c00] * rho
+    dtau_mu[c00] = -lam[c00] * rho
+    dtau_rho[c00] = -lam[c00] * mu[c00]
+    dtau_lam[c01] = rho
+    dtau_rho[c01] = lam[c01]
+    dtau_mu[c10] = rho
+    dtau_rho[c10] = mu[c10]
+    dtau_rho[c11] = -1.0
+    dtau_lam /= tau
+    dtau_mu /= tau
+    dtau_rho /= tau
+
+    ll = w * (np.log(tau) + x * log_lam - lam + y * log_mu - mu)
+
+    # Gradient wrt the linear predictors, then scatter to team parameters
+    g_lam = w * (x - lam + lam * dtau_lam)
+    g_mu = w * (y - mu + mu * dtau_mu)
+    grad = np.empty_like(theta)
+    grad[:n_teams] = (np.bincount(home_idx, g_lam, n_teams) + np.bincount(away_idx, g_mu, n_teams))
+    grad[n_teams:2 * n_teams] = (np.bincount(away_idx, g_lam, n_teams) + np.bincount(home_idx, g_mu, n_teams))
+    grad[2 * n_teams] = g_lam.sum() + g_mu.sum()
+    grad[2 * n_teams + 1] = g_lam.sum()
+    grad[2 * n_teams + 2] = (w * dtau_rho).sum()
+
+    sa, sd = attack.sum(), defense.sum()
+    penalty = sa ** 2 + sd ** 2
+    grad = -grad
+    grad[:n_teams] += 2.0 * sa
+    grad[n_teams:2 * n_teams] += 2.0 * sd
+    return float(-ll.sum() + penalty), grad
+
+
+def fit_dixon_coles(df: pd.DataFrame, half_life_days: Optional[float] = None,
+                    seasons: Optional[Iterable] = None, reference_date=None,
+                    init: Optional[Dict] = None) -> Dict:
+    """
+    Maximum-likelihood Dixon-Coles fit (attack, defense, home advantage, rho).
+
+    init: a previous fit (the dict returned here / stored as 'fit' in the
+    strengths cache). Known teams start from their previous values, which
+    makes weekly refits converge in a few iterations.
+    Returns {'teams', 'attack', 'defense', 'intercept', 'home', 'rho', ...}.
+    """
+    if minimize is None:
+        raise ImportError('scipy is required for the Dixon-Coles fit')
+
+    cols = ['HomeTeam', 'AwayTeam', 'FTHG', 'FTAG']
+    if seasons is not None and 'Season' in df.columns:
+        wanted = {str(s) for s in seasons}
+        df = df[df['Season'].astype(str).isin(wanted)]
+    df = df.dropna(subset=cols)
+
+    teams = list(pd.unique(pd.concat([df['HomeTeam'], df['AwayTeam']])))
+    index = {t: i for i, t in enumerate(teams)}
+    n = len(teams)
+    home_idx = df['HomeTeam'].map(index).to_numpy()
+    away_idx = df['AwayTeam'].map(index).to_numpy()
+    x = df['FTHG'].to_numpy(dtype=float)
+    y = df['FTAG'].to_numpy(dtype=float)
+    w = match_weights(df, half_life_days, reference_date)
+
+    theta0 = np.zeros(2 * n + 3)
+    theta0[2 * n] = np.log(max(np.average(y, weights=w), 0.05))
+    theta0[2 * n + 1] = np.log(max(np.average(x, weights=w), 0.05)) - theta0[2 * n]
+    if init:
+        prev = {t: i for i, t in enumerate(init.get('teams', []))}
+        for t, i in index.items():
+            if t in prev:
+                theta0[i] = init['attack'][prev[t]]
+                theta0[n + i] = init['defense'][prev[t]]
+        theta0[2 * n:] = init['intercept'], init['home'], init['rho']
+
+    bounds = [(None, None)] * (2 * n + 2) + [(-0.3, 0.3)]
+    res = minimize(_dc_neg_loglik, theta0, args=(home_idx, away_idx, x, y, w, n),
+                   jac=True, method='L-BFGS-B', bounds=bounds)
+    attack, defense, intercept, home, rho = _dc_unpack(res.x, n)
+    return {
+        'teams': teams,
+        'attack': attack.tolist(),
+        'defense': defense.tolist(),
+        'intercept': float(intercept),
+        'home': float(home),
+        'rho': float(rho),
+        'neg_loglik': float(res.fun),
+        'iterations': int(res.nit),
+        'converged': bool(res.success),
+    }
+
+
+def dixon_coles_strengths(fit: Dict) -> Tuple[Dict[str, Dict[str, float]], float, float]:
+    """
+    Express a Dixon-Coles fit in the (strengths, mu_home, mu_away) interface,
+    so that expected_goals() reproduces lam = exp(c + home + att_h + def_a).
+    """
+    strengths = {}
+    for t, att, dfn in zip(fit['teams'], fit['attack'], fit['defense']):
+        strengths[t] = {
+            'home_attack': float(np.exp(att)),
+            'away_attack': float(np.exp(att)),
+            'home_defense': float(np.exp(dfn)),
+            'away_defense': float(np.exp(dfn)),
+        }
+    mu_home = float(np.exp(fit['intercept'] + fit['home']))
+    mu_away = float(np.exp(fit['intercept']))
+    return strengths, mu_home, mu_away
+
+
+def _read_cache(path: Optional[str] = None) -> Optional[Dict]:
+    path = path or CACHE_PATH
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except Exception as e:
+        logger.warning(f'Cannot read strengths cache {path}: {e}')
+        return None
+
+
+def _write_cache(payload: Dict, path: Optional[str] = None) -> bool:
+    """
+    Atomic write (tmp file + rename) so readers never see a half-written pickle.
+    The tmp name is per process/thread so concurrent writers never share it.
+    """
+    path = path or CACHE_PATH
+    tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with open(tmp, 'wb') as f:
+            pickle.dump(payload, f)
+        os.replace(tmp, path)
+        return True
+    except Exception as e:
+        logger.error(f'Cannot write strengths cache {path}: {e}')
         try:
-            with open(CACHE_PATH, 'rb') as f:
-                data = pickle.load(f)
-                return data['strengths'], data['mu_home'], data['mu_away']
-        except Exception:
+            os.remove(tmp)
+        except OSError:
             pass
+        return False
 
+
+@contextmanager
+def _strengths_lock(path: Optional[str] = None):
+    """
+    Exclusive lock around read-modify-write of the strengths cache: a thread lock
+    for this process plus a lock file (<path>.lock) for other processes (bot,
+    settlement scheduler, scripts), so no process loses another's update.
+    """
+    lock_path = f'{path or CACHE_PATH}.lock'
+    with _CACHE_LOCK, open(lock_path, 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:  # LK_LOCK gives up after ~10s: keep waiting
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _training_frame(params: Dict, online_results: Sequence[Dict]) -> pd.DataFrame:
+    """master_dataset.csv (season-filtered) plus results settled online since."""
     if not os.path.exists(DATASET_PATH):
         raise FileNotFoundError('master_dataset.csv not found')
-
     df = pd.read_csv(DATASET_PATH)
-    strengths, mu_home, mu_away = compute_strengths(df)
+    if params.get('seasons') is not None and 'Season' in df.columns:
+        df = df[df['Season'].astype(str).isin(set(params['seasons']))]
+    if online_results:
+        extra = pd.DataFrame(online_results)[['Date', 'HomeTeam', 'AwayTeam', 'FTHG', 'FTAG']]
+        # Trận đã có trong dataset (dataset được cập nhật sau) không tính hai lần
+        known = set(zip(df['Date'].astype(str), df['HomeTeam'], df['AwayTeam']))
+        extra = extra[[k not in known for k in zip(extra['Date'], extra['HomeTeam'], extra['AwayTeam'])]]
+        df = pd.concat([df, extra], ignore_index=True)
+    return df
+
+
+def strengths_fingerprint(params: Dict) -> str:
+    """Fingerprint of the dataset content, fitting code version and fit parameters."""
+    return fingerprint([DATASET_PATH], STRENGTHS_CODE_VERSION, params)
+
+
+def _fit_payload(params: Dict, previous: Optional[Dict], online: bool = True) -> Dict:
+    """
+    Full fit warm-started from `previous`, continuing its version counter.
+    online=True (the overlay) also trains on and carries over its online results
+    and applied keys; online=False is the plain dataset fit kept at CACHE_PATH.
+    """
+    previous = previous or {}
+    online_results = previous.get('online_results', []) if online else []
+    df = _training_frame(params, online_results)
+    payload = {
+        'params': params,
+        'fingerprint': strengths_fingerprint(params),
+        'version': previous.get('version', 0) + 1,
+        'online_results': online_results,
+        'applied_keys': previous.get('applied_keys', []) if online else [],
+        'updates_since_refit': 0,
+    }
+    if params['method'] == 'dixon_coles':
+        fit = fit_dixon_coles(df, half_life_days=params['half_life_days'], init=previous.get('fit'))
+        strengths, mu_home, mu_away = dixon_coles_strengths(fit)
+        payload.update({'fit': fit, 'rho': fit['rho']})
+    else:
+        strengths, mu_home, mu_away = compute_strengths(df, half_life_days=params['half_life_days'])
+    payload.update({'strengths': strengths, 'mu_home': mu_home, 'mu_away': mu_away})
+    return payload
+
+
+def _default_params(half_life_days: Optional[float] = None, seasons: Optional[Iterable] = None,
+                    method: Optional[str] = None) -> Dict:
+    if method is None:
+        method = 'dixon_coles' if minimize is not None else 'ratio'
+    return {'half_life_days': half_life_days,
+            'seasons': sorted(str(s) for s in seasons) if seasons is not None else None,
+            'method': method}
+
+
+def _matches(data: Dict, params: Dict) -> bool:
+    """True when a cached payload was fitted with `params` on the current dataset and code."""
+    cached_params = data.get('params', {'half_life_days': None, 'seasons': None})
+    return (dict({'method': 'ratio'}, **cached_params) == params
+            and data.get('fingerprint') == strengths_fingerprint(params))
+
+
+def _base_id(base: Dict) -> Tuple:
+    """Identity of a fitted payload; an overlay records the one it was built on."""
+    return base.get('fingerprint'), base.get('version')
+
+
+def _layer_online(base: Dict, overlay: Optional[Dict]) -> Dict:
+    """
+    Overlay on top of the fitted `base`: a copy of it while there is no online
+    state yet, otherwise a refit over the dataset plus the old overlay's online
+    results (the fit changed underneath them).
+    """
+    overlay = overlay or {}
+    version = max(int(base.get('version', 0)), int(overlay.get('version', 0)))
+    if overlay.get('online_results'):
+        params = dict({'method': 'ratio'}, **base.get('params', {'half_life_days': None, 'seasons': None}))
+        payload = _fit_payload(params, dict(overlay, fit=base.get('fit'), version=version))
+    else:
+        payload = copy.deepcopy(base)
+        payload.update({'version': version, 'online_results': [],
+                        'applied_keys': list(overlay.get('applied_keys', [])), 'updates_since_refit': 0})
+    payload['base'] = _base_id(base)
+    return payload
+
+
+def _current(online_path: Optional[str] = None) -> Optional[Dict]:
+    """The online overlay when it is layered on the current fit, otherwise the fit itself."""
+    base = load_artifact(CACHE_PATH)
+    if base is None:
+        return None
+    overlay = load_artifact(online_path or ONLINE_PATH)
+    if overlay is not None and overlay.get('base') == _base_id(base):
+        return overlay
+    return base
+
 
+def load_or_fit_strengths(force: bool = False, half_life_days: Optional[float] = None,
+                          seasons: Optional[Iterable] = None, method: Optional[str] = None,
+                          online_path: Optional[str] = None) -> Tuple[Dict[str, Dict[str, float]], float, float]:
+    """
+    Load cached strengths (with the online overlay on top), refitting when
+    forced, when the cache was fitted with different settings, or when
+    master_dataset.csv / the fitting code changed since. method: 'dixon_coles'
+    (default when scipy is available) or 'ratio'. A Dixon-Coles refit
+    warm-starts from the cached fit; a stale overlay is rebuilt on the new fit.
+    """
+    params = _default_params(half_life_days, seasons, method)
+    online_path = online_path or ONLINE_PATH
+    if not force:
+        base = load_artifact(CACHE_PATH)
+        if base is not None and _matches(base, params):
+            overlay = load_artifact(online_path)
+            if overlay is None or overlay.get('base') == _base_id(base):
+                data = overlay or base
+                return data['strengths'], data['mu_home'], data['mu_away']
+
+    with _strengths_lock():
+        base, overlay = _read_cache(), _read_cache(online_path)
+        # Process khác có thể vừa fit xong trong lúc chờ lock
+        if force or base is None or not _matches(base, params):
+            # Version tiếp nối cả overlay để không bao giờ lùi
+            version = max(int((base or {}).get('version', 0)), int((overlay or {}).get('version', 0)))
+            base = _fit_payload(params, dict(base or {}, version=version), online=False)
+            _write_cache(base)
+        if overlay is not None and overlay.get('base') != _base_id(base):
+            overlay = _layer_online(base, overlay)
+            _write_cache(overlay, online_path)
+    data = overlay or base
+    return data['strengths'], data['mu_home'], data['mu_away']
+
+
+def strengths_version(online_path: Optional[str] = None) -> int:
+    """Version counter of the strengths in use (bumped by every fit and online update)."""
+    data = _current(online_path)
+    return int(data.get('version', 0)) if data else 0
+
+
+def _online_step(payload: Dict, home: str, away: str, home_goals: int, away_goals: int,
+                 learning_rate: float) -> None:
+    """
+    One stochastic-gradient step of the Poisson log-likelihood for a single
+    match: only the two teams' attack/defense move, O(1) per result.
+    """
+    fit = payload['fit']
+    for team in (home, away):
+        if team not in fit['teams']:
+            # Đội mới (thăng hạng): bắt đầu từ mức trung bình
+            fit['teams'].append(team)
+            fit['attack'].append(0.0)
+            fit['defense'].append(0.0)
+    h, a = fit['teams'].index(home), fit['teams'].index(away)
+    att, dfn = fit['attack'], fit['defense']
+    lam = np.exp(fit['intercept'] + fit['home'] + att[h] + dfn[a])
+    mu = np.exp(fit['intercept'] + att[a] + dfn[h])
+    g_lam = learning_rate * (home_goals - lam)
+    g_mu = learning_rate * (away_goals - mu)
+    att[h], dfn[a] = att[h] + g_lam, dfn[a] + g_lam
+    att[a], dfn[h] = att[a] + g_mu, dfn[h] + g_mu
+    for i in (h, a):
+        payload['strengths'][fit['teams'][i]] = {
+            'home_attack': float(np.exp(att[i])),
+            'away_attack': float(np.exp(att[i])),
+            'home_defense': float(np.exp(dfn[i])),
+            'away_defense': float(np.exp(dfn[i])),
+        }
+
+
+def update_strengths_online(home_team: str, away_team: str, home_goals: int, away_goals: int,
+                            result_key: Optional[str] = None, match_date=None,
+                            learning_rate: float = ONLINE_LEARNING_RATE,
+                            refit_every: int = REFIT_EVERY, online_path: Optional[str] = None) -> int:
+    """
+    Fold one settled result into the online overlay and return the new version.
+
+    Team names must already be canonical (dataset names). result_key dedupes
+    repeated settlements of the same match. Every `refit_every` online updates
+    a full warm-started refit over master_dataset.csv plus all online results
+    corrects the drift of the incremental rule. Only the overlay at
+    `online_path` (default ONLINE_PATH) is written, never the fitted cache
+    unless it is missing. The whole read-step-write runs under a cross-process
+    lock; if the write fails the previous version is returned.
+    """
+    online_path = online_path or ONLINE_PATH
+    with _strengths_lock():
+        base = _read_cache()
+        if base is None:
+            base = _fit_payload(_default_params(), None, online=False)
+            _write_cache(base)
+        payload = _read_cache(online_path)
+        if payload is None or payload.get('base') != _base_id(base):
+            payload = _layer_online(base, payload)
+        if result_key is not None and result_key in payload['applied_keys']:
+            return int(payload.get('version', 0))
+
+        date = pd.Timestamp(match_date) if match_date is not None else pd.Timestamp.now()
+        payload['online_results'].append({
+            'Date': date.strftime('%d/%m/%Y'),
+            'HomeTeam': home_team, 'AwayTeam': away_team,
+            'FTHG': int(home_goals), 'FTAG': int(away_goals),
+        })
+        if result_key is not None:
+            payload['applied_keys'] = (payload['applied_keys'] + [result_key])[-_MAX_APPLIED_KEYS:]
+
+        payload['updates_since_refit'] = payload.get('updates_since_refit', 0) + 1
+        previous_version = int(payload.get('version', 0))
+        params = dict({'method': 'ratio'}, **payload.get('params', {'half_life_days': None, 'seasons': None}))
+        if payload['updates_since_refit'] >= refit_every:
+            payload = _fit_payload(params, payload)
+            payload['base'] = _base_id(base)
+        else:
+            if 'fit' in payload:
+                _online_step(payload, home_team, away_team, home_goals, away_goals, learning_rate)
+            payload['version'] = payload.get('version', 0) + 1
+        if not _write_cache(payload, online_path):
+            return previous_version
+        return int(payload['version'])
+
+
+def load_rho(online_path: Optional[str] = None) -> float:
+    """Dixon-Coles low-score correction of the strengths in use (0.0 = plain Poisson)."""
+    data = _current(online_path)
     try:
-        with open(CACHE_PATH, 'wb') as f:
-            pickle.dump({'strengths': strengths, 'mu_home': mu_home, 'mu_away': mu_away}, f)
+        return float(data.get('rho', 0.0)) if data else 0.0
     except Exception:
-        pass
-
-    return strengths, mu_home, mu_away
+        return 0.0
 
 
 def expected_goals(home_team: str, away_team: str, strengths: Dict[str, Dict[str, float]], mu_home: float, mu_away: float) -> Tuple[float, float]:
@@ -102,24 +585,126 @@ def expected_goals(home_team: str, away_team: str, strengths: Dict[str, Dict[str
     return max(mu_home, 0.05), max(mu_away, 0.05)
 
 
-def score_matrix(lam_home: float, lam_away: float, max_goals: int = 6) -> np.ndarray:
-    """Return matrix P[i,j] = P(home=i, away=j)"""
-    i = np.arange(0, max_goals + 1)
-    ph = np.array([_poisson_pmf(lam_home, k) for k in i])
-    pa = np.array([_poisson_pmf(lam_away, k) for k in i])
-    return np.outer(ph, pa)
+def expected_goals_batch(home_teams, away_teams, strengths: Dict[str, Dict[str, float]],
+                         mu_home: float, mu_away: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Vectorized `expected_goals` for N fixtures (e.g. a gameweek or all home/away pairs)."""
+    neutral = {'home_attack': np.nan, 'home_defense': np.nan, 'away_attack': np.nan, 'away_defense': np.nan}
+    sh = [strengths.get(t, neutral) for t in home_teams]
+    sa = [strengths.get(t, neutral) for t in away_teams]
+    ha = np.array([s['home_attack'] for s in sh], dtype=float)
+    hd = np.array([s['home_defense'] for s in sh], dtype=float)
+    aa = np.array([s['away_attack'] for s in sa], dtype=float)
+    ad = np.array([s['away_defense'] for s in sa], dtype=float)
+    lam_home = mu_home * ha * ad
+    lam_away = mu_away * aa * hd
+    # Fallback to league averages when either team is unknown (same as expected_goals)
+    missing = np.isnan(lam_home) | np.isnan(lam_away)
+    lam_home = np.where(missing, mu_home, lam_home)
+    lam_away = np.where(missing, mu_away, lam_away)
+    return np.maximum(lam_home, 0.05), np.maximum(lam_away, 0.05)
+
+
+def score_matrix(lam_home: float, lam_away: float, max_goals: Optional[int] = None) -> np.ndarray:
+    """Return matrix P[i,j] = P(home=i, away=j); max_goals=None picks it from the lambdas."""
+    return score_matrices(lam_home, lam_away, max_goals=max_goals)[0]
+
+
+# ----------------------------------------------------------------------------
+# Batch API: N fixtures at once via broadcasting
+# ----------------------------------------------------------------------------
+
+def poisson_pmf_table(lams, max_goals: int = 6) -> np.ndarray:
+    """(N, max_goals+1) table of Poisson pmfs for an array of rates."""
+    return poisson_pmf(np.maximum(np.atleast_1d(np.asarray(lams, dtype=float)), 1e-12), max_goals)
+
+
+def score_matrices(lam_home, lam_away, max_goals: Optional[int] = None, rho: float = 0.0) -> np.ndarray:
+    """
+    Score tensor for N fixtures: out[n, i, j] = P(home=i, away=j) for fixture n.
+    lam_home / lam_away are scalars or arrays of length N; rho != 0 applies the
+    Dixon-Coles low-score correction to the 0-0, 0-1, 1-0 and 1-1 cells.
+    max_goals=None truncates adaptively so the lost tail mass stays below
+    DEFAULT_TAIL_TOL (never fewer than 6 goals).
+    """
+    if max_goals is None:
+        max_goals = adaptive_max_goals(lam_home, lam_away, min_goals=6)
+    ph = poisson_pmf_table(lam_home, max_goals)
+    pa = poisson_pmf_table(lam_away, max_goals)
+    mats = ph[:, :, None] * pa[:, None, :]
+    if rho and max_goals >= 1:
+        lh = ph[:, 1] / np.maximum(ph[:, 0], 1e-300)  # = lambda_home
+        la = pa[:, 1] / np.maximum(pa[:, 0], 1e-300)  # = lambda_away
+        mats[:, 0, 0] *= np.maximum(1.0 - lh * la * rho, 0.0)
+        mats[:, 0, 1] *= np.maximum(1.0 + lh * rho, 0.0)
+        mats[:, 1, 0] *= np.maximum(1.0 + la * rho, 0.0)
+        mats[:, 1, 1] *= max(1.0 - rho, 0.0)
+    return mats
+
+
+@lru_cache(maxsize=32)
+def _reducer(max_goals: int, kind: str) -> np.ndarray:
+    """One-hot ((G+1)^2, 2G+1) map from flattened scorelines to totals or goal diff."""
+    i, j = np.indices((max_goals + 1, max_goals + 1))
+    idx = (i + j) if kind == 'totals' else (i - j + max_goals)
+    out = np.zeros(((max_goals + 1) ** 2, 2 * max_goals + 1))
+    out[np.arange(out.shape[0]), idx.ravel()] = 1.0
+    out.setflags(write=False)
+    return out
+
+
+def batch_totals(mats: np.ndarray) -> np.ndarray:
+    """(N, 2G+1) total-goals distributions from an (N, G+1, G+1) score tensor."""
+    n, g1, _ = mats.shape
+    return mats.reshape(n, -1) @ _reducer(g1 - 1, 'totals')
+
+
+def batch_goal_diff(mats: np.ndarray) -> np.ndarray:
+    """(N, 2G+1) goal-difference distributions; column k is P(home - away = k - G)."""
+    n, g1, _ = mats.shape
+    return mats.reshape(n, -1) @ _reducer(g1 - 1, 'diff')
+
+
+def batch_ou_probabilities(totals: np.ndarray, line: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Vectorized `_ou_from_totals`: (over, under, push) arrays of length N."""
+    line = float(line)
+    base = int(np.floor(line))
+    over = totals[:, base + 1:].sum(axis=1)
+    push = totals[:, base] if line.is_integer() else np.zeros(len(totals))
+    under = np.maximum(0.0, 1.0 - over - push)
+    return over, under, push
+
+
+def batch_one_x_two(goal_diff: np.ndarray) -> np.ndarray:
+    """(N, 3) array of P(home win), P(draw), P(away win)."""
+    g = (goal_diff.shape[1] - 1) // 2
+    return np.stack([goal_diff[:, g + 1:].sum(axis=1), goal_diff[:, g], goal_diff[:, :g].sum(axis=1)], axis=1)
+
+
+def batch_top_scorelines(mats: np.ndarray, n: int = 5) -> list[list[Tuple[str, float]]]:
+    """Top-n scorelines per fixture (same format as `top_scorelines`)."""
+    count, g1, _ = mats.shape
+    flat = mats.reshape(count, -1)
+    n = min(n, flat.shape[1])
+    part = np.argpartition(-flat, n - 1, axis=1)[:, :n]
+    part_probs = np.take_along_axis(flat, part, axis=1)
+    # Ties broken by scoreline index, matching the stable sort in `top_scorelines`
+    order = np.lexsort((part, -part_probs), axis=1)
+    idx = np.take_along_axis(part, order, axis=1)
+    probs = np.take_along_axis(part_probs, order, axis=1)
+    return [[(f"{k // g1}-{k % g1}", float(p)) for k, p in zip(row_idx, row_p)]
+            for row_idx, row_p in zip(idx, probs)]
 
 
 def ou_probabilities(prob: np.ndarray, line: float) -> Tuple[float, float, float]:
     """Return (P(Over line), P(Under line), P(Push)) using discrete totals."""
-    max_goals = prob.shape[0] - 1
-    # Total goals distribution
-    totals = np.zeros(2 * max_goals + 1)
-    for h in range(max_goals + 1):
-        for a in range(max_goals + 1):
-            totals[h + a] += prob[h, a]
+    return _ou_from_totals(totals_from_matrix(prob), line)
+
+
+def _ou_from_totals(totals: np.ndarray, line: float) -> Tuple[float, float, float]:
+    """(Over, Under, Push) from a total-goals distribution indexed by goal count."""
+    line = float(line)
     # Over/Under computation
-    over = sum(totals[int(line) + 1:]) if line.is_integer() else sum(totals[int(np.floor(line)) + 1:])
+    over = totals[int(np.floor(line)) + 1:].sum()
     under = 1.0 - over
     push = 0.0
     if line.is_integer():
@@ -129,10 +714,127 @@ def ou_probabilities(prob: np.ndarray, line: float) -> Tuple[float, float, float
 
 
 def top_scorelines(prob: np.ndarray, n: int = 5) -> list[Tuple[str, float]]:
-    pairs = []
-    max_goals = prob.shape[0] - 1
-    for h in range(max_goals + 1):
-        for a in range(max_goals + 1):
-            pairs.append((f"{h}-{a}", float(prob[h, a])))
-    pairs.sort(key=lambda x: x[1], reverse=True)
-    return pairs[:n]
+    return top_k_scorelines(prob, n=n)
+
+
+# ----------------------------------------------------------------------------
+# Closed-form fast path: total ~ Poisson(lh + la), goal diff ~ Skellam(lh, la)
+# ----------------------------------------------------------------------------
+
+def _rates(lam_home, lam_away) -> Tuple[np.ndarray, np.ndarray]:
+    lh = np.maximum(np.asarray(lam_home, dtype=float).reshape(-1), 1e-12)
+    la = np.maximum(np.asarray(lam_away, dtype=float).reshape(-1), 1e-12)
+    if lh.shape != la.shape:
+        lh, la = np.broadcast_arrays(lh, la)
+    return lh, la
+
+
+def _dc_cell_deltas(lh: np.ndarray, la: np.ndarray, rho: float) -> Tuple[np.ndarray, ...]:
+    """
+    Mass added by the Dixon-Coles correction to the 0-0, 0-1, 1-0 and 1-1 cells
+    (same factors as `score_matrices`). Only these cells move, so the
+    independent closed forms stay exact after adding these four terms.
+    """
+    if np.size(lh) == 1 and np.size(la) == 1:
+        # Một trận: tính trên float, tránh overhead của ufunc trên mảng 1 phần tử
+        lh, la = float(np.ravel(lh)[0]), float(np.ravel(la)[0])
+        clip, p00 = max, exp(-lh - la)
+    else:
+        clip, p00 = np.maximum, np.exp(-lh - la)
+    return (p00 * (clip(1.0 - lh * la * rho, 0.0) - 1.0),
+            p00 * la * (clip(1.0 + lh * rho, 0.0) - 1.0),
+            p00 * lh * (clip(1.0 + la * rho, 0.0) - 1.0),
+            p00 * lh * la * (max(1.0 - rho, 0.0) - 1.0))
+
+
+def total_goals_pmf(lam_home, lam_away, max_total: int, rho: float = 0.0) -> np.ndarray:
+    """(N, max_total+1) P(home + away = k), no score matrix needed."""
+    lh, la = _rates(lam_home, lam_away)
+    out = poisson_pmf(lh + la, max_total)
+    if rho:
+        d00, d01, d10, d11 = _dc_cell_deltas(lh, la, rho)
+        for total, delta in ((0, d00), (1, d01 + d10), (2, d11)):
+            if total <= max_total:
+                out[:, total] += delta
+    return out
+
+
+def goal_diff_pmf(lam_home, lam_away, max_diff: int, rho: float = 0.0) -> np.ndarray:
+    """(N, 2*max_diff+1) P(home - away = k - max_diff), same layout as `batch_goal_diff`."""
+    lh, la = _rates(lam_home, lam_away)
+    out = skellam_pmf(lh, la, max_diff)
+    if rho:
+        d00, d01, d10, d11 = _dc_cell_deltas(lh, la, rho)
+        out[:, max_diff] += d00 + d11
+        if max_diff >= 1:
+            out[:, max_diff - 1] += d01
+            out[:, max_diff + 1] += d10
+    return out
+
+
+def ou_closed_form(lam_home, lam_away, lines, rho: float = 0.0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    (over, under, push) arrays of shape (N, len(lines)) from the Poisson-sum CDF.
+    Only floor(max line) + 1 pmf terms are computed, and all lines share them.
+    """
+    lines = np.atleast_1d(np.asarray(lines, dtype=float))
+    base = np.maximum(np.floor(lines).astype(int), 0)
+    pmf = total_goals_pmf(lam_home, lam_away, int(base.max()), rho=rho)
+    cdf = np.cumsum(pmf, axis=1)[:, base]
+    push = np.where(lines == np.floor(lines), pmf[:, base], 0.0)
+    over = np.clip(1.0 - cdf, 0.0, 1.0)
+    under = np.maximum(cdf - push, 0.0)
+    return over, under, push
+
+
+class MatchDistribution:
+    """
+    Goal distribution of one fixture, computed once and shared by every market.
+
+    Totals (Poisson sum) and goal difference (Skellam) come in closed form, so
+    1X2, O/U, BTTS and handicap pricing never build a score matrix; the
+    (max_goals+1)x(max_goals+1) matrix is only built on first access, for
+    correct-score markets. The Dixon-Coles rho correction is applied to both.
+    """
+
+    def __init__(self, lam_home: float, lam_away: float, max_goals: Optional[int] = None, rho: float = 0.0):
+        self.lam_home = float(lam_home)
+        self.lam_away = float(lam_away)
+        if max_goals is None:
+            # Ít nhất 10 bàn; nhiều hơn khi lambda cao để phần đuôi bị cắt < DEFAULT_TAIL_TOL
+            max_goals = adaptive_max_goals(self.lam_home, self.lam_away, min_goals=10)
+        self.max_goals = max_goals
+        self.rho = float(rho)
+        self.totals = total_goals_pmf(self.lam_home, self.lam_away, 2 * max_goals, rho=self.rho)[0]
+        # goal_diff[k] = P(home - away = k - max_goals)
+        self.goal_diff = goal_diff_pmf(self.lam_home, self.lam_away, max_goals, rho=self.rho)[0]
+        self._matrix: Optional[np.ndarray] = None
+
+    @property
+    def matrix(self) -> np.ndarray:
+        if self._matrix is None:
+            self._matrix = score_matrices(self.lam_home, self.lam_away, max_goals=self.max_goals, rho=self.rho)[0]
+        return self._matrix
+
+    @property
+    def goal_diff_values(self) -> np.ndarray:
+        return np.arange(-self.max_goals, self.max_goals + 1)
+
+    def one_x_two(self) -> Tuple[float, float, float]:
+        """(P(home win), P(draw), P(away win))"""
+        g = self.max_goals
+        return float(self.goal_diff[g + 1:].sum()), float(self.goal_diff[g]), float(self.goal_diff[:g].sum())
+
+    def over_under(self, line: float) -> Tuple[float, float, float]:
+        # totals là Poisson-sum đầy đủ tới 2*max_goals, phần đuôi còn lại < DEFAULT_TAIL_TOL
+        return _ou_from_totals(self.totals, line)
+
+    def btts(self) -> float:
+        """P(both teams score) = (1 - P(home=0)) * (1 - P(away=0)), plus the 1-1 rho term"""
+        p = (1.0 - exp(-self.lam_home)) * (1.0 - exp(-self.lam_away))
+        if self.rho:
+            p += float(_dc_cell_deltas(self.lam_home, self.lam_away, self.rho)[3])
+        return float(p)
+
+    def top_scorelines(self, n: int = 5) -> list[Tuple[str, float]]:
+        return top_scorelines(self.matrix, n=n)
@@ -0,0 +1,193 @@
+"""
+prediction_archive.py - Season-partitioned archive of settled predictions
+
+The hot SQLite store (prediction_store.py) only needs pending and recent
+predictions. archive_settled() moves settled predictions from seasons before
+the current one into compressed columnar files, one directory per season:
+
+    prediction_archive/season=2023-24/part-20240801T030000-1a2b3c4d.parquet
+
+Files are Parquet when pyarrow is installed, gzip-compressed CSV otherwise;
+both carry the same flat columns plus the full record as JSON (`data`), and
+readers accept either format. Every run writes new part files (written to a
+temp file, then renamed) before the rows are deleted from the store, so an
+interrupted run leaves at worst a record in both places; readers drop such
+duplicates by id.
+
+read_archive() / iter_archived() query across all partitions (or a chosen
+list of seasons); prediction_tracker.load_history() merges them with the hot
+store for model evaluation.
+
+Usage:
+    python prediction_archive.py            # archive everything before this season
+    python prediction_archive.py 2024-07-01 # archive settled matches before a date
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sys
+import uuid
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import pandas as pd
+
+from prediction_store import ARCHIVE_DIR, PredictionStore, get_store, metric_day, season_label, season_start
+
+try:
+    import pyarrow  # noqa: F401
+except ImportError:
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+PARTITION_PREFIX = 'season='
+DEFAULT_FORMAT = 'parquet' if pyarrow is not None else 'csv.gz'
+
+# Cột phẳng để phân tích trực tiếp; `data` giữ nguyên record để khôi phục đầy đủ
+COLUMNS = ['id', 'season', 'match_day', 'timestamp', 'home_team', 'away_team', 'prediction', 'confidence',
+           'handicap_value', 'actual_result', 'correct', 'home_goals', 'away_goals', 'ou_line', 'ou_pick',
+           'ou_correct', 'predicted_goals', 'data']
+DTYPES = {'id': 'string', 'season': 'string', 'match_day': 'string', 'timestamp': 'string',
+          'home_team': 'string', 'away_team': 'string', 'prediction': 'Int64', 'confidence': 'float64',
+          'handicap_value': 'float64', 'actual_result': 'string', 'correct': 'boolean',
+          'home_goals': 'Int64', 'away_goals': 'Int64', 'ou_line': 'float64', 'ou_pick': 'string',
+          'ou_correct': 'boolean', 'predicted_goals': 'float64', 'data': 'string'}
+
+
+def _row(record: Dict[str, Any], season: str) -> Dict[str, Any]:
+    day = metric_day(record)
+    row = {col: record.get(col) for col in COLUMNS}
+    row.update({
+        'season': season,
+        'match_day': day.isoformat() if day else None,
+        # 1 / 0 / 'Push' -> một kiểu duy nhất cho file columnar
+        'actual_result': None if record.get('actual_result') is None else str(record['actual_result']),
+        'data': json.dumps(record, ensure_ascii=False, default=str),
+    })
+    return row
+
+
+def _typed(frame: pd.DataFrame) -> pd.DataFrame:
+    for col in COLUMNS:
+        if col not in frame:
+            frame[col] = None
+    return frame[COLUMNS].astype(DTYPES)
+
+
+def partitions(archive_dir: str = ARCHIVE_DIR) -> List[str]:
+    """Archived seasons, oldest first (e.g. ['2022-23', '2023-24'])."""
+    if not os.path.isdir(archive_dir):
+        return []
+    return sorted(name[len(PARTITION_PREFIX):] for name in os.listdir(archive_dir)
+                  if name.startswith(PARTITION_PREFIX) and os.path.isdir(os.path.join(archive_dir, name)))
+
+
+def write_partition(records: List[Dict[str, Any]], season: str, archive_dir: str = ARCHIVE_DIR,
+                    fmt: Optional[str] = None) -> str:
+    """Write one part file for `season`; returns its path."""
+    fmt = fmt or DEFAULT_FORMAT
+    folder = os.path.join(archive_dir, f'{PARTITION_PREFIX}{season}')
+    os.makedirs(folder, exist_ok=True)
+    name = f"part-{datetime.now().strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}.{fmt}"
+    path = os.path.join(folder, name)
+    tmp = os.path.join(folder, f'.{name}.tmp')
+    frame = _typed(pd.DataFrame([_row(r, season) for r in records]))
+    if fmt == 'parquet':
+        frame.to_parquet(tmp, index=False, compression='zstd')
+    elif fmt == 'csv.gz':
+        frame.to_csv(tmp, index=False, compression='gzip')
+    else:
+        raise ValueError(f'Unknown archive format: {fmt}')
+    os.replace(tmp, path)
+    return path
+
+
+def _read_part(path: str, columns: Optional[List[str]]) -> Optional[pd.DataFrame]:
+    if path.endswith('.parquet'):
+        if pyarrow is None:
+            logger.warning(f'Bỏ qua {path}: cần pyarrow để đọc parquet')
+            return None
+        return pd.read_parquet(path, columns=columns)
+    if path.endswith('.csv.gz'):
+        text = {col: 'string' for col, dtype in DTYPES.items() if dtype == 'string'}
+        return pd.read_csv(path, usecols=columns, dtype=text)
+    return None
+
+
+def read_archive(seasons: Optional[Iterable[str]] = None, columns: Optional[List[str]] = None,
+                 archive_dir: str = ARCHIVE_DIR) -> pd.DataFrame:
+    """
+    Archived predictions from all partitions (or only `seasons`) as one DataFrame.
+    `columns` reads only those columns (parquet skips the rest on disk).
+    """
+    wanted = None if columns is None else list(dict.fromkeys(['id', *columns]))
+    frames = []
+    for season in (partitions(archive_dir) if seasons is None else seasons):
+        folder = os.path.join(archive_dir, f'{PARTITION_PREFIX}{season}')
+        if not os.path.isdir(folder):
+            continue
+        for name in sorted(os.listdir(folder)):
+            if name.startswith('.'):
+                continue
+            frame = _read_part(os.path.join(folder, name), wanted)
+            if frame is not None:
+                frames.append(frame)
+    if not frames:
+        return _typed(pd.DataFrame(columns=COLUMNS))[wanted or COLUMNS]
+    frame = pd.concat(frames, ignore_index=True)
+    frame = frame.astype({col: DTYPES[col] for col in frame.columns if col in DTYPES})
+    frame = frame.drop_duplicates('id', keep='last').reset_index(drop=True)
+    return frame[columns] if columns is not None else frame
+
+
+def iter_archived(seasons: Optional[Iterable[str]] = None, archive_dir: str = ARCHIVE_DIR) -> Iterator[Dict[str, Any]]:
+    """Full archived prediction records (as logged), partition by partition."""
+    frame = read_archive(seasons, columns=['data'], archive_dir=archive_dir)
+    for data in frame['data']:
+        yield json.loads(data)
+
+
+def archive_settled(store: Optional[PredictionStore] = None, before: Optional[date] = None,
+                    archive_dir: Optional[str] = None, fmt: Optional[str] = None) -> Dict[str, int]:
+    """
+    Move settled predictions with a match day before `before` (default: start of the
+    current season) from the store into the archive.
+
+    Returns:
+        {season: số predictions đã archive}
+    """
+    store = store or get_store()
+    archive_dir = archive_dir or store.archive_dir or ARCHIVE_DIR
+    before = before or season_start(date.today())
+
+    by_season: Dict[str, List[Dict[str, Any]]] = {}
+    for record in store.settled_before(before):
+        by_season.setdefault(season_label(metric_day(record) or before), []).append(record)
+
+    archived = {}
+    for season, records in sorted(by_season.items()):
+        path = write_partition(records, season, archive_dir, fmt)
+        removed = store.remove(r['id'] for r in records)
+        archived[season] = len(records)
+        logger.info(f'Archived {len(records)} predictions mùa {season} -> {path} ({removed} rows removed)')
+    return archived
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    before = date.fromisoformat(sys.argv[1]) if len(sys.argv) > 1 else None
+    archived = archive_settled(before=before)
+    if not archived:
+        print('Không có prediction nào cần archive.')
+        return
+    for season, count in archived.items():
+        print(f'✅ {season}: {count} predictions')
+    print(f'Các mùa trong archive: {", ".join(partitions())}')
+
+
+if __name__ == '__main__':
+    main()
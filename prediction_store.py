@@ -0,0 +1,711 @@
+"""
+prediction_store.py - SQLite store for logged predictions
+
+Replaces the rewrite-everything predictions_log.json: every prediction is one
+row (the full record as JSON plus indexed columns), so appending, looking up
+by id / teams and listing pending predictions cost O(log n) however many
+seasons are logged. The database runs in WAL mode so the bot can read while
+a result is being written.
+
+On first open an existing predictions_log.json is imported once and renamed
+to predictions_log.json.migrated.
+
+New predictions go through a write-behind PredictionWriter: the caller only
+enqueues, a background thread inserts queued records in batches (one
+transaction each) and the queue is flushed before reads and at exit.
+Accuracy statistics are materialized in an `aggregates` table (per key: n,
+hits, total) next to the predictions. Every insert / update applies the
+difference between the record's old and new contributions in the same
+transaction, so settling a result is O(1) and stats reads never scan the
+history. The same counters are also kept per calendar day and per ISO
+week (metric_buckets, keyed by the match day), so rolling windows (last 7 /
+30 / 90 days, this season) are answered by adding up whole weeks plus the
+edge days instead of scanning records. Both tables are rebuilt once from the
+predictions whenever AGGREGATES_VERSION changes.
+
+Settled predictions from past seasons can be moved out to season-partitioned
+files by prediction_archive.py. Archiving deletes the rows without touching
+the aggregates, so stats keep covering the full history; a rebuild reads the
+archive back in.
+
+Several processes (shards, a separate worker) may share one database: all
+writes run in BEGIN IMMEDIATE transactions with a busy timeout, so
+read-modify-write sequences are serialized by SQLite's file lock and
+concurrent writers wait for each other instead of losing records.
+
+PREDICTION_SYNC selects the fsync policy (SQLite PRAGMA synchronous):
+'normal' (default; WAL is fsynced at checkpoints), 'full' (every batch is
+fsynced) or 'off'.
+"""
+
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = 'predictions.db'
+LEGACY_JSON_PATH = 'predictions_log.json'
+ARCHIVE_DIR = 'prediction_archive'
+SEASON_START_MONTH = 7  # mùa giải EPL tính từ 1/7
+SYNC_MODE = os.getenv('PREDICTION_SYNC', 'normal').upper()
+BUSY_TIMEOUT_SECONDS = 30.0  # chờ write lock của process khác thay vì báo 'database is locked'
+
+AGGREGATES_VERSION = '2'
+CALIBRATION_BINS = (0.5, 0.6, 0.7, 0.8, 0.9)  # cận dưới mỗi bin rộng 0.1
+
+WRITER_QUEUE_SIZE = 1000
+WRITER_MAX_BATCH = 64
+WRITER_LINGER_SECONDS = 0.2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    timestamp TEXT,
+    home_key TEXT NOT NULL,
+    away_key TEXT NOT NULL,
+    pending INTEGER NOT NULL DEFAULT 1,
+    confidence REAL,
+    correct INTEGER,
+    ou_line REAL,
+    ou_correct INTEGER,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_predictions_teams ON predictions (home_key, away_key);
+CREATE INDEX IF NOT EXISTS idx_predictions_pending ON predictions (pending, seq);
+CREATE INDEX IF NOT EXISTS idx_predictions_timestamp ON predictions (timestamp);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS aggregates (
+    key TEXT PRIMARY KEY,
+    n INTEGER NOT NULL DEFAULT 0,
+    hits INTEGER NOT NULL DEFAULT 0,
+    total REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS metric_buckets (
+    period TEXT NOT NULL,
+    start TEXT NOT NULL,
+    key TEXT NOT NULL,
+    n INTEGER NOT NULL DEFAULT 0,
+    hits INTEGER NOT NULL DEFAULT 0,
+    total REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (period, start, key)
+);
+"""
+
+_UPSERT_AGGREGATE = """
+INSERT INTO aggregates (key, n, hits, total) VALUES (?, ?, ?, ?)
+ON CONFLICT(key) DO UPDATE SET n = n + excluded.n, hits = hits + excluded.hits, total = total + excluded.total
+"""
+
+_UPSERT_BUCKET = """
+INSERT INTO metric_buckets (period, start, key, n, hits, total) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT(period, start, key) DO UPDATE SET
+    n = n + excluded.n, hits = hits + excluded.hits, total = total + excluded.total
+"""
+
+
+def team_key(name: str) -> str:
+    """Khóa so khớp tên đội (giống cách !updateresult chuẩn hóa tên)."""
+    return (name or '').lower().replace(' ', '').replace('_', '')
+
+
+def _bool_or_none(value) -> Optional[int]:
+    return None if value is None else int(bool(value))
+
+
+def _columns(record: Dict[str, Any]) -> Dict[str, Any]:
+    ou_line = record.get('ou_line')
+    return {
+        'id': record['id'],
+        'timestamp': record.get('timestamp'),
+        'home_key': team_key(record.get('home_team', '')),
+        'away_key': team_key(record.get('away_team', '')),
+        'pending': int(record.get('actual_result') is None),
+        'confidence': record.get('confidence'),
+        'correct': _bool_or_none(record.get('correct')),
+        'ou_line': float(ou_line) if ou_line is not None else None,
+        'ou_correct': _bool_or_none(record.get('ou_correct')),
+        'data': json.dumps(record, ensure_ascii=False, default=str),
+    }
+
+
+def confidence_band(confidence: float) -> str:
+    """Nhóm độ tin cậy dùng trong báo cáo: high ≥70%, medium 55-70%, low <55%."""
+    if confidence >= 0.7:
+        return 'high'
+    return 'medium' if confidence >= 0.55 else 'low'
+
+
+def _contributions(record: Dict[str, Any]) -> Dict[str, Tuple[int, int, float]]:
+    """
+    What one record adds to each aggregate key, as (n, hits, total).
+    Pushes (correct / ou_correct is None) are left out of the accuracy keys.
+    """
+    out: Dict[str, Tuple[int, int, float]] = {'logged': (1, 0, 0.0)}
+    if record.get('actual_result') is None:
+        return out
+    out['completed'] = (1, 0, 0.0)
+
+    correct = record.get('correct')
+    if correct is not None:
+        hit = int(bool(correct))
+        confidence = float(record.get('confidence') or 0.0)
+        out['graded'] = (1, hit, confidence)
+        out[f'conf:{confidence_band(confidence)}'] = (1, hit, confidence)
+        if confidence >= 0.8:
+            out['conf:very_high'] = (1, hit, confidence)
+        for low in CALIBRATION_BINS:
+            if low <= confidence < low + 0.1:
+                out[f'calib:{low:.1f}'] = (1, hit, confidence)
+                break
+        if record.get('prediction') in (0, 1):
+            out['pick:home' if record['prediction'] == 1 else 'pick:away'] = (1, hit, 0.0)
+
+    ou_pick = record.get('ou_pick')
+    if ou_pick and record.get('ou_correct') is not None and record.get('ou_line') is not None:
+        hit = int(bool(record['ou_correct']))
+        is_over = int(ou_pick == 'Over')
+        out['ou'] = (1, hit, is_over)
+        out[f'ou_pick:{ou_pick}'] = (1, hit, 0.0)
+        out[f"ou_line:{float(record['ou_line'])}"] = (1, hit, is_over)
+
+    predicted = record.get('predicted_goals')
+    if predicted is not None and record.get('home_goals') is not None and record.get('away_goals') is not None:
+        predicted = float(predicted)
+        actual = float(record['home_goals']) + float(record['away_goals'])
+        # hits = số trận dự đoán cao hơn thực tế, total = tổng sai số tuyệt đối
+        out['goals'] = (1, int(predicted > actual), abs(predicted - actual))
+        out['goals_predicted'] = (1, 0, predicted)
+        out['goals_actual'] = (1, 0, actual)
+    return out
+
+
+def _parse_day(value) -> Optional[date]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).date()
+    except ValueError:
+        return None
+
+
+def metric_day(record: Dict[str, Any]) -> Optional[date]:
+    """
+    Day a settled prediction is bucketed under: the match day when known
+    (API utcDate / The Odds API commence_time), else settlement, else logging.
+    """
+    odds = record.get('odds_data') or {}
+    candidates = (record.get('match_date'),
+                  odds.get('timestamp') if odds.get('source') == 'the_odds_api' else None,
+                  record.get('settled_at'), record.get('timestamp'))
+    for value in candidates:
+        day = _parse_day(value)
+        if day is not None:
+            return day
+    return None
+
+
+def season_start(day: date) -> date:
+    """First day (1 July) of the season containing `day`."""
+    year = day.year if day.month >= SEASON_START_MONTH else day.year - 1
+    return date(year, SEASON_START_MONTH, 1)
+
+
+def season_label(day: date) -> str:
+    """Season containing `day`, e.g. '2023-24'."""
+    start = season_start(day).year
+    return f'{start}-{(start + 1) % 100:02d}'
+
+
+def week_start(day: date) -> date:
+    """Monday of the ISO week containing `day`."""
+    return day - timedelta(days=day.weekday())
+
+
+def _bucket_contributions(record: Dict[str, Any]) -> Dict[Tuple[str, str, str], Tuple[int, int, float]]:
+    """Per-day and per-week share of a settled record's contributions."""
+    if record.get('actual_result') is None:
+        return {}
+    day = metric_day(record)
+    if day is None:
+        return {}
+    out = {}
+    for key, value in _contributions(record).items():
+        if key == 'logged':
+            continue
+        out[('day', day.isoformat(), key)] = value
+        out[('week', week_start(day).isoformat(), key)] = value
+    return out
+
+
+def _diff(before: Dict[Any, Tuple[int, int, float]], after: Dict[Any, Tuple[int, int, float]]) -> List[tuple]:
+    rows = []
+    for key in before.keys() | after.keys():
+        n0, h0, t0 = before.get(key, (0, 0, 0.0))
+        n1, h1, t1 = after.get(key, (0, 0, 0.0))
+        if (n1 - n0, h1 - h0, t1 - t0) != (0, 0, 0.0):
+            rows.append((*(key if isinstance(key, tuple) else (key,)), n1 - n0, h1 - h0, t1 - t0))
+    return rows
+
+
+def _delta(old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]) -> List[Tuple[str, int, int, float]]:
+    return _diff(_contributions(old) if old is not None else {},
+                 _contributions(new) if new is not None else {})
+
+
+def _bucket_delta(old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]) -> List[tuple]:
+    return _diff(_bucket_contributions(old) if old is not None else {},
+                 _bucket_contributions(new) if new is not None else {})
+
+
+class PredictionStore:
+    """Thread- and process-safe wrapper around one SQLite connection."""
+
+    def __init__(self, path: str = DB_PATH, legacy_json: Optional[str] = LEGACY_JSON_PATH,
+                 archive_dir: Optional[str] = None):
+        self.path = path
+        self.archive_dir = archive_dir
+        self._lock = threading.RLock()
+        # isolation_level=None: transactions are opened explicitly with BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_SECONDS, check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.execute(f'PRAGMA busy_timeout={int(BUSY_TIMEOUT_SECONDS * 1000)}')
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        sync = SYNC_MODE if SYNC_MODE in ('OFF', 'NORMAL', 'FULL') else 'NORMAL'
+        self._conn.execute(f'PRAGMA synchronous={sync}')
+        with self._transaction():
+            for statement in _SCHEMA.split(';'):
+                if statement.strip():
+                    self._conn.execute(statement)
+        if legacy_json:
+            self._migrate_json(legacy_json)
+        self._ensure_aggregates()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # ------------------------------------------------------------------ writes
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Write transaction that takes SQLite's write lock up front (BEGIN IMMEDIATE),
+        so read-modify-write sequences from several processes are serialized
+        instead of failing when a deferred transaction tries to upgrade.
+        """
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+
+    def _apply_delta(self, old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]) -> None:
+        rows = _delta(old, new)
+        if rows:
+            self._conn.executemany(_UPSERT_AGGREGATE, rows)
+        bucket_rows = _bucket_delta(old, new)
+        if bucket_rows:
+            self._conn.executemany(_UPSERT_BUCKET, bucket_rows)
+
+    def insert(self, record: Dict[str, Any]) -> None:
+        cols = _columns(record)
+        names = ', '.join(cols)
+        marks = ', '.join(f':{k}' for k in cols)
+        with self._transaction():
+            self._conn.execute(f'INSERT INTO predictions ({names}) VALUES ({marks})', cols)
+            self._apply_delta(None, record)
+
+    def insert_many(self, records: List[Dict[str, Any]]) -> int:
+        """Insert a batch in one transaction; on a conflict falls back to row by row. Returns rows written."""
+        if not records:
+            return 0
+        rows = [_columns(r) for r in records]
+        names = ', '.join(rows[0])
+        marks = ', '.join(f':{k}' for k in rows[0])
+        sql = f'INSERT INTO predictions ({names}) VALUES ({marks})'
+        with self._lock:
+            try:
+                with self._transaction():
+                    self._conn.executemany(sql, rows)
+                    for record in records:
+                        self._apply_delta(None, record)
+                return len(rows)
+            except sqlite3.IntegrityError:
+                written = 0
+                for record, row in zip(records, rows):
+                    try:
+                        with self._transaction():
+                            self._conn.execute(sql, row)
+                            self._apply_delta(None, record)
+                        written += 1
+                    except sqlite3.IntegrityError as e:
+                        logger.error(f"Không lưu được prediction {row['id']}: {e}")
+                return written
+
+    def update(self, record: Dict[str, Any]) -> bool:
+        """Rewrite one record (matched by id); False if the id is unknown."""
+        cols = _columns(record)
+        assignments = ', '.join(f'{k} = :{k}' for k in cols if k != 'id')
+        with self._transaction():
+            found = self._conn.execute('SELECT data FROM predictions WHERE id = ?', (record['id'],)).fetchone()
+            if found is None:
+                return False
+            self._conn.execute(f'UPDATE predictions SET {assignments} WHERE id = :id', cols)
+            self._apply_delta(json.loads(found[0]), record)
+        return True
+
+    def settle(self, record: Dict[str, Any]) -> bool:
+        """
+        Write a newly settled record only if it is still pending in the database.
+        The check and the write share one BEGIN IMMEDIATE transaction, so when
+        several processes settle the same prediction exactly one gets True.
+        """
+        cols = _columns(record)
+        assignments = ', '.join(f'{k} = :{k}' for k in cols if k != 'id')
+        with self._transaction():
+            found = self._conn.execute('SELECT data FROM predictions WHERE id = ? AND pending = 1',
+                                       (record['id'],)).fetchone()
+            if found is None:
+                return False
+            cursor = self._conn.execute(f'UPDATE predictions SET {assignments} WHERE id = :id AND pending = 1', cols)
+            if cursor.rowcount != 1:
+                return False
+            self._apply_delta(json.loads(found[0]), record)
+        return True
+
+    def remove(self, ids: Iterable[str]) -> int:
+        """
+        Delete predictions by id once they have been archived. Aggregates and metric
+        buckets are left as they are: they keep describing the full history.
+        """
+        ids = list(ids)
+        with self._transaction():
+            before = self._conn.total_changes
+            self._conn.executemany('DELETE FROM predictions WHERE id = ?', [(i,) for i in ids])
+            return self._conn.total_changes - before
+
+    def _archived_records(self, skip: Set[str]) -> Iterator[Dict[str, Any]]:
+        if not self.archive_dir or not os.path.isdir(self.archive_dir):
+            return
+        import prediction_archive
+        for record in prediction_archive.iter_archived(archive_dir=self.archive_dir):
+            if record.get('id') not in skip:
+                yield record
+
+    def rebuild_aggregates(self) -> None:
+        """
+        Recompute every aggregate and metric bucket from a full scan of the stored and
+        archived predictions (schema change / first open only).
+        """
+        totals: Dict[str, List[float]] = {}
+        buckets: Dict[Tuple[str, str, str], List[float]] = {}
+        with self._transaction():
+            hot = [json.loads(data) for (data,) in self._conn.execute('SELECT data FROM predictions')]
+            # Bản ghi vừa ghi ra archive nhưng chưa kịp xoá khỏi DB chỉ được tính một lần
+            archived = self._archived_records({r.get('id') for r in hot})
+            for record in (*hot, *archived):
+                for target, contributions in ((totals, _contributions(record)),
+                                              (buckets, _bucket_contributions(record))):
+                    for key, (n, hits, total) in contributions.items():
+                        acc = target.setdefault(key, [0, 0, 0.0])
+                        acc[0] += n
+                        acc[1] += hits
+                        acc[2] += total
+            self._conn.execute('DELETE FROM aggregates')
+            self._conn.executemany('INSERT INTO aggregates (key, n, hits, total) VALUES (?, ?, ?, ?)',
+                                   [(k, int(v[0]), int(v[1]), float(v[2])) for k, v in totals.items()])
+            self._conn.execute('DELETE FROM metric_buckets')
+            self._conn.executemany(
+                'INSERT INTO metric_buckets (period, start, key, n, hits, total) VALUES (?, ?, ?, ?, ?, ?)',
+                [(*k, int(v[0]), int(v[1]), float(v[2])) for k, v in buckets.items()])
+            self._conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                               ('aggregates_version', AGGREGATES_VERSION))
+
+    def _aggregates_current(self) -> bool:
+        row = self._conn.execute('SELECT value FROM meta WHERE key = ?', ('aggregates_version',)).fetchone()
+        return row is not None and row[0] == AGGREGATES_VERSION
+
+    def _ensure_aggregates(self) -> None:
+        with self._lock:
+            if self._aggregates_current():
+                return
+        logger.info('Tính lại bảng aggregates từ toàn bộ predictions')
+        self.rebuild_aggregates()
+
+    def _migrate_json(self, legacy_json: str) -> None:
+        """Import predictions_log.json once (ids already stored are kept), then rename it."""
+        if not os.path.exists(legacy_json):
+            return
+        # Giữ write lock trong lúc migrate: process khác mở store cùng lúc sẽ chờ rồi thấy 'migrated_json'
+        with self._transaction():
+            if self._conn.execute('SELECT 1 FROM meta WHERE key = ?', ('migrated_json',)).fetchone():
+                return
+            try:
+                with open(legacy_json, 'r', encoding='utf-8') as f:
+                    records = json.load(f)
+            except FileNotFoundError:
+                return
+            except (OSError, ValueError) as e:
+                logger.error(f'Không đọc được {legacy_json} để migrate: {e}')
+                return
+            rows = [_columns(r) for r in records if isinstance(r, dict) and r.get('id')]
+            if rows:
+                names = ', '.join(rows[0])
+                marks = ', '.join(f':{k}' for k in rows[0])
+                self._conn.executemany(f'INSERT OR IGNORE INTO predictions ({names}) VALUES ({marks})', rows)
+            self._conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                               ('migrated_json', str(len(rows))))
+            self._conn.execute('DELETE FROM meta WHERE key = ?', ('aggregates_version',))
+        try:
+            os.replace(legacy_json, f'{legacy_json}.migrated')
+        except OSError as e:
+            logger.warning(f'Không đổi tên được {legacy_json}: {e}')
+        logger.info(f'Đã migrate {len(rows)} predictions từ {legacy_json} sang {self.path}')
+
+    # ------------------------------------------------------------------- reads
+
+    def _records(self, sql: str, params=()) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def get(self, prediction_id: str) -> Optional[Dict[str, Any]]:
+        found = self._records('SELECT data FROM predictions WHERE id = ?', (prediction_id,))
+        return found[0] if found else None
+
+    def pending(self) -> List[Dict[str, Any]]:
+        return self._records('SELECT data FROM predictions WHERE pending = 1 ORDER BY seq')
+
+    def find_by_teams(self, home_team: str, away_team: str, pending_only: bool = True) -> List[Dict[str, Any]]:
+        """Predictions for (home, away) in logging order, matched on normalized names."""
+        sql = 'SELECT data FROM predictions WHERE home_key = ? AND away_key = ?'
+        if pending_only:
+            sql += ' AND pending = 1'
+        return self._records(sql + ' ORDER BY seq', (team_key(home_team), team_key(away_team)))
+
+    def settled_before(self, day: date) -> List[Dict[str, Any]]:
+        """Settled predictions whose match day (metric_day) is before `day`, in logging order."""
+        return [r for r in self.completed() if (metric_day(r) or day) < day]
+
+    def completed(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Settled predictions in logging order; limit keeps only the most recent ones."""
+        if limit is None:
+            return self._records('SELECT data FROM predictions WHERE pending = 0 ORDER BY seq')
+        recent = self._records('SELECT data FROM predictions WHERE pending = 0 ORDER BY seq DESC LIMIT ?', (limit,))
+        return recent[::-1]
+
+    def recent(self, limit: int) -> List[Dict[str, Any]]:
+        """The `limit` most recently logged predictions (settled or not), oldest first."""
+        return self._records('SELECT data FROM predictions ORDER BY seq DESC LIMIT ?', (limit,))[::-1]
+
+    def iter_all(self) -> Iterator[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute('SELECT data FROM predictions ORDER BY seq').fetchall()
+        for (data,) in rows:
+            yield json.loads(data)
+
+    def aggregates(self, keys: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, float]]:
+        """Materialized aggregates as {key: {'n', 'hits', 'total'}} (all keys, or only `keys`)."""
+        with self._lock:
+            if keys is None:
+                rows = self._conn.execute('SELECT key, n, hits, total FROM aggregates').fetchall()
+            else:
+                keys = list(keys)
+                marks = ', '.join('?' for _ in keys)
+                rows = self._conn.execute(f'SELECT key, n, hits, total FROM aggregates WHERE key IN ({marks})',
+                                          keys).fetchall()
+        return {key: {'n': n, 'hits': hits, 'total': total} for key, n, hits, total in rows}
+
+    def window_aggregates(self, start: date, end: date) -> Dict[str, Dict[str, float]]:
+        """
+        Aggregates of predictions whose match day is in [start, end], same shape as
+        aggregates(). Whole ISO weeks come from week buckets and only the edge days
+        from day buckets, so a window costs at most ~(weeks + 12) rows per key.
+        """
+        first_monday = start + timedelta(days=(7 - start.weekday()) % 7)
+        last_sunday = end - timedelta(days=(end.weekday() + 1) % 7)
+        ranges = []
+        if first_monday + timedelta(days=6) <= last_sunday:
+            ranges.append(('week', first_monday, last_sunday - timedelta(days=6)))
+            if start < first_monday:
+                ranges.append(('day', start, first_monday - timedelta(days=1)))
+            if last_sunday < end:
+                ranges.append(('day', last_sunday + timedelta(days=1), end))
+        else:
+            ranges.append(('day', start, end))
+
+        out: Dict[str, Dict[str, float]] = {}
+        with self._lock:
+            for period, lo, hi in ranges:
+                rows = self._conn.execute(
+                    'SELECT key, SUM(n), SUM(hits), SUM(total) FROM metric_buckets '
+                    'WHERE period = ? AND start BETWEEN ? AND ? GROUP BY key',
+                    (period, lo.isoformat(), hi.isoformat())).fetchall()
+                for key, n, hits, total in rows:
+                    acc = out.setdefault(key, {'n': 0, 'hits': 0, 'total': 0.0})
+                    acc['n'] += n
+                    acc['hits'] += hits
+                    acc['total'] += total
+        return out
+
+    def count(self, pending: Optional[bool] = None) -> int:
+        """Number of predictions (all, pending or settled), read from the aggregates."""
+        agg = self.aggregates(('logged', 'completed'))
+        logged = agg.get('logged', {}).get('n', 0)
+        completed = agg.get('completed', {}).get('n', 0)
+        if pending is None:
+            return logged
+        return logged - completed if pending else completed
+
+
+class PredictionWriter:
+    """
+    Write-behind writer: submit() only enqueues, a daemon thread inserts the
+    queued records in batches of up to max_batch (waiting at most `linger`
+    seconds to fill one). A full queue falls back to a direct write rather
+    than dropping the record.
+    """
+
+    _STOP = object()
+
+    def __init__(self, max_queue: int = WRITER_QUEUE_SIZE, max_batch: int = WRITER_MAX_BATCH,
+                 linger: float = WRITER_LINGER_SECONDS):
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self.max_batch = max_batch
+        self.linger = linger
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self) -> None:
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='prediction-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, record: Dict[str, Any]) -> None:
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            logger.warning('Hàng đợi ghi prediction đầy, ghi trực tiếp')
+            get_store().insert_many([record])
+
+    def flush(self, timeout: Optional[float] = 10.0) -> bool:
+        """Block until everything submitted so far is on disk."""
+        if self._thread is None or not self._thread.is_alive():
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout: Optional[float] = 10.0) -> None:
+        """Flush the queue and stop the thread (called at exit)."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(self._STOP)
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            batch, events, stop = [], [], False
+            item = self._queue.get()
+            deadline = time.monotonic() + self.linger
+            while True:
+                if item is self._STOP:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    events.append(item)
+                else:
+                    batch.append(item)
+                if stop or events or len(batch) >= self.max_batch:
+                    break
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if stop:
+                # Lấy nốt những gì còn trong hàng đợi trước khi dừng
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if isinstance(item, threading.Event):
+                        events.append(item)
+                    elif item is not self._STOP:
+                        batch.append(item)
+            try:
+                if batch:
+                    get_store().insert_many(batch)
+            except Exception as e:
+                logger.error(f'Lỗi khi ghi {len(batch)} predictions: {e}', exc_info=True)
+            for event in events:
+                event.set()
+            if stop:
+                return
+
+
+_STORE: Optional[PredictionStore] = None
+_STORE_LOCK = threading.Lock()
+_WRITER: Optional[PredictionWriter] = None
+
+
+def get_store(create: bool = True) -> Optional[PredictionStore]:
+    """
+    Shared store for DB_PATH. With create=False returns None instead of
+    creating an empty database when there is nothing to read yet.
+    """
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is not None and _STORE.path == DB_PATH:
+            return _STORE
+        if not create and not os.path.exists(DB_PATH) and not os.path.exists(LEGACY_JSON_PATH):
+            return None
+        if _STORE is not None:
+            _STORE.close()
+        _STORE = PredictionStore(DB_PATH, LEGACY_JSON_PATH, archive_dir=ARCHIVE_DIR)
+        return _STORE
+
+
+def get_writer() -> PredictionWriter:
+    """Shared write-behind writer, flushed automatically at interpreter exit."""
+    global _WRITER
+    with _STORE_LOCK:
+        if _WRITER is None:
+            _WRITER = PredictionWriter()
+            atexit.register(_WRITER.close)
+        return _WRITER
+
+
+def flush_writes(timeout: Optional[float] = 10.0) -> bool:
+    """Wait for queued predictions to be written (no-op when nothing was queued)."""
+    writer = _WRITER
+    return writer.flush(timeout) if writer is not None else True
+
+
+def shutdown() -> None:
+    """Flush pending writes and close the shared store."""
+    global _STORE, _WRITER
+    if _WRITER is not None:
+        _WRITER.close()
+    with _STORE_LOCK:
+        if _STORE is not None:
+            _STORE.close()
+        _STORE = None
+        _WRITER = None
@@ -3,20 +3,33 @@ prediction_tracker.py - Track and monitor prediction accuracy
 
 Module này lưu lại tất cả predictions và so sánh với kết quả thực tế
 để đánh giá độ chính xác của model theo thời gian.
+
+Predictions được lưu trong SQLite (prediction_store.py); predictions_log.json
+cũ được migrate một lần khi mở store. log_prediction chỉ đưa record vào hàng
+đợi của writer chạy nền, các hàm đọc flush hàng đợi trước khi truy vấn.
 """
 
 import os
-import json
+import uuid
 import logging
-from datetime import datetime
-from typing import Dict, Any, Optional
+from datetime import date, datetime, timedelta
+from typing import Dict, Any, List, Optional
 import pandas as pd
 
+from asian_handicap import settle_handicap
+import prediction_store
+from prediction_store import CALIBRATION_BINS, flush_writes, get_store, get_writer
+from poisson_model import update_strengths_online
+from team_names import canonical_team_name
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-PREDICTIONS_FILE = 'predictions_log.json'
 STATS_FILE = 'prediction_stats.csv'
+ROLLING_WINDOWS = (7, 30, 90)
+# File trạng thái online của Poisson strengths (None = poisson_model.ONLINE_PATH);
+# test / script dùng dữ liệu giả trỏ nó sang thư mục tạm
+STRENGTHS_PATH: Optional[str] = None
 
 
 def log_prediction(
@@ -33,12 +46,13 @@ def log_prediction(
     predicted_goals: float | None = None,
 ) -> str:
     """
-    Lưu lại một prediction
+    Lưu lại một prediction (write-behind: chỉ enqueue, không chờ ghi đĩa)
     
     Returns:
         prediction_id: ID để track prediction này
     """
-    prediction_id = f"{home_team}_{away_team}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    # Hậu tố ngẫu nhiên: nhiều prediction trong cùng một giây (hoặc từ nhiều process) không trùng ID
+    prediction_id = f"{home_team}_{away_team}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
     
     prediction_record = {
         'id': prediction_id,
@@ -60,125 +74,305 @@ def log_prediction(
         'ou_correct': None
     }
     
-    # Load existing predictions
-    if os.path.exists(PREDICTIONS_FILE):
-        with open(PREDICTIONS_FILE, 'r', encoding='utf-8') as f:
-            predictions = json.load(f)
-    else:
-        predictions = []
-    
-    # Add new prediction
-    predictions.append(prediction_record)
-    
-    # Save
-    with open(PREDICTIONS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(predictions, f, indent=2, ensure_ascii=False)
+    get_writer().submit(prediction_record)
     
-    logger.info(f'Logged prediction: {prediction_id}')
+    logger.info(f'Queued prediction: {prediction_id}')
     return prediction_id
 
 
+def _apply_result(pred: Dict[str, Any], home_goals: int, away_goals: int, handicap_value: float) -> None:
+    """
+    Ghi kết quả thực tế vào một prediction record (kèo chấp + O/U).
+
+    Kèo chấp chấm theo luật Châu Á đầy đủ, kể cả quarter lines:
+    thắng/thắng nửa tính là đúng, thua/thua nửa là sai, hòa kèo -> correct = None
+    (không tính vào accuracy).
+    """
+    handicap_value = float(handicap_value or 0.0)
+    home_outcome = settle_handicap(home_goals, away_goals, handicap_value, side='home')
+    side = 'home' if pred['prediction'] == 1 else 'away'
+    outcome = settle_handicap(home_goals, away_goals, handicap_value, side=side)
+
+    if home_outcome in ('win', 'half_win'):
+        actual_result = 1
+    elif home_outcome in ('loss', 'half_loss'):
+        actual_result = 0
+    else:
+        actual_result = 'Push'
+
+    pred['actual_result'] = actual_result
+    pred['home_goals'] = home_goals
+    pred['away_goals'] = away_goals
+    pred['handicap_outcome'] = outcome
+    pred['correct'] = None if outcome == 'push' else outcome in ('win', 'half_win')
+
+    # Over/Under outcome if logged
+    if pred.get('ou_line') is not None and pred.get('ou_pick'):
+        total_goals = (home_goals or 0) + (away_goals or 0)
+        line = float(pred['ou_line'])
+        # Standard Asian O/U grading (push if exactly equals line when using whole/half)
+        if total_goals > line:
+            ou_actual = 'Over'
+        elif total_goals < line:
+            ou_actual = 'Under'
+        else:
+            ou_actual = 'Push'
+        pred['ou_actual'] = ou_actual
+        pred['ou_correct'] = (ou_actual == pred['ou_pick']) if ou_actual != 'Push' else None
+
+    pred['settled_at'] = datetime.now().isoformat()
+
+
+def _update_strengths(pred: Dict[str, Any], home_goals: int, away_goals: int, match_date=None) -> None:
+    """
+    Cập nhật online Poisson strengths với kết quả vừa chốt.
+    Key dedupe = (đội nhà, đội khách, mùa giải): mỗi cặp sân nhà/sân khách chỉ gặp nhau một lần mỗi mùa,
+    nên nhiều prediction cho cùng một trận chỉ cập nhật một lần.
+    """
+    try:
+        home = canonical_team_name(pred['home_team'])
+        away = canonical_team_name(pred['away_team'])
+        when = pd.Timestamp(match_date or pred.get('timestamp') or datetime.now())
+        season = when.year if when.month >= 7 else when.year - 1
+        version = update_strengths_online(home, away, home_goals, away_goals,
+                                          result_key=f'{home}|{away}|{season}', match_date=when,
+                                          online_path=STRENGTHS_PATH)
+        logger.info(f'Strengths updated online: {home} {home_goals}-{away_goals} {away} (v{version})')
+    except Exception as e:
+        logger.warning(f'Không cập nhật được strengths: {e}')
+
+
+def _read_store():
+    """Store để đọc, sau khi các prediction đang chờ ghi đã xuống đĩa (None nếu chưa có gì)"""
+    flush_writes()
+    return get_store(create=False)
+
+
+def _result_label(correct: Optional[bool]) -> str:
+    return 'Push' if correct is None else ('Correct' if correct else 'Wrong')
+
+
 def update_result(
     prediction_id: str,
     home_goals: int,
     away_goals: int,
     handicap_value: float,
-) -> bool:
+) -> Optional[bool]:
     """
-    Cập nhật kết quả thực tế sau khi trận đấu kết thúc
+    Cập nhật kết quả thực tế sau khi trận đấu kết thúc.
+    Prediction đang chờ chỉ được chốt (và học vào strengths) bởi đúng một caller;
+    prediction đã chốt thì được ghi đè (sửa kết quả), strengths giữ nguyên.
     
     Returns:
-        True nếu prediction đúng, False nếu sai
+        True nếu prediction đúng, False nếu sai, None nếu hòa kèo (push)
     """
-    if not os.path.exists(PREDICTIONS_FILE):
-        logger.error('Predictions file not found')
+    store = _read_store()
+    pred = store.get(prediction_id) if store is not None else None
+    if pred is None:
+        logger.error(f'Prediction {prediction_id} not found')
         return False
     
-    with open(PREDICTIONS_FILE, 'r', encoding='utf-8') as f:
-        predictions = json.load(f)
-    
-    # Find prediction
-    for pred in predictions:
-        if pred['id'] == prediction_id:
-            # Calculate actual result with handicap
-            home_adjusted = home_goals + handicap_value
-            actual_result = 1 if home_adjusted > away_goals else 0
-            
-            pred['actual_result'] = actual_result
-            pred['home_goals'] = home_goals
-            pred['away_goals'] = away_goals
-            pred['correct'] = (pred['prediction'] == actual_result)
-
-            # Over/Under outcome if logged
-            if pred.get('ou_line') is not None and pred.get('ou_pick'):
-                total_goals = (home_goals or 0) + (away_goals or 0)
-                line = float(pred['ou_line'])
-                # Standard Asian O/U grading (push if exactly equals line when using whole/half)
-                if total_goals > line:
-                    ou_actual = 'Over'
-                elif total_goals < line:
-                    ou_actual = 'Under'
-                else:
-                    ou_actual = 'Push'
-                pred['ou_actual'] = ou_actual
-                pred['ou_correct'] = (ou_actual == pred['ou_pick']) if ou_actual != 'Push' else None
-            
-            # Save
-            with open(PREDICTIONS_FILE, 'w', encoding='utf-8') as f:
-                json.dump(predictions, f, indent=2, ensure_ascii=False)
-            
-            logger.info(f"Updated result for {prediction_id}: {'Correct' if pred['correct'] else 'Wrong'}")
-            
-            # Update stats
-            update_stats()
-            
-            return pred['correct']
-    
-    logger.error(f'Prediction {prediction_id} not found')
-    return False
+    was_pending = pred.get('actual_result') is None
+    _apply_result(pred, home_goals, away_goals, handicap_value)
+    if not was_pending:
+        store.update(pred)
+    elif store.settle(pred):
+        _update_strengths(pred, home_goals, away_goals)
+    else:
+        # Process khác (vd. settlement loop) vừa chốt trước: giữ kết quả của nó
+        current = store.get(prediction_id)
+        logger.info(f'Prediction {prediction_id} đã được chốt ở nơi khác')
+        return current.get('correct') if current else pred['correct']
+    
+    logger.info(f"Updated result for {prediction_id}: {_result_label(pred['correct'])} ({pred['handicap_outcome']})")
+    
+    # Update stats
+    update_stats()
+    
+    return pred['correct']
+
+
+def load_predictions(completed_only: bool = False, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Danh sách predictions theo thứ tự log (completed_only: chỉ các trận đã có kết quả,
+    limit: chỉ lấy `limit` predictions gần nhất)
+    """
+    store = _read_store()
+    if store is None:
+        return []
+    if completed_only:
+        return store.completed(limit=limit)
+    return store.recent(limit) if limit is not None else list(store.iter_all())
+
+
+def load_history(completed_only: bool = True, seasons: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Predictions của các mùa đã archive (prediction_archive.py) nối với các predictions
+    còn trong store - dùng để đánh giá model trên toàn bộ lịch sử.
+    seasons: chỉ đọc các partition này từ archive (vd. ['2023-24']).
+    """
+    from prediction_archive import iter_archived
+
+    store = _read_store()
+    hot = [] if store is None else (store.completed() if completed_only else list(store.iter_all()))
+    hot_ids = {p.get('id') for p in hot}
+    archive_dir = store.archive_dir if store is not None and store.archive_dir else prediction_store.ARCHIVE_DIR
+    archived = [p for p in iter_archived(seasons, archive_dir=archive_dir) if p.get('id') not in hot_ids]
+    return archived + hot
+
+
+def count_predictions() -> int:
+    store = _read_store()
+    return store.count() if store is not None else 0
+
+
+def find_pending_predictions(home_team: str, away_team: str) -> List[Dict[str, Any]]:
+    """
+    Các prediction chưa có kết quả cho cặp (đội nhà, đội khách), tra theo index
+    """
+    store = _read_store()
+    return store.find_by_teams(home_team, away_team) if store is not None else []
+
+
+def _rate(agg: Dict[str, Dict[str, float]], key: str) -> Dict[str, Any]:
+    entry = agg.get(key, {'n': 0, 'hits': 0, 'total': 0.0})
+    n, hits = int(entry['n']), int(entry['hits'])
+    return {'count': n, 'correct': hits, 'accuracy': hits / n if n else 0.0}
+
+
+def _summarize(agg: Dict[str, Dict[str, float]]) -> Dict[str, Any]:
+    """Dựng dict thống kê từ các bộ đếm (n, hits, total) của store."""
+    completed = int(agg.get('completed', {}).get('n', 0))
+    logged = int(agg.get('logged', {}).get('n', completed))
+    graded = _rate(agg, 'graded')
+
+    calibration = []
+    for low in CALIBRATION_BINS:
+        entry = agg.get(f'calib:{low:.1f}')
+        if entry and entry['n']:
+            calibration.append({'label': f'{low * 100:.0f}-{(low + 0.1) * 100:.0f}%',
+                                'count': int(entry['n']),
+                                'accuracy': entry['hits'] / entry['n'],
+                                'mean_confidence': entry['total'] / entry['n']})
+
+    ou = _rate(agg, 'ou')
+    ou_total = agg.get('ou', {}).get('total', 0.0)
+    ou['over_picks'] = int(round(ou_total))
+    ou['under_picks'] = ou['count'] - ou['over_picks']
+    ou['over_ratio'] = ou['over_picks'] / ou['count'] if ou['count'] else 0.0
+    ou['over'] = _rate(agg, 'ou_pick:Over')
+    ou['under'] = _rate(agg, 'ou_pick:Under')
+    ou['lines'] = {}
+    for key in sorted(k for k in agg if k.startswith('ou_line:')):
+        line_stats = _rate(agg, key)
+        line_stats['over_picks'] = int(round(agg[key]['total']))
+        ou['lines'][float(key.split(':', 1)[1])] = line_stats
+
+    goals_entry = agg.get('goals', {'n': 0, 'hits': 0, 'total': 0.0})
+    n_goals = int(goals_entry['n'])
+    goals = {'count': n_goals, 'mae': 0.0, 'mean_predicted': 0.0, 'mean_actual': 0.0, 'over_predictions': 0}
+    if n_goals:
+        goals.update({
+            'mae': goals_entry['total'] / n_goals,
+            'mean_predicted': agg['goals_predicted']['total'] / n_goals,
+            'mean_actual': agg['goals_actual']['total'] / n_goals,
+            'over_predictions': int(goals_entry['hits']),
+        })
+
+    return {
+        'total_predictions': logged,
+        'completed_predictions': completed,
+        'graded_predictions': graded['count'],
+        'push_predictions': completed - graded['count'],
+        'correct_predictions': graded['correct'],
+        'accuracy': graded['accuracy'],
+        'confidence': {band: _rate(agg, f'conf:{band}') for band in ('high', 'medium', 'low', 'very_high')},
+        'picks': {'home': _rate(agg, 'pick:home'), 'away': _rate(agg, 'pick:away')},
+        'calibration': calibration,
+        'ou': ou,
+        'goals': goals,
+    }
+
+
+def get_accuracy_summary() -> Optional[Dict[str, Any]]:
+    """
+    Toàn bộ thống kê accuracy (kèo chấp, theo độ tin cậy, calibration, O/U bias,
+    MAE tổng bàn) đọc từ bảng aggregates - không quét lại lịch sử predictions.
+    Hòa kèo không tính vào accuracy. None nếu chưa có prediction nào.
+    """
+    store = _read_store()
+    if store is None:
+        return None
+    return _summarize(store.aggregates())
+
+
+def season_start(today: Optional[date] = None) -> date:
+    """Ngày bắt đầu mùa giải chứa `today` (1/7)."""
+    return prediction_store.season_start(today or date.today())
+
+
+def get_window_summary(days: Optional[int] = None, since: Optional[date] = None,
+                       today: Optional[date] = None) -> Optional[Dict[str, Any]]:
+    """
+    Thống kê các predictions đã chốt có ngày đá trong cửa sổ [today - days + 1, today]
+    (hoặc [since, today]); cùng định dạng với get_accuracy_summary. Được cộng từ
+    metric buckets theo ngày/tuần - không quét predictions. Mặc định: từ đầu mùa.
+    """
+    store = _read_store()
+    if store is None:
+        return None
+    today = today or date.today()
+    if since is None:
+        since = today - timedelta(days=days - 1) if days else season_start(today)
+    return _summarize(store.window_aggregates(since, today))
+
+
+def get_rolling_summaries(today: Optional[date] = None) -> Optional[Dict[str, Dict[str, Any]]]:
+    """Thống kê 7/30/90 ngày gần nhất và mùa hiện tại: {'7d': ..., '30d': ..., '90d': ..., 'season': ...}."""
+    if _read_store() is None:
+        return None
+    today = today or date.today()
+    windows = {f'{days}d': get_window_summary(days=days, today=today) for days in ROLLING_WINDOWS}
+    windows['season'] = get_window_summary(today=today)
+    return windows
 
 
 def update_stats():
     """
     Tính toán và lưu statistics từ tất cả predictions
     """
-    if not os.path.exists(PREDICTIONS_FILE):
+    summary = get_accuracy_summary()
+    if summary is None:
         return
     
-    with open(PREDICTIONS_FILE, 'r', encoding='utf-8') as f:
-        predictions = json.load(f)
-    
-    # Filter predictions có kết quả
-    completed = [p for p in predictions if p['actual_result'] is not None]
-    
-    if not completed:
+    if not summary['completed_predictions']:
         logger.warning('No completed predictions to analyze')
         return
     
-    # Calculate statistics
-    total = len(completed)
-    correct = sum(1 for p in completed if p['correct'])
-    accuracy = correct / total if total > 0 else 0
-    
-    # Accuracy by confidence level
-    high_conf = [p for p in completed if p['confidence'] >= 0.7]
-    med_conf = [p for p in completed if 0.55 <= p['confidence'] < 0.7]
-    low_conf = [p for p in completed if p['confidence'] < 0.55]
+    # Đọc từ aggregates (hòa kèo không tính vào accuracy)
+    total = summary['graded_predictions']
+    correct = summary['correct_predictions']
+    accuracy = summary['accuracy']
+    confidence = summary['confidence']
     
     stats = {
         'last_updated': datetime.now().isoformat(),
-        'total_predictions': len(predictions),
-        'completed_predictions': total,
+        'total_predictions': summary['total_predictions'],
+        'completed_predictions': summary['completed_predictions'],
+        'graded_predictions': total,
+        'push_predictions': summary['push_predictions'],
         'correct_predictions': correct,
         'overall_accuracy': accuracy,
-        'high_confidence_accuracy': sum(1 for p in high_conf if p['correct']) / len(high_conf) if high_conf else 0,
-        'medium_confidence_accuracy': sum(1 for p in med_conf if p['correct']) / len(med_conf) if med_conf else 0,
-        'low_confidence_accuracy': sum(1 for p in low_conf if p['correct']) / len(low_conf) if low_conf else 0,
+        'high_confidence_accuracy': confidence['high']['accuracy'],
+        'medium_confidence_accuracy': confidence['medium']['accuracy'],
+        'low_confidence_accuracy': confidence['low']['accuracy'],
     }
     
-    # Save to CSV for easy analysis
+    # Save to CSV for easy analysis (ghi file tạm rồi replace: nhiều process có thể cùng ghi)
     df = pd.DataFrame([stats])
-    df.to_csv(STATS_FILE, index=False)
+    tmp_path = f'{STATS_FILE}.{os.getpid()}.tmp'
+    df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, STATS_FILE)
     
     logger.info(f"Stats updated: {correct}/{total} correct ({accuracy:.2%})")
     
@@ -187,15 +381,11 @@ def update_stats():
 
 def get_ou_accuracy(line: float) -> Dict[str, Any]:
     """Compute accuracy for Over/Under predictions at a given line (e.g., 2.5)."""
-    # Primary source: JSON predictions log
-    if os.path.exists(PREDICTIONS_FILE):
-        with open(PREDICTIONS_FILE, 'r', encoding='utf-8') as f:
-            predictions = json.load(f)
-
-        filtered = [p for p in predictions if p.get('ou_line') == float(line) and p.get('ou_correct') is not None]
-        count = len(filtered)
-        correct = sum(1 for p in filtered if p['ou_correct'])
-        acc = correct / count if count else 0.0
+    # Primary source: prediction store
+    store = _read_store()
+    if store is not None:
+        counts = _rate(store.aggregates([f'ou_line:{float(line)}']), f'ou_line:{float(line)}')
+        count, correct, acc = counts['count'], counts['correct'], counts['accuracy']
         if count:
             return {'line': line, 'count': count, 'correct': correct, 'accuracy': acc}
 
@@ -231,34 +421,193 @@ def get_stats() -> Optional[Dict[str, Any]]:
     """
     Lấy statistics hiện tại
     """
-    if not os.path.exists(PREDICTIONS_FILE):
+    store = _read_store()
+    if store is None:
         return None
+    summary = get_accuracy_summary()
     
-    with open(PREDICTIONS_FILE, 'r', encoding='utf-8') as f:
-        predictions = json.load(f)
-    
-    completed = [p for p in predictions if p['actual_result'] is not None]
-    
-    if not completed:
+    if not summary['completed_predictions']:
         return {
-            'total_predictions': len(predictions),
+            'total_predictions': summary['total_predictions'],
             'completed_predictions': 0,
             'accuracy': 0,
             'message': 'No completed predictions yet'
         }
     
-    total = len(completed)
-    correct = sum(1 for p in completed if p['correct'])
-    
     return {
-        'total_predictions': len(predictions),
-        'completed_predictions': total,
-        'correct_predictions': correct,
-        'accuracy': correct / total,
-        'recent_10': completed[-10:] if len(completed) >= 10 else completed
+        'total_predictions': summary['total_predictions'],
+        'completed_predictions': summary['completed_predictions'],
+        'graded_predictions': summary['graded_predictions'],
+        'push_predictions': summary['push_predictions'],
+        'correct_predictions': summary['correct_predictions'],
+        'accuracy': summary['accuracy'],
+        'recent_10': store.completed(limit=10)
     }
 
 
+def _day(value) -> Optional[str]:
+    """Ngày 'YYYY-MM-DD' của một timestamp ISO (None nếu không đọc được)"""
+    if not value:
+        return None
+    try:
+        return pd.Timestamp(value).strftime('%Y-%m-%d')
+    except (ValueError, TypeError):
+        return None
+
+
+def _fixture_day(pred: Dict[str, Any]) -> Optional[str]:
+    """Ngày thi đấu của prediction nếu biết (commence_time từ The Odds API)"""
+    if pred.get('match_date'):
+        return _day(pred['match_date'])
+    odds = pred.get('odds_data') or {}
+    if odds.get('source') == 'the_odds_api':
+        return _day(odds.get('timestamp'))
+    return None
+
+
+def _index_matches(matches: List[Dict[str, Any]]):
+    """
+    Index các trận đã kết thúc: (home, away, ngày) -> trận và (home, away) -> các trận theo ngày.
+    Tên đội được chuẩn hóa bằng canonical_team_name, mỗi trận chỉ chuẩn hóa một lần.
+    """
+    by_fixture: Dict[tuple, Dict[str, Any]] = {}
+    by_teams: Dict[tuple, List[tuple]] = {}
+    for match in matches:
+        score = (match.get('score') or {}).get('fullTime') or {}
+        if score.get('home') is None or score.get('away') is None:
+            continue
+        try:
+            home = canonical_team_name(match['homeTeam']['name'])
+            away = canonical_team_name(match['awayTeam']['name'])
+        except (KeyError, TypeError):
+            continue
+        day = _day(match.get('utcDate'))
+        by_fixture[(home, away, day)] = match
+        by_teams.setdefault((home, away), []).append((day or '', match))
+    for candidates in by_teams.values():
+        candidates.sort(key=lambda item: item[0])
+    return by_fixture, by_teams
+
+
+def _find_match(pred: Dict[str, Any], by_fixture: Dict[tuple, Dict[str, Any]],
+                by_teams: Dict[tuple, List[tuple]]) -> Optional[Dict[str, Any]]:
+    """
+    Trận ứng với một prediction: khớp đúng (home, away, ngày thi đấu) nếu biết ngày,
+    nếu không thì trận sớm nhất của cặp đấu kể từ ngày log prediction.
+    """
+    home = canonical_team_name(pred['home_team'])
+    away = canonical_team_name(pred['away_team'])
+    day = _fixture_day(pred)
+    if day is not None:
+        return by_fixture.get((home, away, day))
+    logged = _day(pred.get('timestamp')) or ''
+    for match_day, match in by_teams.get((home, away), ()):
+        if match_day >= logged:
+            return match
+    return None
+
+
+def fetch_finished_matches(api_key: str, days_back: int = 7) -> List[Dict[str, Any]]:
+    """
+    Các trận Ngoại Hạng Anh đã kết thúc trong `days_back` ngày qua (Football-Data API).
+    Lỗi HTTP / mạng được raise (requests.exceptions.RequestException) để caller tự backoff.
+    """
+    import requests
+    from datetime import timedelta
+    
+    date_from = (datetime.now() - timedelta(days=days_back)).strftime('%Y-%m-%d')
+    date_to = datetime.now().strftime('%Y-%m-%d')
+    
+    headers = {'X-Auth-Token': api_key}
+    url = 'https://api.football-data.org/v4/competitions/PL/matches'
+    params = {'dateFrom': date_from, 'dateTo': date_to, 'status': 'FINISHED'}
+    
+    response = requests.get(url, headers=headers, params=params, timeout=10)
+    response.raise_for_status()
+    matches = response.json().get('matches', [])
+    logger.info(f'Fetched {len(matches)} finished matches from API')
+    return matches
+
+
+def settle_from_matches(matches: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Chốt kết quả các predictions đang chờ từ danh sách trận đã kết thúc.
+    Stats chỉ được ghi lại khi có ít nhất một prediction được chốt.
+    
+    Returns:
+        Các prediction vừa được chốt
+    """
+    store = _read_store()
+    if store is None:
+        return []
+    
+    # Get pending predictions (index theo trạng thái pending)
+    pending = store.pending()
+    if not pending:
+        logger.info('No pending predictions to settle')
+        return []
+    
+    logger.info(f'Found {len(pending)} pending predictions')
+    
+    settled = []
+    by_fixture, by_teams = _index_matches(matches)
+    
+    for pred in pending:
+        # Tra cứu hash theo (đội nhà, đội khách, ngày) thay vì so chuỗi với mọi trận
+        match = _find_match(pred, by_fixture, by_teams)
+        if match is None:
+            continue
+        
+        score = match['score']['fullTime']
+        home_goals, away_goals = score['home'], score['away']
+        handicap = pred.get('handicap_value', 0.0) or 0.0
+        
+        _apply_result(pred, home_goals, away_goals, handicap)
+        pred['api_match_id'] = match.get('id')
+        if match.get('utcDate'):
+            pred.setdefault('match_date', match['utcDate'])
+        if not store.settle(pred):
+            # Process khác đã chốt prediction này từ lúc đọc danh sách pending
+            continue
+        _update_strengths(pred, home_goals, away_goals, match_date=match.get('utcDate'))
+        
+        settled.append(pred)
+        logger.info(f"Auto-updated: {pred['home_team']} {home_goals}-{away_goals} {pred['away_team']} | {_result_label(pred['correct'])}")
+    
+    if settled:
+        # Update stats
+        update_stats()
+        logger.info(f'✅ Settled {len(settled)} results')
+    
+    return settled
+
+
+def pending_kickoffs() -> tuple:
+    """
+    Giờ bóng lăn (UTC) của các predictions đang chờ kết quả.
+    
+    Returns:
+        (danh sách datetime đã biết, True nếu có prediction chưa biết giờ đá)
+    """
+    store = _read_store()
+    if store is None:
+        return [], False
+    kickoffs, has_unknown = [], False
+    for pred in store.pending():
+        odds = pred.get('odds_data') or {}
+        raw = pred.get('match_date') or (odds.get('timestamp') if odds.get('source') == 'the_odds_api' else None)
+        try:
+            ts = pd.Timestamp(raw) if raw else None
+        except (ValueError, TypeError):
+            ts = None
+        if ts is None:
+            has_unknown = True
+            continue
+        ts = ts.tz_localize('UTC') if ts.tzinfo is None else ts.tz_convert('UTC')
+        kickoffs.append(ts.to_pydatetime())
+    return kickoffs, has_unknown
+
+
 def auto_fetch_results(api_key: str, days_back: int = 7) -> int:
     """
     Tự động fetch kết quả từ Football-Data API cho các predictions chưa có kết quả.
@@ -271,103 +620,23 @@ def auto_fetch_results(api_key: str, days_back: int = 7) -> int:
         Số lượng predictions đã cập nhật
     """
     import requests
-    from datetime import datetime, timedelta
     
-    if not os.path.exists(PREDICTIONS_FILE):
-        logger.warning('No predictions file found')
+    store = _read_store()
+    if store is None:
+        logger.warning('No prediction store found')
         return 0
     
-    with open(PREDICTIONS_FILE, 'r', encoding='utf-8') as f:
-        predictions = json.load(f)
-    
-    # Get pending predictions
-    pending = [p for p in predictions if p.get('actual_result') is None]
-    
-    if not pending:
+    if not store.count(pending=True):
         logger.info('No pending predictions to fetch')
         return 0
     
-    logger.info(f'Found {len(pending)} pending predictions')
-    
-    # Fetch recent matches from API
-    date_from = (datetime.now() - timedelta(days=days_back)).strftime('%Y-%m-%d')
-    date_to = datetime.now().strftime('%Y-%m-%d')
-    
-    headers = {'X-Auth-Token': api_key}
-    url = 'https://api.football-data.org/v4/competitions/PL/matches'
-    params = {'dateFrom': date_from, 'dateTo': date_to, 'status': 'FINISHED'}
-    
     try:
-        response = requests.get(url, headers=headers, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
+        matches = fetch_finished_matches(api_key, days_back)
     except requests.exceptions.RequestException as e:
         logger.error(f'Failed to fetch results from API: {e}')
         return 0
     
-    matches = data.get('matches', [])
-    logger.info(f'Fetched {len(matches)} finished matches from API')
-    
-    updated_count = 0
-    
-    for pred in pending:
-        pred_home = pred['home_team'].lower().replace(' ', '').replace('fc', '').replace('_', '')
-        pred_away = pred['away_team'].lower().replace(' ', '').replace('fc', '').replace('_', '')
-        
-        # Try to find match in API results
-        for match in matches:
-            api_home = match['homeTeam']['name'].lower().replace(' ', '').replace('fc', '').replace('_', '')
-            api_away = match['awayTeam']['name'].lower().replace(' ', '').replace('fc', '').replace('_', '')
-            
-            # Fuzzy match (contains or is contained)
-            home_match = (pred_home in api_home or api_home in pred_home)
-            away_match = (pred_away in api_away or api_away in pred_away)
-            
-            if home_match and away_match:
-                score = match.get('score', {}).get('fullTime', {})
-                home_goals = score.get('home')
-                away_goals = score.get('away')
-                
-                if home_goals is not None and away_goals is not None:
-                    handicap = pred.get('handicap_value', 0.0) or 0.0
-                    
-                    # Update result
-                    home_adjusted = home_goals + handicap
-                    actual_result = 1 if home_adjusted > away_goals else 0
-                    
-                    pred['actual_result'] = actual_result
-                    pred['home_goals'] = home_goals
-                    pred['away_goals'] = away_goals
-                    pred['correct'] = (pred['prediction'] == actual_result)
-                    pred['api_match_id'] = match.get('id')
-                    
-                    # O/U result
-                    if pred.get('ou_line') is not None and pred.get('ou_pick'):
-                        total_goals = home_goals + away_goals
-                        line = float(pred['ou_line'])
-                        if total_goals > line:
-                            ou_actual = 'Over'
-                        elif total_goals < line:
-                            ou_actual = 'Under'
-                        else:
-                            ou_actual = 'Push'
-                        pred['ou_actual'] = ou_actual
-                        pred['ou_correct'] = (ou_actual == pred['ou_pick']) if ou_actual != 'Push' else None
-                    
-                    updated_count += 1
-                    logger.info(f"Auto-updated: {pred['home_team']} {home_goals}-{away_goals} {pred['away_team']} | {'Correct' if pred['correct'] else 'Wrong'}")
-                    break
-    
-    if updated_count > 0:
-        # Save updated predictions
-        with open(PREDICTIONS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(predictions, f, indent=2, ensure_ascii=False)
-        
-        # Update stats
-        update_stats()
-        logger.info(f'✅ Auto-fetched and updated {updated_count} results')
-    
-    return updated_count
+    return len(settle_from_matches(matches))
 
 
 def print_report():
@@ -392,7 +661,7 @@ def print_report():
         
         print('\nRecent predictions:')
         for p in stats.get('recent_10', []):
-            result = '✓' if p['correct'] else '✗'
+            result = '•' if p['correct'] is None else ('✓' if p['correct'] else '✗')
             print(f"  {result} {p['home_team']} vs {p['away_team']} - Confidence: {p['confidence']:.1%}")
     
     print('='*50)
@@ -11,11 +11,17 @@ import os
 import logging
 from typing import Dict, Any, Optional
 import pickle
-from datetime import datetime
+import hashlib
+import random
 
 import pandas as pd
 import numpy as np
-from poisson_model import load_or_fit_strengths, expected_goals as pois_expected_goals, score_matrix, top_scorelines as pois_top_scorelines, ou_probabilities as pois_ou_probabilities
+from poisson_model import load_or_fit_strengths, load_rho, expected_goals as pois_expected_goals, MatchDistribution, CACHE_PATH as POISSON_STRENGTHS_PATH, ONLINE_PATH as POISSON_ONLINE_PATH
+from tree_inference import compile_tree_model, verify_compiled
+from analysis_cache import TTLCache, bundle_hash
+from artifact_cache import load_artifact
+from team_names import canonical_team_name
+from asian_handicap import AH_LINES, handicap_ladder, fair_line
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -34,6 +40,9 @@ _MODEL_SINGLETON = None
 _GOALS_MODEL_SINGLETON = None
 _SCALER_SINGLETON = None
 _GOALS_SCALER_SINGLETON = None
+# Compiled tree backends: None = chưa thử, False = không hỗ trợ (dùng sklearn)
+_COMPILED_MODEL_SINGLETON = None
+_COMPILED_GOALS_SINGLETON = None
 
 
 def load_model():
@@ -82,6 +91,36 @@ def load_goals_model():
         return None
 
 
+def _compile_or_false(model):
+    """Compile tree ensemble sang array backend; trả về False nếu không hỗ trợ hoặc lệch sklearn."""
+    if model is None:
+        return False
+    compiled = compile_tree_model(model)
+    if compiled is None:
+        return False
+    if not verify_compiled(compiled, model):
+        logger.warning(f'Compiled backend lệch với sklearn cho {type(model).__name__}, dùng sklearn')
+        return False
+    logger.info(f'Đã compile {type(model).__name__}: {compiled.n_trees} trees, depth {compiled.max_depth}')
+    return compiled
+
+
+def load_compiled_model():
+    """Array-based backend cho model kèo chấp (None nếu phải dùng sklearn)."""
+    global _COMPILED_MODEL_SINGLETON
+    if _COMPILED_MODEL_SINGLETON is None:
+        _COMPILED_MODEL_SINGLETON = _compile_or_false(load_model())
+    return _COMPILED_MODEL_SINGLETON or None
+
+
+def load_compiled_goals_model():
+    """Array-based backend cho goals model (None nếu phải dùng sklearn)."""
+    global _COMPILED_GOALS_SINGLETON
+    if _COMPILED_GOALS_SINGLETON is None:
+        _COMPILED_GOALS_SINGLETON = _compile_or_false(load_goals_model())
+    return _COMPILED_GOALS_SINGLETON or None
+
+
 def load_scaler(scaler_path):
     """Load scaler với singleton cache để tránh load nhiều lần."""
     global _SCALER_SINGLETON, _GOALS_SCALER_SINGLETON
@@ -106,11 +145,10 @@ def load_scaler(scaler_path):
 
 def align_features(df: pd.DataFrame, feature_list_path: str) -> pd.DataFrame:
     """Align columns of df to the saved feature list: order columns and add any missing with zeros."""
-    if not os.path.exists(feature_list_path):
+    cols = load_artifact(feature_list_path)
+    if cols is None:
         return df
     try:
-        with open(feature_list_path, 'rb') as f:
-            cols = pickle.load(f)
         # Add missing columns as 0
         for c in cols:
             if c not in df.columns:
@@ -127,7 +165,29 @@ def align_features(df: pd.DataFrame, feature_list_path: str) -> pd.DataFrame:
         return None
 
 
-_GOALS_CACHE: Dict[str, Dict[str, Any]] = {}
+# Cache tổng bàn theo cặp đội (bounded + TTL để không phình bộ nhớ)
+_GOALS_CACHE = TTLCache(maxsize=256, ttl=3600)
+
+
+def model_bundle_hash() -> str:
+    """Hash của toàn bộ artifacts ảnh hưởng tới kết quả phân tích (đổi file -> đổi hash)."""
+    return bundle_hash([
+        MODEL_PATH, SCALER_PATH, GOALS_MODEL_PATH, GOALS_SCALER_PATH,
+        MATCH_FEATURES_PATH, GOALS_FEATURES_PATH, GOALS_CALIBRATION_PATH,
+        POISSON_STRENGTHS_PATH, POISSON_ONLINE_PATH,
+    ])
+
+
+def _feature_rng(home_stats: Dict[str, Any], away_stats: Dict[str, Any],
+                 odds_data: Optional[Dict[str, Any]]) -> random.Random:
+    """RNG có seed theo input để jitter bookmaker ổn định (cùng input -> cùng features)."""
+    seed_src = '|'.join([
+        str(home_stats.get('team_name', '')),
+        str(away_stats.get('team_name', '')),
+        str(odds_data.get('handicap_value') if odds_data else None),
+    ])
+    return random.Random(int(hashlib.md5(seed_src.encode()).hexdigest()[:8], 16))
+
 
 def prepare_features(home_stats: Dict[str, Any], away_stats: Dict[str, Any],
                      odds_data: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
@@ -146,7 +206,7 @@ def prepare_features(home_stats: Dict[str, Any], away_stats: Dict[str, Any],
     Returns:
         DataFrame chứa một dòng với đúng 105 features
     """
-    import random
+    rng = _feature_rng(home_stats, away_stats, odds_data)
     
     features = {}
     
@@ -198,9 +258,9 @@ def prepare_features(home_stats: Dict[str, Any], away_stats: Dict[str, Any],
     
     # Other bookmakers (slight variations)
     for prefix in ['BW', 'IW', 'PS', 'WH', 'VC']:
-        features[f'{prefix}H'] = home_odd * (0.95 + random.random() * 0.1)
-        features[f'{prefix}D'] = draw_odd * (0.95 + random.random() * 0.1)
-        features[f'{prefix}A'] = away_odd * (0.95 + random.random() * 0.1)
+        features[f'{prefix}H'] = home_odd * (0.95 + rng.random() * 0.1)
+        features[f'{prefix}D'] = draw_odd * (0.95 + rng.random() * 0.1)
+        features[f'{prefix}A'] = away_odd * (0.95 + rng.random() * 0.1)
     
     # Max/Avg odds
     features['MaxH'] = home_odd * 1.05
@@ -247,9 +307,9 @@ def prepare_features(home_stats: Dict[str, Any], away_stats: Dict[str, Any],
     
     # === CLOSING ODDS (similar to opening) ===
     for prefix in ['B365C', 'BWC', 'IWC', 'PSC', 'WHC', 'VCC']:
-        features[f'{prefix}H'] = home_odd * (0.97 + random.random() * 0.06)
-        features[f'{prefix}D'] = draw_odd * (0.97 + random.random() * 0.06)
-        features[f'{prefix}A'] = away_odd * (0.97 + random.random() * 0.06)
+        features[f'{prefix}H'] = home_odd * (0.97 + rng.random() * 0.06)
+        features[f'{prefix}D'] = draw_odd * (0.97 + rng.random() * 0.06)
+        features[f'{prefix}A'] = away_odd * (0.97 + rng.random() * 0.06)
     
     features['MaxCH'] = home_odd * 1.04
     features['MaxCD'] = draw_odd * 1.04
@@ -330,14 +390,21 @@ def predict_match(home_stats: Dict[str, Any], away_stats: Dict[str, Any],
     try:
         # Dự đoán
         # prediction = 1 nghĩa là đội nhà thắng kèo, 0 nghĩa là đội khách thắng kèo
-        prediction = model.predict(features_df)[0]
-        
-        # Lấy xác suất (confidence)
-        if hasattr(model, 'predict_proba'):
-            probabilities = model.predict_proba(features_df)[0]
+        compiled = load_compiled_model()
+        if compiled is not None:
+            # Array backend: một lần traversal cho cả prediction và xác suất
+            probabilities = compiled.predict_proba(features_df.to_numpy(dtype=np.float64))[0]
+            prediction = compiled.classes_[int(np.argmax(probabilities))]
             confidence = probabilities[int(prediction)]
         else:
-            confidence = 0.6  # Default confidence nếu model không hỗ trợ predict_proba
+            prediction = model.predict(features_df)[0]
+
+            # Lấy xác suất (confidence)
+            if hasattr(model, 'predict_proba'):
+                probabilities = model.predict_proba(features_df)[0]
+                confidence = probabilities[int(prediction)]
+            else:
+                confidence = 0.6  # Default confidence nếu model không hỗ trợ predict_proba
         
         # Tạo khuyến nghị
         if prediction == 1:
@@ -492,7 +559,11 @@ def predict_total_goals(home_stats: Dict[str, Any], away_stats: Dict[str, Any],
             features_for_model = pd.DataFrame(features_scaled, columns=list(features_df.columns))
         else:
             features_for_model = features_scaled
-        raw_pred = float(goals_model.predict(features_for_model)[0])
+        compiled = load_compiled_goals_model()
+        if compiled is not None:
+            raw_pred = float(compiled.predict(features_for_model.to_numpy(dtype=np.float64))[0])
+        else:
+            raw_pred = float(goals_model.predict(features_for_model)[0])
         logger.debug(f'RAW goals prediction (trước calibration): {raw_pred:.4f}')
 
         # --- Calibration towards league mean ---
@@ -501,9 +572,8 @@ def predict_total_goals(home_stats: Dict[str, Any], away_stats: Dict[str, Any],
         calib_used = False
         shrink_factor = None
         try:
-            if os.path.exists(GOALS_CALIBRATION_PATH):
-                with open(GOALS_CALIBRATION_PATH, 'rb') as f:
-                    calib = pickle.load(f)
+            calib = load_artifact(GOALS_CALIBRATION_PATH)
+            if calib is not None:
                 league_mean = float(calib.get('league_mean', league_mean))
                 shrink_factor = float(calib.get('shrink_factor')) if 'shrink_factor' in calib else None
                 calib_used = True
@@ -527,10 +597,7 @@ def predict_total_goals(home_stats: Dict[str, Any], away_stats: Dict[str, Any],
         predicted_goals = calibrated
         # Cache theo cặp đội để tránh tính lại
         match_key = f"{home_stats.get('team_name','home')}__{away_stats.get('team_name','away')}".lower()
-        _GOALS_CACHE[match_key] = {
-            'predicted_goals': float(predicted_goals),
-            'timestamp': datetime.now().timestamp()
-        }
+        _GOALS_CACHE.set(match_key, {'predicted_goals': float(predicted_goals)})
         
         # Phân tích Over/Under 2.5
         if predicted_goals > 2.75:
@@ -604,32 +671,35 @@ def predict_goals_without_model(home_stats: Dict[str, Any], away_stats: Dict[str
     }
 
 
-def predict_multiline_ou(home_stats: Dict[str, Any], away_stats: Dict[str, Any],
-                         odds_data: Optional[Dict[str, Any]] = None,
-                         predicted_goals: Optional[float] = None) -> Dict[str, Any]:
-    """
-    Dự đoán Over/Under cho nhiều mốc (1.5, 2.5, 3.5) dựa trên phân phối Poisson
-    
-    Returns:
-        Dict chứa xác suất Over/Under cho từng mốc
-    """
-    # Lấy lambda từ Poisson hoặc fallback
-    home_name = home_stats.get('team_name', 'Home')
-    away_name = away_stats.get('team_name', 'Away')
-    
+def _poisson_lambdas(home_stats: Dict[str, Any], away_stats: Dict[str, Any]) -> tuple:
+    """Lambda Poisson từ strengths lịch sử; fallback theo stats gần đây."""
+    home_name = canonical_team_name(home_stats.get('team_name', 'Home'))
+    away_name = canonical_team_name(away_stats.get('team_name', 'Away'))
     try:
         strengths, mu_home, mu_away = load_or_fit_strengths()
-        lam_h, lam_a = pois_expected_goals(home_name, away_name, strengths, mu_home, mu_away)
+        return pois_expected_goals(home_name, away_name, strengths, mu_home, mu_away)
     except Exception:
         lam_h = max(0.2, 0.6 * home_stats.get('goals_scored_avg', 1.4) + 0.4 * away_stats.get('goals_conceded_avg', 1.2)) * 1.05
         lam_a = max(0.2, 0.6 * away_stats.get('goals_scored_avg', 1.2) + 0.4 * home_stats.get('goals_conceded_avg', 1.0))
-    
+        return lam_h, lam_a
+
+
+def build_match_distribution(home_stats: Dict[str, Any], away_stats: Dict[str, Any],
+                             odds_data: Optional[Dict[str, Any]] = None,
+                             predicted_goals: Optional[float] = None) -> MatchDistribution:
+    """
+    Tính phân phối tỉ số MỘT lần cho trận đấu; mọi thị trường (1X2, O/U, BTTS, tỉ số)
+    đều suy ra từ object này để nhất quán với nhau.
+    """
+    lam_h, lam_a = _poisson_lambdas(home_stats, away_stats)
+
     # Điều chỉnh theo model regression nếu có
     if predicted_goals is None:
         # check cache to avoid duplicate model inference
         match_key = f"{home_stats.get('team_name','home')}__{away_stats.get('team_name','away')}".lower()
-        if match_key in _GOALS_CACHE:
-            predicted_goals = _GOALS_CACHE[match_key]['predicted_goals']
+        cached = _GOALS_CACHE.get(match_key)
+        if cached is not None:
+            predicted_goals = cached['predicted_goals']
         else:
             reg = predict_total_goals(home_stats, away_stats, odds_data)
             predicted_goals = reg.get('predicted_goals') if reg else None
@@ -641,13 +711,27 @@ def predict_multiline_ou(home_stats: Dict[str, Any], away_stats: Dict[str, Any],
             scale = total_target / total_current
             lam_h *= scale
             lam_a *= scale
+
+    # rho: hiệu chỉnh Dixon-Coles cho các tỉ số thấp (0 nếu strengths là ratio)
+    return MatchDistribution(lam_h, lam_a, rho=load_rho())
+
+
+def predict_multiline_ou(home_stats: Dict[str, Any], away_stats: Dict[str, Any],
+                         odds_data: Optional[Dict[str, Any]] = None,
+                         predicted_goals: Optional[float] = None,
+                         distribution: Optional[MatchDistribution] = None) -> Dict[str, Any]:
+    """
+    Dự đoán Over/Under cho nhiều mốc (1.5, 2.5, 3.5) dựa trên phân phối Poisson
     
-    # Tính xác suất cho từng mốc
-    prob = score_matrix(lam_h, lam_a, max_goals=8)
+    Returns:
+        Dict chứa xác suất Over/Under cho từng mốc
+    """
+    if distribution is None:
+        distribution = build_match_distribution(home_stats, away_stats, odds_data, predicted_goals)
     
     results = {}
     for line in [1.5, 2.5, 3.5]:
-        over, under, push = pois_ou_probabilities(prob, line)
+        over, under, push = distribution.over_under(line)
         results[f'{line}'] = {
             'line': line,
             'over_prob': float(over),
@@ -661,57 +745,61 @@ def predict_multiline_ou(home_stats: Dict[str, Any], away_stats: Dict[str, Any],
 
 
 def predict_correct_score(home_stats: Dict[str, Any], away_stats: Dict[str, Any],
-                          predicted_goals: Optional[float] = None) -> Dict[str, Any]:
+                          predicted_goals: Optional[float] = None,
+                          distribution: Optional[MatchDistribution] = None) -> Dict[str, Any]:
     """
     Dự đoán tỉ số chính xác sử dụng mô hình Poisson, có hiệu chỉnh theo tổng bàn từ model regression nếu có.
-    Trả về top 5 tỉ số khả dĩ và xác suất O/U 2.5.
+    Trả về top 5 tỉ số khả dĩ, xác suất O/U 2.5, 1X2 và BTTS (cùng một phân phối).
     """
-    home_name = home_stats.get('team_name', 'Home')
-    away_name = away_stats.get('team_name', 'Away')
+    if distribution is None:
+        distribution = build_match_distribution(home_stats, away_stats, predicted_goals=predicted_goals)
 
-    # 1) Poisson strengths from historical data
-    try:
-        strengths, mu_home, mu_away = load_or_fit_strengths()
-        lam_h, lam_a = pois_expected_goals(home_name, away_name, strengths, mu_home, mu_away)
-    except Exception:
-        # Fallback using recent stats
-        lam_h = max(0.2, 0.6 * home_stats.get('goals_scored_avg', 1.4) + 0.4 * away_stats.get('goals_conceded_avg', 1.2)) * 1.05
-        lam_a = max(0.2, 0.6 * away_stats.get('goals_scored_avg', 1.2) + 0.4 * home_stats.get('goals_conceded_avg', 1.0))
-
-    # 2) Align with regression total goals if available
-    if predicted_goals is None:
-        match_key = f"{home_name}__{away_name}".lower()
-        if match_key in _GOALS_CACHE:
-            predicted_goals = _GOALS_CACHE[match_key]['predicted_goals']
-        else:
-            reg = predict_total_goals(home_stats, away_stats)
-            predicted_goals = reg.get('predicted_goals') if reg else None
-
-    if predicted_goals is not None:
-        total_target = max(0.1, float(predicted_goals))
-        total_current = lam_h + lam_a
-        if total_current > 0:
-            scale = total_target / total_current
-            lam_h *= scale
-            lam_a *= scale
-
-    # 3) Build probability matrix
-    prob = score_matrix(lam_h, lam_a, max_goals=6)
-    top5 = pois_top_scorelines(prob, n=5)
-    over, under, push = pois_ou_probabilities(prob, 2.5)
+    top5 = distribution.top_scorelines(n=5)
+    over, under, push = distribution.over_under(2.5)
+    home_win, draw, away_win = distribution.one_x_two()
 
     # Choose best correct score
     best_score, best_prob = top5[0]
 
     return {
-        'lambda_home': float(lam_h),
-        'lambda_away': float(lam_a),
+        'lambda_home': distribution.lam_home,
+        'lambda_away': distribution.lam_away,
         'top_scorelines': top5,
         'best_correct_score': best_score,
         'best_correct_score_prob': float(best_prob),
         'ou_over_prob_2_5': float(over),
         'ou_under_prob_2_5': float(under),
-        'ou_push_prob_2_5': float(push)
+        'ou_push_prob_2_5': float(push),
+        'home_win_prob': home_win,
+        'draw_prob': draw,
+        'away_win_prob': away_win,
+        'btts_prob': distribution.btts(),
+    }
+
+
+def predict_asian_handicap(home_stats: Dict[str, Any], away_stats: Dict[str, Any],
+                           odds_data: Optional[Dict[str, Any]] = None,
+                           predicted_goals: Optional[float] = None,
+                           distribution: Optional[MatchDistribution] = None) -> Dict[str, Any]:
+    """
+    Bảng kèo chấp Châu Á đầy đủ (-3 đến +3, bước 0.25) từ phân phối hiệu số bàn thắng.
+    Mỗi mốc có xác suất thắng / thắng nửa / hòa / thua nửa / thua (góc nhìn đội nhà) và odds công bằng.
+    """
+    if distribution is None:
+        distribution = build_match_distribution(home_stats, away_stats, odds_data, predicted_goals=predicted_goals)
+
+    ladder = handicap_ladder(distribution.goal_diff, AH_LINES)
+    market_line = odds_data.get('handicap_value') if odds_data else None
+    market = None
+    if market_line is not None:
+        market_line = round(float(market_line) * 4) / 4
+        market = next((r for r in ladder if r['line'] == market_line), None)
+
+    return {
+        'ladder': ladder,
+        'fair_line': fair_line(ladder),
+        'market_line': market_line,
+        'market': market,
     }
 
 
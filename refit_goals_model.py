@@ -19,6 +19,8 @@ from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
 from sklearn.linear_model import LinearRegression
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 
+from artifact_cache import store_artifact
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -27,6 +29,7 @@ GOALS_MODEL_PATH = 'epl_goals_model.pkl'
 GOALS_SCALER_PATH = 'goals_scaler.pkl'
 GOALS_FEATURES_PATH = 'goals_features.pkl'
 GOALS_CALIBRATION_PATH = 'goals_calibration.pkl'
+ARTIFACT_CODE_VERSION = '1'
 
 EXCLUDE_COLS = {
     'FTHG', 'FTAG', 'FTR', 'HTHG', 'HTAG', 'HTR', 'Date', 'HomeTeam', 'AwayTeam', 'Season', 'handicap_result'
@@ -115,15 +118,12 @@ def choose_and_save(results: Dict[str, Dict[str, Any]], X: pd.DataFrame, y_val:
         'model': best_name
     }
 
-    # Save artifacts
+    # Save artifacts (scaler / features / calibration are recorded in the artifact manifest)
     with open(GOALS_MODEL_PATH, 'wb') as f:
         pickle.dump(model, f)
-    with open(GOALS_SCALER_PATH, 'wb') as f:
-        pickle.dump(scaler, f)
-    with open(GOALS_FEATURES_PATH, 'wb') as f:
-        pickle.dump(list(X.columns), f)
-    with open(GOALS_CALIBRATION_PATH, 'wb') as f:
-        pickle.dump(calibration, f)
+    store_artifact(GOALS_SCALER_PATH, scaler, [DATASET_PATH], ARTIFACT_CODE_VERSION)
+    store_artifact(GOALS_FEATURES_PATH, list(X.columns), [DATASET_PATH], ARTIFACT_CODE_VERSION)
+    store_artifact(GOALS_CALIBRATION_PATH, calibration, [DATASET_PATH], ARTIFACT_CODE_VERSION)
     logger.info(f'Saved best goals model: {best_name} (MAE={best["mae"]:.3f})')
     logger.info(f'Calibration -> league_mean={league_mean:.2f} shrink_factor={shrink_factor:.2f}')
 
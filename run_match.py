@@ -1,7 +1,7 @@
 import os
 import logging
 from data_collector import get_team_stats, get_odds_data
-from predictor import predict_match, predict_total_goals, predict_multiline_ou, predict_correct_score
+from predictor import predict_match, predict_total_goals, predict_multiline_ou, predict_correct_score, build_match_distribution
 
 logging.basicConfig(level=logging.DEBUG)
 
@@ -17,8 +17,9 @@ def run(home, away):
     pm = predict_match(hs, as_, odds)
     pg = predict_total_goals(hs, as_, odds)
     pred_goals = pg.get('predicted_goals') if pg else None
-    ml = predict_multiline_ou(hs, as_, odds, predicted_goals=pred_goals)
-    cs = predict_correct_score(hs, as_, predicted_goals=pred_goals)
+    dist = build_match_distribution(hs, as_, odds, predicted_goals=pred_goals)
+    ml = predict_multiline_ou(hs, as_, odds, distribution=dist)
+    cs = predict_correct_score(hs, as_, distribution=dist)
 
     print("\n-- Handicap prediction --")
     print(pm)
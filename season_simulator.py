@@ -0,0 +1,227 @@
+"""
+season_simulator.py - Monte Carlo simulation of the rest of the EPL season
+
+Plays the remaining fixtures many times with Poisson goals drawn from the
+strengths in poisson_model, then aggregates title / top-4 / relegation
+probabilities, expected points and expected final position for every team.
+
+Each chunk of simulations samples goals as (simulations x fixtures) arrays
+and builds the league table with matrix products; chunks run on a process
+pool.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from poisson_model import load_or_fit_strengths, expected_goals_batch
+from team_names import canonical_team_name
+
+logger = logging.getLogger(__name__)
+
+N_SIMULATIONS = 100_000
+CHUNK_SIZE = 10_000
+TOP_N = 4
+RELEGATION_SPOTS = 3
+
+# Trạng thái Football-Data: trận còn phải đá / trận không chặn việc chốt vòng đấu
+_PENDING_STATUSES = {'SCHEDULED', 'TIMED', 'IN_PLAY', 'PAUSED', 'POSTPONED', 'SUSPENDED'}
+_SETTLED_STATUSES = {'FINISHED', 'AWARDED', 'POSTPONED', 'CANCELLED'}
+
+_EXECUTOR: Optional[ProcessPoolExecutor] = None
+_EXECUTOR_WORKERS = 0
+
+
+def _get_executor(workers: int) -> ProcessPoolExecutor:
+    """Process pool dùng lại giữa các lần mô phỏng (tạo process chỉ một lần)."""
+    global _EXECUTOR, _EXECUTOR_WORKERS
+    if _EXECUTOR is None or _EXECUTOR_WORKERS != workers:
+        if _EXECUTOR is not None:
+            _EXECUTOR.shutdown(wait=False)
+        _EXECUTOR = ProcessPoolExecutor(max_workers=workers)
+        _EXECUTOR_WORKERS = workers
+    return _EXECUTOR
+
+
+def parse_season_matches(matches: Iterable[Dict[str, Any]]) -> Tuple[List[tuple], List[tuple]]:
+    """
+    Split Football-Data.org matches into played (home, away, hg, ag) and
+    remaining (home, away) fixtures, using canonical team names.
+    """
+    played, remaining = [], []
+    for m in matches:
+        home = canonical_team_name(m['homeTeam']['name'])
+        away = canonical_team_name(m['awayTeam']['name'])
+        status = m.get('status')
+        score = (m.get('score') or {}).get('fullTime') or {}
+        if status in ('FINISHED', 'AWARDED') and score.get('home') is not None and score.get('away') is not None:
+            played.append((home, away, int(score['home']), int(score['away'])))
+        elif status in _PENDING_STATUSES:
+            remaining.append((home, away))
+    return played, remaining
+
+
+def settled_gameweek(matches: Iterable[Dict[str, Any]]) -> int:
+    """Vòng đấu cao nhất mà mọi trận (trừ trận hoãn) đã có kết quả."""
+    open_rounds = set()
+    rounds = set()
+    for m in matches:
+        md = m.get('matchday')
+        if md is None:
+            continue
+        rounds.add(md)
+        if m.get('status') not in _SETTLED_STATUSES:
+            open_rounds.add(md)
+    settled = 0
+    for md in sorted(rounds):
+        if md in open_rounds:
+            break
+        settled = md
+    return settled
+
+
+def _simulate_chunk(lam_home: np.ndarray, lam_away: np.ndarray,
+                    home_onehot: np.ndarray, away_onehot: np.ndarray,
+                    base_points: np.ndarray, base_gd: np.ndarray, base_gf: np.ndarray,
+                    n_sims: int, seed) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Simulate n_sims seasons. Returns (position_counts[T, T], points_sum[T]),
+    where position_counts[t, p] counts how often team t finished in place p.
+    """
+    rng = np.random.default_rng(seed)
+    n_teams = home_onehot.shape[1]
+    hg = rng.poisson(lam_home, size=(n_sims, len(lam_home))).astype(np.float32)
+    ag = rng.poisson(lam_away, size=(n_sims, len(lam_away))).astype(np.float32)
+
+    home_pts = 3.0 * (hg > ag) + (hg == ag)
+    away_pts = 3.0 * (ag > hg) + (hg == ag)
+    points = base_points + home_pts @ home_onehot + away_pts @ away_onehot
+    scored = hg @ home_onehot + ag @ away_onehot
+    conceded = hg @ away_onehot + ag @ home_onehot
+    gf = base_gf + scored
+    gd = base_gd + scored - conceded
+
+    # Xếp hạng: điểm > hiệu số > bàn thắng > ngẫu nhiên (thay cho đối đầu)
+    key = points * 1e6 + (gd + 500.0) * 1e3 + gf + rng.random((n_sims, n_teams), dtype=np.float32)
+    order = np.argsort(-key, axis=1)
+    flat = order * n_teams + np.arange(n_teams)[None, :]
+    counts = np.bincount(flat.ravel(), minlength=n_teams * n_teams).reshape(n_teams, n_teams)
+    return counts, points.sum(axis=0, dtype=np.float64)
+
+
+def _base_table(teams: Sequence[str], played: Sequence[tuple]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    index = {t: i for i, t in enumerate(teams)}
+    points = np.zeros(len(teams))
+    gd = np.zeros(len(teams))
+    gf = np.zeros(len(teams))
+    for home, away, hg, ag in played:
+        h, a = index[home], index[away]
+        gf[h] += hg
+        gf[a] += ag
+        gd[h] += hg - ag
+        gd[a] += ag - hg
+        if hg > ag:
+            points[h] += 3
+        elif hg < ag:
+            points[a] += 3
+        else:
+            points[h] += 1
+            points[a] += 1
+    return points, gd, gf
+
+
+def simulate_season(played: Sequence[tuple], remaining: Sequence[tuple],
+                    strengths: Optional[Dict[str, Dict[str, float]]] = None,
+                    mu_home: Optional[float] = None, mu_away: Optional[float] = None,
+                    n_sims: int = N_SIMULATIONS, workers: Optional[int] = None,
+                    seed: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Monte Carlo the remaining fixtures.
+
+    played: [(home, away, home_goals, away_goals)], remaining: [(home, away)].
+    workers=1 runs in-process; default uses one process per CPU.
+    """
+    if strengths is None:
+        strengths, mu_home, mu_away = load_or_fit_strengths()
+
+    teams = sorted({t for m in played for t in m[:2]} | {t for m in remaining for t in m[:2]})
+    index = {t: i for i, t in enumerate(teams)}
+    base_points, base_gd, base_gf = _base_table(teams, played)
+
+    home_idx = np.array([index[h] for h, _ in remaining], dtype=int)
+    away_idx = np.array([index[a] for _, a in remaining], dtype=int)
+    lam_home, lam_away = expected_goals_batch([h for h, _ in remaining], [a for _, a in remaining],
+                                              strengths, mu_home, mu_away)
+    eye = np.eye(len(teams), dtype=np.float32)
+    home_onehot = eye[home_idx]
+    away_onehot = eye[away_idx]
+
+    sizes = [CHUNK_SIZE] * (n_sims // CHUNK_SIZE)
+    if n_sims % CHUNK_SIZE:
+        sizes.append(n_sims % CHUNK_SIZE)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    common = (lam_home, lam_away, home_onehot, away_onehot, base_points, base_gd, base_gf)
+
+    workers = workers or os.cpu_count() or 1
+    results = None
+    if workers > 1 and len(sizes) > 1:
+        try:
+            pool = _get_executor(min(workers, len(sizes)))
+            futures = [pool.submit(_simulate_chunk, *common, size, s) for size, s in zip(sizes, seeds)]
+            results = [f.result() for f in futures]
+        except Exception as e:
+            logger.warning(f'Process pool failed, simulating in-process: {e}')
+            results = None
+    if results is None:
+        results = [_simulate_chunk(*common, size, s) for size, s in zip(sizes, seeds)]
+
+    counts = sum(r[0] for r in results)
+    points_sum = sum(r[1] for r in results)
+    probs = counts / float(n_sims)
+    positions = np.arange(1, len(teams) + 1)
+
+    table = []
+    for t, team in enumerate(teams):
+        table.append({
+            'team': team,
+            'current_points': int(base_points[t]),
+            'expected_points': float(points_sum[t] / n_sims),
+            'expected_position': float(probs[t] @ positions),
+            'title_prob': float(probs[t, 0]),
+            'top4_prob': float(probs[t, :TOP_N].sum()),
+            'relegation_prob': float(probs[t, len(teams) - RELEGATION_SPOTS:].sum()) if len(teams) > RELEGATION_SPOTS else 0.0,
+        })
+    table.sort(key=lambda r: (r['expected_position'], -r['expected_points']))
+
+    return {
+        'n_sims': n_sims,
+        'played_fixtures': len(played),
+        'remaining_fixtures': len(remaining),
+        'table': table,
+    }
+
+
+if __name__ == '__main__':
+    import time
+    import pandas as pd
+
+    # Demo: mùa gần nhất trong dataset, coi nửa sau mùa giải là chưa đá
+    df = pd.read_csv('master_dataset.csv')
+    season = df[df['Season'] == df['Season'].max()]
+    rows = list(season[['HomeTeam', 'AwayTeam', 'FTHG', 'FTAG']].itertuples(index=False, name=None))
+    half = len(rows) // 2
+    played = [(h, a, int(hg), int(ag)) for h, a, hg, ag in rows[:half]]
+    remaining = [(h, a) for h, a, _, _ in rows[half:]]
+
+    start = time.perf_counter()
+    result = simulate_season(played, remaining, seed=0)
+    elapsed = time.perf_counter() - start
+    print(f"{result['n_sims']} simulations of {len(remaining)} fixtures in {elapsed:.2f}s")
+    for r in result['table']:
+        print(f"{r['team']:18s} {r['expected_points']:5.1f} pts  title {r['title_prob']:6.1%}  "
+              f"top4 {r['top4_prob']:6.1%}  rel {r['relegation_prob']:6.1%}")
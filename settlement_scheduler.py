@@ -0,0 +1,93 @@
+"""
+settlement_scheduler.py - Lịch tự động chốt kết quả predictions
+
+Quyết định khi nào vòng lặp nền của bot nên gọi Football-Data API để chốt
+các predictions đang chờ:
+
+- trận có giờ bóng lăn đã biết: gọi sau kickoff + SETTLE_DELAY (~2 giờ),
+  nếu vẫn chưa có kết quả thì thử lại mỗi RETRY_INTERVAL
+- prediction không rõ giờ đá: dò định kỳ mỗi IDLE_POLL_INTERVAL
+- lỗi API (429 / 5xx / mạng): exponential backoff, tôn trọng Retry-After
+  hoặc X-RequestCounter-Reset của Football-Data
+
+Không phụ thuộc discord, nên có thể test độc lập.
+"""
+
+from __future__ import annotations
+
+import logging
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+SETTLE_DELAY = timedelta(hours=2)
+RETRY_INTERVAL = timedelta(minutes=30)
+IDLE_POLL_INTERVAL = timedelta(hours=6)
+BACKOFF_BASE = timedelta(minutes=5)
+MAX_BACKOFF = timedelta(hours=6)
+LOOKBACK_DAYS = 7
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Số giây provider yêu cầu chờ (Retry-After / X-RequestCounter-Reset), None nếu không có."""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    for header in ('Retry-After', 'X-RequestCounter-Reset'):
+        value = response.headers.get(header)
+        if value is None:
+            continue
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            continue
+    return None
+
+
+class SettlementScheduler:
+    """Trạng thái lịch fetch: lần fetch thành công cuối cùng và thời điểm hết backoff."""
+
+    def __init__(self, settle_delay: timedelta = SETTLE_DELAY, retry_interval: timedelta = RETRY_INTERVAL,
+                 idle_poll: timedelta = IDLE_POLL_INTERVAL, backoff_base: timedelta = BACKOFF_BASE,
+                 max_backoff: timedelta = MAX_BACKOFF, lookback_days: int = LOOKBACK_DAYS):
+        self.settle_delay = settle_delay
+        self.retry_interval = retry_interval
+        self.idle_poll = idle_poll
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+        self.lookback_days = lookback_days
+        self.last_fetch: Optional[datetime] = None
+        self.backoff_until: Optional[datetime] = None
+        self.failures = 0
+
+    def is_due(self, now: datetime, kickoffs: Iterable[datetime], has_unknown: bool = False) -> bool:
+        """
+        True khi nên fetch: có trận vừa đá xong kể từ lần fetch trước, trận đã xong
+        nhưng chưa chốt được và đã qua retry_interval, hoặc tới lượt dò định kỳ.
+        """
+        if self.backoff_until is not None and now < self.backoff_until:
+            return False
+        oldest = now - timedelta(days=self.lookback_days)
+        ready = [k + self.settle_delay for k in kickoffs if oldest <= k and k + self.settle_delay <= now]
+        if ready:
+            if self.last_fetch is None or self.last_fetch < max(ready):
+                return True
+            return now - self.last_fetch >= self.retry_interval
+        if has_unknown:
+            return self.last_fetch is None or now - self.last_fetch >= self.idle_poll
+        return False
+
+    def record_success(self, now: datetime) -> None:
+        self.last_fetch = now
+        self.backoff_until = None
+        self.failures = 0
+
+    def record_failure(self, now: datetime, retry_after: Optional[float] = None) -> timedelta:
+        """Đặt backoff sau một lần fetch lỗi; trả về thời gian phải chờ."""
+        self.failures += 1
+        wait = min(self.max_backoff, self.backoff_base * (2 ** (self.failures - 1)))
+        if retry_after is not None:
+            wait = max(wait, timedelta(seconds=retry_after))
+        self.backoff_until = now + wait
+        return wait
@@ -0,0 +1,247 @@
+"""
+strength_snapshots.py - Point-in-time team strengths for every gameweek
+
+Backtests need the strengths as they were *before* each gameweek, not the
+ones fitted on the whole file. This job splits master_dataset.csv into
+gameweeks (runs of match days separated by a gap of 2+ days), fits strengths
+on the matches strictly before each gameweek's first day, and writes all
+snapshots to one compressed .npz:
+
+- teams (T,), cutoffs (W,) as day numbers, rating arrays (W, T)
+- day_index: one int per calendar day from the first to the last cutoff,
+  so "strengths as of date" is a single array lookup
+
+Windows are fitted on a process pool; each worker loads the dataset once in
+its initializer and tasks only carry the cutoff day.
+
+Usage: python strength_snapshots.py [workers]
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from poisson_model import (DATASET_PATH, compute_strengths, dixon_coles_strengths,
+                           fit_dixon_coles, minimize)
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_PATH = 'strength_snapshots.npz'
+GAMEWEEK_GAP_DAYS = 2
+MIN_TRAINING_MATCHES = 100
+_RATINGS = ('home_attack', 'home_defense', 'away_attack', 'away_defense')
+_EPOCH = pd.Timestamp('1970-01-01')
+
+# Dữ liệu chỉ đọc của mỗi worker (nạp một lần trong initializer)
+_WORKER_FRAME: Optional[pd.DataFrame] = None
+_WORKER_DAYS: Optional[np.ndarray] = None
+_WORKER_PARAMS: Dict[str, Any] = {}
+
+
+def _to_day(date) -> int:
+    """Day number (days since 1970-01-01) of a date, string dd/mm/yyyy or Timestamp."""
+    ts = pd.Timestamp(date) if not isinstance(date, str) else pd.to_datetime(date, dayfirst=True)
+    return int((ts.normalize() - _EPOCH).days)
+
+
+def _load_frame(dataset_path: str) -> Tuple[pd.DataFrame, np.ndarray]:
+    df = pd.read_csv(dataset_path)
+    df = df.dropna(subset=['HomeTeam', 'AwayTeam', 'FTHG', 'FTAG'])
+    dates = pd.to_datetime(df['Date'], dayfirst=True, errors='coerce')
+    df = df[dates.notna()].copy()
+    days = ((dates[dates.notna()] - _EPOCH).dt.days).to_numpy(dtype=np.int64)
+    order = np.argsort(days, kind='stable')
+    return df.iloc[order].reset_index(drop=True), days[order]
+
+
+def gameweek_cutoffs(days: np.ndarray, gap_days: int = GAMEWEEK_GAP_DAYS) -> np.ndarray:
+    """First day of every gameweek: match days preceded by a gap of gap_days or more."""
+    unique = np.unique(days)
+    if len(unique) == 0:
+        return unique
+    starts = np.concatenate([[True], np.diff(unique) >= gap_days])
+    return unique[starts]
+
+
+def _init_worker(dataset_path: str, params: Dict[str, Any]) -> None:
+    global _WORKER_FRAME, _WORKER_DAYS, _WORKER_PARAMS
+    _WORKER_FRAME, _WORKER_DAYS = _load_frame(dataset_path)
+    _WORKER_PARAMS = params
+
+
+def _fit_window(cutoff: int) -> Optional[Dict[str, Any]]:
+    """Fit strengths on matches before `cutoff` (and within window_days, if set)."""
+    params = _WORKER_PARAMS
+    end = np.searchsorted(_WORKER_DAYS, cutoff, side='left')
+    start = 0
+    if params.get('window_days'):
+        start = np.searchsorted(_WORKER_DAYS, cutoff - params['window_days'], side='left')
+    if end - start < params.get('min_matches', MIN_TRAINING_MATCHES):
+        return None
+    frame = _WORKER_FRAME.iloc[start:end]
+    reference = _EPOCH + pd.Timedelta(days=int(cutoff))
+    rho = 0.0
+    if params['method'] == 'dixon_coles':
+        fit = fit_dixon_coles(frame, half_life_days=params.get('half_life_days'), reference_date=reference)
+        strengths, mu_home, mu_away = dixon_coles_strengths(fit)
+        rho = fit['rho']
+    else:
+        strengths, mu_home, mu_away = compute_strengths(frame, half_life_days=params.get('half_life_days'),
+                                                        reference_date=reference)
+    return {'cutoff': int(cutoff), 'strengths': strengths,
+            'mu_home': float(mu_home), 'mu_away': float(mu_away), 'rho': float(rho)}
+
+
+def build_snapshots(dataset_path: str = DATASET_PATH, output_path: str = SNAPSHOT_PATH,
+                    half_life_days: Optional[float] = None, window_days: Optional[int] = None,
+                    method: Optional[str] = None, min_matches: int = MIN_TRAINING_MATCHES,
+                    workers: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Fit one snapshot per gameweek and write them to output_path (.npz).
+
+    method: 'dixon_coles' (default when scipy is available) or 'ratio'.
+    window_days limits each fit to the trailing window; None uses all prior
+    matches. workers=1 fits in-process; default uses one process per CPU.
+    """
+    if method is None:
+        method = 'dixon_coles' if minimize is not None else 'ratio'
+    params = {'half_life_days': half_life_days, 'window_days': window_days,
+              'method': method, 'min_matches': min_matches}
+
+    _, days = _load_frame(dataset_path)
+    cutoffs = gameweek_cutoffs(days).tolist()
+
+    workers = workers or os.cpu_count() or 1
+    results = None
+    if workers > 1 and len(cutoffs) > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(dataset_path, params)) as pool:
+                chunk = max(1, len(cutoffs) // (4 * workers))
+                results = list(pool.map(_fit_window, cutoffs, chunksize=chunk))
+        except Exception as e:
+            logger.warning(f'Process pool failed, fitting snapshots in-process: {e}')
+            results = None
+    if results is None:
+        _init_worker(dataset_path, params)
+        results = [_fit_window(c) for c in cutoffs]
+
+    snapshots = [r for r in results if r is not None]
+    if not snapshots:
+        raise ValueError('Not enough matches to fit any snapshot')
+    save_snapshots(snapshots, output_path, params)
+    logger.info(f'Saved {len(snapshots)} strength snapshots to {output_path}')
+    return {'snapshots': len(snapshots), 'skipped': len(results) - len(snapshots),
+            'first_cutoff': snapshots[0]['cutoff'], 'last_cutoff': snapshots[-1]['cutoff'],
+            'path': output_path}
+
+
+def save_snapshots(snapshots: List[Dict[str, Any]], path: str, params: Dict[str, Any]) -> None:
+    """Pack snapshots (sorted by cutoff) into dense arrays; teams missing from a window are NaN."""
+    snapshots = sorted(snapshots, key=lambda s: s['cutoff'])
+    teams = sorted({t for s in snapshots for t in s['strengths']})
+    index = {t: i for i, t in enumerate(teams)}
+    ratings = {name: np.full((len(snapshots), len(teams)), np.nan, dtype=np.float32) for name in _RATINGS}
+    for w, snap in enumerate(snapshots):
+        for team, values in snap['strengths'].items():
+            for name in _RATINGS:
+                ratings[name][w, index[team]] = values[name]
+
+    cutoffs = np.array([s['cutoff'] for s in snapshots], dtype=np.int64)
+    # day_index[d] = snapshot đang có hiệu lực ở ngày cutoffs[0] + d
+    day_index = (np.searchsorted(cutoffs, np.arange(cutoffs[0], cutoffs[-1] + 1), side='right') - 1).astype(np.int32)
+
+    tmp = f'{path}.tmp.npz'
+    np.savez_compressed(
+        tmp, teams=np.array(teams), cutoffs=cutoffs, day_index=day_index,
+        mu_home=np.array([s['mu_home'] for s in snapshots]),
+        mu_away=np.array([s['mu_away'] for s in snapshots]),
+        rho=np.array([s['rho'] for s in snapshots]),
+        params=np.array(repr(sorted(params.items()))),
+        **ratings,
+    )
+    os.replace(tmp, path)
+
+
+class StrengthSnapshots:
+    """Read-only view over a snapshot file with O(1) lookup by date."""
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.teams = [str(t) for t in arrays['teams']]
+        self.cutoffs = arrays['cutoffs']
+        self.day_index = arrays['day_index']
+        self.mu_home = arrays['mu_home']
+        self.mu_away = arrays['mu_away']
+        self.rho = arrays['rho']
+        self.ratings = {name: arrays[name] for name in _RATINGS}
+
+    @classmethod
+    def load(cls, path: str = SNAPSHOT_PATH) -> 'StrengthSnapshots':
+        with np.load(path, allow_pickle=False) as data:
+            return cls({key: data[key] for key in data.files})
+
+    def __len__(self) -> int:
+        return len(self.cutoffs)
+
+    def index_for(self, date) -> Optional[int]:
+        """Snapshot in force on `date` (fitted on matches before its gameweek); None before the first."""
+        offset = _to_day(date) - int(self.cutoffs[0])
+        if offset < 0:
+            return None
+        return int(self.day_index[min(offset, len(self.day_index) - 1)])
+
+    def as_of(self, date) -> Optional[Tuple[Dict[str, Dict[str, float]], float, float]]:
+        """(strengths, mu_home, mu_away) as they were on `date`, same shape as load_or_fit_strengths."""
+        w = self.index_for(date)
+        if w is None:
+            return None
+        strengths = {}
+        for i, team in enumerate(self.teams):
+            if np.isnan(self.ratings['home_attack'][w, i]):
+                continue
+            strengths[team] = {name: float(self.ratings[name][w, i]) for name in _RATINGS}
+        return strengths, float(self.mu_home[w]), float(self.mu_away[w])
+
+    def rho_as_of(self, date) -> float:
+        w = self.index_for(date)
+        return float(self.rho[w]) if w is not None else 0.0
+
+
+_SNAPSHOTS: Optional[StrengthSnapshots] = None
+_SNAPSHOTS_MTIME: Optional[float] = None
+
+
+def get_snapshots(path: str = SNAPSHOT_PATH) -> Optional[StrengthSnapshots]:
+    """Shared StrengthSnapshots, reloaded when the file changes; None if it was never built."""
+    global _SNAPSHOTS, _SNAPSHOTS_MTIME
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    if _SNAPSHOTS is None or mtime != _SNAPSHOTS_MTIME:
+        try:
+            _SNAPSHOTS = StrengthSnapshots.load(path)
+            _SNAPSHOTS_MTIME = mtime
+        except Exception as e:
+            logger.warning(f'Cannot load strength snapshots from {path}: {e}')
+            return None
+    return _SNAPSHOTS
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+
+    logging.basicConfig(level=logging.INFO)
+    n_workers = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    start = time.perf_counter()
+    summary = build_snapshots(workers=n_workers)
+    elapsed = time.perf_counter() - start
+    print(f"{summary['snapshots']} snapshots ({summary['skipped']} gameweeks skipped, "
+          f"too little history) in {elapsed:.1f}s -> {summary['path']}")
@@ -0,0 +1,66 @@
+"""
+team_names.py - Canonical EPL team names
+
+Maps user input, Football-Data.org names ("Manchester United FC") and The Odds
+API names to the short names used in master_dataset.csv ("Man United"), so that
+caches, Poisson strengths and result matching all agree on one key per team.
+"""
+
+from __future__ import annotations
+
+import re
+from functools import lru_cache
+
+# Alias (lowercase, không có "fc"/"afc") -> tên trong master_dataset.csv
+_ALIASES = {
+    'arsenal': 'Arsenal',
+    'aston villa': 'Aston Villa', 'villa': 'Aston Villa',
+    'bournemouth': 'Bournemouth',
+    'brentford': 'Brentford',
+    'brighton': 'Brighton', 'brighton and hove albion': 'Brighton', 'brighton hove albion': 'Brighton',
+    'burnley': 'Burnley',
+    'chelsea': 'Chelsea',
+    'crystal palace': 'Crystal Palace', 'palace': 'Crystal Palace',
+    'everton': 'Everton',
+    'fulham': 'Fulham', 'fullham': 'Fulham',
+    'ipswich': 'Ipswich', 'ipswich town': 'Ipswich',
+    'leeds': 'Leeds', 'leeds united': 'Leeds',
+    'leicester': 'Leicester', 'leicester city': 'Leicester',
+    'liverpool': 'Liverpool',
+    'luton': 'Luton', 'luton town': 'Luton',
+    'man city': 'Man City', 'manchester city': 'Man City', 'mancity': 'Man City',
+    'man united': 'Man United', 'manchester united': 'Man United', 'man utd': 'Man United',
+    'man u': 'Man United', 'manutd': 'Man United', 'manchesterunited': 'Man United',
+    'newcastle': 'Newcastle', 'newcastle united': 'Newcastle',
+    'norwich': 'Norwich', 'norwich city': 'Norwich',
+    "nott'm forest": "Nott'm Forest", 'nottingham forest': "Nott'm Forest", 'nottm forest': "Nott'm Forest",
+    'forest': "Nott'm Forest",
+    'sheffield united': 'Sheffield United', 'sheffield utd': 'Sheffield United',
+    'southampton': 'Southampton',
+    'sunderland': 'Sunderland',
+    'tottenham': 'Tottenham', 'tottenham hotspur': 'Tottenham', 'spurs': 'Tottenham',
+    'watford': 'Watford',
+    'west ham': 'West Ham', 'west ham united': 'West Ham',
+    'wolves': 'Wolves', 'wolverhampton': 'Wolves', 'wolverhampton wanderers': 'Wolves',
+}
+
+
+def _clean(name: str) -> str:
+    n = name.strip().lower().replace('_', ' ').replace('&', 'and')
+    n = re.sub(r'\b(a?fc)\b', ' ', n)
+    return re.sub(r'\s+', ' ', n).strip()
+
+
+@lru_cache(maxsize=512)
+def canonical_team_name(name: str) -> str:
+    """Trả về tên chuẩn của đội (theo master_dataset.csv); tên lạ giữ nguyên dạng đã làm sạch."""
+    if not name:
+        return name
+    cleaned = _clean(name)
+    if cleaned in _ALIASES:
+        return _ALIASES[cleaned]
+    compact = cleaned.replace(' ', '')
+    for alias, canonical in _ALIASES.items():
+        if alias.replace(' ', '') == compact:
+            return canonical
+    return cleaned.title()
@@ -1,9 +1,8 @@
 """
 Test script để validate !analyze và !fetchresults commands
-Sử dụng mock data từ predictions_log.json
+Sử dụng predictions đã lưu trong predictions.db
 """
 
-import json
 import os
 from datetime import datetime, timedelta
 
@@ -13,13 +12,12 @@ def test_analyze_logic():
     print("TEST 1: Analyze Command Logic")
     print("=" * 60)
     
-    if not os.path.exists('predictions_log.json'):
-        print("❌ Không tìm thấy predictions_log.json")
+    from prediction_tracker import load_predictions
+    predictions = load_predictions()
+    if not predictions:
+        print("❌ Chưa có prediction nào được lưu")
         return False
     
-    with open('predictions_log.json', 'r', encoding='utf-8') as f:
-        predictions = json.load(f)
-    
     completed = [p for p in predictions if p.get('actual_result') is not None]
     
     if not completed:
@@ -133,13 +131,12 @@ def test_fetch_results_requirements():
         print(f"✅ FOOTBALL_DATA_API_KEY: {api_key[:10]}..." if len(api_key) > 10 else "✅ FOOTBALL_DATA_API_KEY configured")
     
     # Check pending predictions
-    if not os.path.exists('predictions_log.json'):
-        print("❌ Không tìm thấy predictions_log.json")
+    from prediction_tracker import load_predictions
+    predictions = load_predictions()
+    if not predictions:
+        print("❌ Chưa có prediction nào được lưu")
         return False
     
-    with open('predictions_log.json', 'r', encoding='utf-8') as f:
-        predictions = json.load(f)
-    
     pending = [p for p in predictions if p.get('actual_result') is None]
     print(f"\n📊 Pending predictions: {len(pending)}")
     
@@ -178,7 +175,7 @@ def test_integration_workflow():
     
     # Simulate workflow
     print("\n📋 Workflow:")
-    print("   1. Bot tạo prediction → ✅ (có trong predictions_log.json)")
+    print("   1. Bot tạo prediction → ✅ (có trong predictions.db)")
     print("   2. User chạy !fetchresults → ⏳ (cần test với real API)")
     print("   3. User chạy !analyze → ✅ (logic tested above)")
     print("   4. Điều chỉnh calibration nếu cần → ⏳ (manual)")
@@ -1,10 +1,16 @@
 """
 test_tracking.py - Test auto-log và analysis với mock data
 """
+import prediction_tracker
 from prediction_tracker import log_prediction, update_result
+import os
 import random
+import tempfile
 from datetime import datetime, timedelta
 
+# Kết quả giả không được học vào Poisson strengths thật
+prediction_tracker.STRENGTHS_PATH = os.path.join(tempfile.mkdtemp(), 'poisson_online.pkl')
+
 # Mock teams
 teams = [
     ('Arsenal', 'Manchester United'),
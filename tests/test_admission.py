@@ -0,0 +1,127 @@
+"""
+test_admission.py - Unit tests cho admission control (hàng đợi có priority, rate limit, gộp yêu cầu trùng)
+"""
+
+import sys
+import os
+import asyncio
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from admission import AdmissionGate, Busy, InFlight, RateLimited, RateLimits, PRIORITY_ANALYSIS, PRIORITY_BULK
+
+
+def test_gate_priority_and_shedding():
+    """Test: tối đa N chạy song song, priority thấp được phục vụ trước, hàng đợi đầy -> Busy"""
+    print("\n=== Test: Admission Gate ===")
+
+    async def scenario():
+        gate = AdmissionGate(max_concurrent=1, max_queue=2, max_wait=5)
+        order = []
+        release_first = asyncio.Event()
+
+        async def job(name, priority, hold=None):
+            async with gate.slot(priority):
+                order.append(name)
+                if hold is not None:
+                    await hold.wait()
+
+        first = asyncio.create_task(job('first', PRIORITY_ANALYSIS, release_first))
+        await asyncio.sleep(0)
+        bulk = asyncio.create_task(job('bulk', PRIORITY_BULK))
+        analysis = asyncio.create_task(job('analysis', PRIORITY_ANALYSIS))
+        await asyncio.sleep(0)
+        assert gate.running == 1 and gate.queued == 2
+        try:
+            await gate.acquire(PRIORITY_ANALYSIS)
+            raise AssertionError('expected Busy')
+        except Busy:
+            pass
+        release_first.set()
+        await asyncio.gather(first, bulk, analysis)
+        assert order == ['first', 'analysis', 'bulk'], order
+        assert gate.running == 0 and gate.queued == 0
+
+        # Chờ quá max_wait -> Busy, slot không bị rò
+        slow = AdmissionGate(max_concurrent=1, max_queue=4, max_wait=0.05)
+        await slow.acquire()
+        try:
+            await slow.acquire()
+            raise AssertionError('expected Busy')
+        except Busy:
+            pass
+        assert slow.queued == 0
+        slow.release()
+        assert slow.running == 0
+
+    asyncio.run(scenario())
+    print("✅ PASS: Bounded concurrency, priority order and load shedding")
+
+
+def test_rate_limits_and_inflight():
+    """Test: rate limit theo user/guild; yêu cầu trùng trận dùng chung một kết quả"""
+    print("\n=== Test: Rate Limits & In-flight Dedup ===")
+    limits = RateLimits({'user': (2, 60.0), 'guild': (3, 60.0)})
+    limits.admit(now=0, user=1, guild=9)
+    limits.admit(now=1, user=1, guild=9)
+    try:
+        limits.admit(now=2, user=1, guild=9)
+        raise AssertionError('expected RateLimited')
+    except RateLimited as e:
+        assert e.scope == 'user' and e.retry_after == 58
+    limits.admit(now=3, user=2, guild=9)
+    try:
+        limits.admit(now=4, user=3, guild=9)
+        raise AssertionError('expected RateLimited')
+    except RateLimited as e:
+        assert e.scope == 'guild'
+    limits.admit(now=61, user=1, guild=9)  # cửa sổ đã trượt qua
+
+    async def scenario():
+        inflight = InFlight()
+        runs = []
+
+        async def request(key):
+            leader, shared = inflight.claim(key)
+            if not leader:
+                return await InFlight.join(shared)
+            runs.append(key)
+            await asyncio.sleep(0.01)
+            inflight.resolve(key, f'analysis {key}')
+            return f'analysis {key}'
+
+        results = await asyncio.gather(*(request('ARS-MUN') for _ in range(5)), request('LIV-CHE'))
+        assert results == ['analysis ARS-MUN'] * 5 + ['analysis LIV-CHE']
+        assert runs == ['ARS-MUN', 'LIV-CHE']
+
+        # Lỗi của leader được chuyển cho các follower, key được giải phóng
+        leader, shared = inflight.claim('X')
+        follower = asyncio.create_task(InFlight.join(inflight.claim('X')[1]))
+        await asyncio.sleep(0)
+        inflight.resolve('X', error=Busy('queue full'))
+        try:
+            await follower
+            raise AssertionError('expected Busy')
+        except Busy:
+            pass
+        assert inflight.claim('X')[0]
+
+    asyncio.run(scenario())
+    print("✅ PASS: Per-user/guild limits and one shared run per fixture")
+
+
+if __name__ == '__main__':
+    try:
+        test_gate_priority_and_shedding()
+        test_rate_limits_and_inflight()
+
+        print("\n" + "=" * 60)
+        print("✅ ALL TESTS PASSED")
+        print("=" * 60)
+    except AssertionError as e:
+        print(f"\n❌ TEST FAILED: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n❌ TEST ERROR: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
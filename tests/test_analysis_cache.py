@@ -0,0 +1,80 @@
+"""
+test_analysis_cache.py - Unit tests cho cache phân tích (LRU + TTL, cache key)
+"""
+
+import sys
+import os
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analysis_cache import TTLCache, make_analysis_key, odds_snapshot_version
+from predictor import prepare_features
+
+
+def test_lru_eviction_and_ttl():
+    """Test: vượt maxsize thì bỏ entry cũ nhất, hết TTL thì miss"""
+    print("\n=== Test: LRU + TTL ===")
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1  # 'a' thành mới nhất
+    cache.set('c', 3)
+    assert cache.get('b') is None, "LRU entry 'b' should be evicted"
+    assert cache.get('a') == 1 and cache.get('c') == 3
+
+    short = TTLCache(maxsize=2, ttl=0.01)
+    short.set('x', 1)
+    time.sleep(0.02)
+    assert short.get('x') is None, "Expired entry should miss"
+    print("✅ PASS: LRU eviction and TTL expiry work")
+
+
+def test_key_canonical_and_odds_sensitive():
+    """Test: tên đội alias cùng key; odds đổi thì key đổi; mock timestamp không ảnh hưởng"""
+    print("\n=== Test: Analysis Key ===")
+    odds = {'source': 'mock', 'handicap_value': -0.5, 'home_odds': 1.95, 'away_odds': 1.95,
+            'timestamp': '2024-01-01T10:00:00'}
+    k1 = make_analysis_key('Manchester United', 'spurs', odds, 'm1')
+    k2 = make_analysis_key('Man Utd', 'Tottenham Hotspur FC', dict(odds, timestamp='2024-01-01T11:00:00'), 'm1')
+    assert k1 == k2, f"Aliases should share a key: {k1} vs {k2}"
+    assert k1[:2] == ('Man United', 'Tottenham')
+
+    moved = dict(odds, handicap_value=-0.75)
+    assert odds_snapshot_version(moved) != odds_snapshot_version(odds)
+    assert make_analysis_key('Man Utd', 'Spurs', odds, 'm2') != k1, "Model hash must be part of the key"
+    print("✅ PASS: Keys are canonical and track odds/model changes")
+
+
+def test_prepare_features_deterministic():
+    """Test: cùng input -> cùng features (jitter bookmaker có seed)"""
+    print("\n=== Test: Deterministic Features ===")
+    home = {'team_name': 'Arsenal', 'goals_scored_avg': 2.0, 'goals_conceded_avg': 0.9}
+    away = {'team_name': 'Chelsea', 'goals_scored_avg': 1.6, 'goals_conceded_avg': 1.1}
+    odds = {'handicap_value': -0.5}
+    f1 = prepare_features(home, away, odds)
+    f2 = prepare_features(home, away, odds)
+    assert f1.equals(f2), "Features should be identical for identical inputs"
+    print("✅ PASS: prepare_features is deterministic")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("Running Analysis Cache Tests")
+    print("=" * 60)
+
+    try:
+        test_lru_eviction_and_ttl()
+        test_key_canonical_and_odds_sensitive()
+        test_prepare_features_deterministic()
+
+        print("\n" + "=" * 60)
+        print("✅ ALL TESTS PASSED")
+        print("=" * 60)
+    except AssertionError as e:
+        print(f"\n❌ TEST FAILED: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n❌ TEST ERROR: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,73 @@
+"""
+test_artifact_cache.py - Unit tests cho cache artifact theo fingerprint nội dung
+"""
+
+import sys
+import os
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import artifact_cache
+from artifact_cache import cached_artifact, store_artifact, load_artifact, is_stale
+
+
+def _write(path, text):
+    with open(path, 'w') as f:
+        f.write(text)
+    # mtime_ns khác đi để file_fingerprint đọc lại nội dung
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+
+
+def test_rebuild_only_when_sources_change():
+    """Test: artifact chỉ build lại khi nội dung nguồn hoặc code version đổi"""
+    print("\n=== Test: Cached Artifact Rebuild ===")
+    calls = []
+    with tempfile.TemporaryDirectory() as tmp:
+        old_manifest = artifact_cache.MANIFEST_PATH
+        artifact_cache.MANIFEST_PATH = os.path.join(tmp, 'manifest.json')
+        try:
+            src = os.path.join(tmp, 'data.csv')
+            out = os.path.join(tmp, 'features.pkl')
+            _write(src, 'a,b\n1,2\n')
+
+            def build():
+                calls.append(1)
+                return open(src).readline().strip().split(',')
+
+            assert cached_artifact(out, build, [src], '1') == ['a', 'b']
+            assert cached_artifact(out, build, [src], '1') == ['a', 'b']
+            artifact_cache._MEMORY.clear()  # như một process mới: đọc từ đĩa, không build
+            assert cached_artifact(out, build, [src], '1') == ['a', 'b']
+            assert len(calls) == 1
+
+            _write(src, 'a,b,c\n1,2,3\n')
+            assert is_stale(out, [src], '1')
+            assert cached_artifact(out, build, [src], '1') == ['a', 'b', 'c']
+            assert cached_artifact(out, build, [src], '2') == ['a', 'b', 'c']  # code version mới
+            assert len(calls) == 3
+
+            store_artifact(out, ['x'], [src], '2')
+            assert not is_stale(out, [src], '2')
+            assert load_artifact(out) == ['x']
+            assert load_artifact(os.path.join(tmp, 'missing.pkl'), default=42) == 42
+        finally:
+            artifact_cache.MANIFEST_PATH = old_manifest
+    print("✅ PASS: Stale artifacts rebuild, unchanged ones are reused")
+
+
+if __name__ == '__main__':
+    try:
+        test_rebuild_only_when_sources_change()
+
+        print("\n" + "=" * 60)
+        print("✅ ALL TESTS PASSED")
+        print("=" * 60)
+    except AssertionError as e:
+        print(f"\n❌ TEST FAILED: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n❌ TEST ERROR: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,101 @@
+"""
+test_asian_handicap.py - Unit tests cho bảng kèo chấp Châu Á (quarter lines)
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from poisson_model import MatchDistribution
+from asian_handicap import AH_LINES, OUTCOMES, handicap_probabilities, handicap_ladder, settle_handicap
+from prediction_tracker import _apply_result
+
+
+def test_settle_quarter_lines():
+    """Test: chấm kèo quarter/half/whole theo luật Châu Á"""
+    print("\n=== Test: Settle Handicap ===")
+    cases = [
+        # (home, away, line, side, expected)
+        (1, 0, -0.25, 'home', 'win'),
+        (1, 1, -0.25, 'home', 'half_loss'),
+        (1, 1, -0.25, 'away', 'half_win'),
+        (2, 1, -0.75, 'home', 'half_win'),
+        (2, 1, -1.0, 'home', 'push'),
+        (2, 1, -1.5, 'home', 'loss'),
+        (0, 0, 0.0, 'away', 'push'),
+        (0, 1, 0.75, 'home', 'half_loss'),
+    ]
+    for h, a, line, side, expected in cases:
+        got = settle_handicap(h, a, line, side)
+        assert got == expected, f"{h}-{a} @ {line} ({side}): expected {expected}, got {got}"
+    print("✅ PASS: Quarter, half and whole lines settle correctly")
+
+
+def test_ladder_matches_distribution():
+    """Test: bảng kèo khớp với 1X2 và quarter line = trung bình hai mốc kề"""
+    print("\n=== Test: AH Ladder ===")
+    dist = MatchDistribution(1.6, 1.1)
+    probs = handicap_probabilities(dist.goal_diff)
+    assert probs.shape == (len(AH_LINES), len(OUTCOMES))
+    assert np.allclose(probs.sum(axis=1), dist.goal_diff.sum())
+
+    home, draw, away = dist.one_x_two()
+    i0 = int(np.where(AH_LINES == 0.0)[0][0])
+    assert abs(probs[i0, 0] - home) < 1e-12 and abs(probs[i0, 2] - draw) < 1e-12
+
+    # -0.25 = nửa tiền ở 0, nửa tiền ở -0.5
+    win_expect = 0.5 * probs[i0, 0] + 0.5 * probs[i0 - 2, 0]
+    q = probs[i0 - 1]
+    assert abs(q[0] + 0.5 * q[1] - win_expect) < 1e-12
+
+    ladder = handicap_ladder(dist.goal_diff)
+    assert ladder[i0]['line'] == 0.0 and ladder[i0]['fair_odds_home'] > 1.0
+    print("✅ PASS: Ladder agrees with 1X2 and quarter-line splitting")
+
+
+def test_batch_equals_single():
+    """Test: batch nhiều trận cho cùng kết quả như từng trận"""
+    print("\n=== Test: Batch AH ===")
+    dists = [MatchDistribution(1.2, 1.5, max_goals=10), MatchDistribution(2.1, 0.8, max_goals=10)]
+    batch = handicap_probabilities(np.stack([d.goal_diff for d in dists]))
+    for k, d in enumerate(dists):
+        assert np.allclose(batch[k], handicap_probabilities(d.goal_diff))
+    print("✅ PASS: Batch and single-fixture results agree")
+
+
+def test_apply_result_push_excluded():
+    """Test: hòa kèo -> correct = None; thắng nửa tính là đúng"""
+    print("\n=== Test: Tracker Grading ===")
+    pred = {'prediction': 1}
+    _apply_result(pred, 1, 1, 0.0)
+    assert pred['correct'] is None and pred['handicap_outcome'] == 'push'
+
+    pred = {'prediction': 0}
+    _apply_result(pred, 1, 1, -0.25)
+    assert pred['correct'] is True and pred['handicap_outcome'] == 'half_win'
+    print("✅ PASS: Pushes are neutral, half wins count as correct")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("Running Asian Handicap Tests")
+    print("=" * 60)
+
+    try:
+        test_settle_quarter_lines()
+        test_ladder_matches_distribution()
+        test_batch_equals_single()
+        test_apply_result_push_excluded()
+
+        print("\n" + "=" * 60)
+        print("✅ ALL TESTS PASSED")
+        print("=" * 60)
+    except AssertionError as e:
+        print(f"\n❌ TEST FAILED: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n❌ TEST ERROR: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
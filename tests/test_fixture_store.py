@@ -0,0 +1,85 @@
+"""
+test_fixture_store.py - Unit tests cho fixture store (đồng bộ từng phần, chuyển trạng thái)
+"""
+
+import sys
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fixture_store import FixtureStore
+
+
+def _match(match_id, kickoff, status='TIMED', score=(None, None), updated='2024-04-01T00:00:00Z'):
+    return {'id': match_id, 'utcDate': kickoff.strftime('%Y-%m-%dT%H:%M:%SZ'), 'matchday': 32, 'status': status,
+            'homeTeam': {'name': f'Home {match_id} FC'}, 'awayTeam': {'name': f'Away {match_id} FC'},
+            'score': {'fullTime': {'home': score[0], 'away': score[1]}}, 'lastUpdated': updated}
+
+
+def test_incremental_sync_and_transitions():
+    """Test: full sync một lần, sau đó chỉ fetch các khoảng ngày tới hạn; ghi lại TIMED -> IN_PLAY -> FINISHED"""
+    print("\n=== Test: Fixture Incremental Sync ===")
+    now = datetime(2024, 4, 6, 12, 0, tzinfo=timezone.utc)
+    api = {1: _match(1, now + timedelta(hours=2)),
+           2: _match(2, now + timedelta(days=3)),
+           3: _match(3, now - timedelta(days=30), 'FINISHED', (2, 1))}
+    calls = []
+
+    def fake_fetch(api_key, date_from=None, date_to=None):
+        calls.append((date_from, date_to))
+        return [m for m in api.values()
+                if date_from is None or date_from <= datetime.fromisoformat(m['utcDate'][:10]).date() <= date_to]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = FixtureStore(os.path.join(tmp, 'fixtures.db'))
+        try:
+            summary = store.sync('key', now, fetch=fake_fetch)
+            assert summary['ranges'] == ['full'] and summary['inserted'] == 3
+            assert calls == [(None, None)] and store.is_fresh(now)
+            # Chưa tới hạn gì -> không gọi API
+            assert store.sync('key', now + timedelta(minutes=5), fetch=fake_fetch)['ranges'] == []
+            assert len(calls) == 1
+
+            # Trận 1 bắt đầu: chỉ ngày đang có trận được fetch lại
+            kickoff = now + timedelta(hours=2, minutes=10)
+            api[1] = _match(1, now + timedelta(hours=2), 'IN_PLAY', (0, 0), '2024-04-06T14:05:00Z')
+            summary = store.sync('key', kickoff, fetch=fake_fetch)
+            assert summary['ranges'] == ['active'] and calls[-1] == (now.date(), now.date())
+            assert summary['transitions'] == [(1, 'TIMED', 'IN_PLAY')] and summary['unchanged'] == 0
+
+            api[1] = _match(1, now + timedelta(hours=2), 'FINISHED', (3, 1), '2024-04-06T16:00:00Z')
+            summary = store.sync('key', kickoff + timedelta(hours=2), fetch=fake_fetch)
+            assert summary['transitions'] == [(1, 'IN_PLAY', 'FINISHED')]
+            assert [t[:2] for t in store.transitions(1)] == [(None, 'TIMED'), ('TIMED', 'IN_PLAY'), ('IN_PLAY', 'FINISHED')]
+
+            # Hết trận đang đá -> không còn khoảng 'active'; cửa sổ 7 ngày tới sau 6 giờ
+            later = now + timedelta(hours=6)
+            summary = store.sync('key', later, fetch=fake_fetch)
+            assert summary['ranges'] == ['upcoming'] and summary['unchanged'] == 2 and summary['updated'] == 0
+
+            finished = store.finished(days_back=7, now=later)
+            assert [m['id'] for m in finished] == [1] and finished[0]['score']['fullTime'] == {'home': 3, 'away': 1}
+            assert [m['id'] for m in store.upcoming(later)] == [1, 2]
+            assert [m['id'] for m in store.find('Home 2', 'Away 2')] == [2]
+            assert not store.is_fresh(now + timedelta(days=2))
+        finally:
+            store.close()
+    print("✅ PASS: Only due date ranges fetched, status transitions recorded")
+
+
+if __name__ == '__main__':
+    try:
+        test_incremental_sync_and_transitions()
+
+        print("\n" + "=" * 60)
+        print("✅ ALL TESTS PASSED")
+        print("=" * 60)
+    except AssertionError as e:
+        print(f"\n❌ TEST FAILED: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n❌ TEST ERROR: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
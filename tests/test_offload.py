@@ -0,0 +1,92 @@
+"""
+test_offload.py - Unit tests cho lớp offload (pool I/O / CPU, timeout theo bước, deadline của lệnh)
+"""
+
+import sys
+import os
+import asyncio
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import offload
+
+
+def test_loop_stays_responsive():
+    """Test: việc blocking chạy trong pool, event loop vẫn xử lý các task khác"""
+    print("\n=== Test: Responsive Event Loop ===")
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        task = asyncio.create_task(ticker())
+        results = await asyncio.gather(
+            offload.run_io(time.sleep, 0.3, stage='store'),
+            offload.run_cpu(sum, range(1000), stage='predict'),
+        )
+        task.cancel()
+        return ticks, results
+
+    ticks, results = asyncio.run(scenario())
+    assert results == [None, sum(range(1000))]
+    assert ticks >= 10, ticks
+    print(f"✅ PASS: Loop ticked {ticks} times while a stage blocked for 0.3s")
+
+
+def test_stage_timeout_and_deadline():
+    """Test: quá timeout -> StageTimeout; quá deadline của lệnh -> huỷ các bước sau"""
+    print("\n=== Test: Stage Timeout & Deadline ===")
+
+    async def scenario():
+        try:
+            await offload.run_io(time.sleep, 0.5, stage='store', timeout=0.05)
+            raise AssertionError('expected StageTimeout')
+        except offload.StageTimeout as e:
+            assert e.stage == 'store'
+
+        # Interaction đã tạo từ 20 phút trước -> hết hạn, không chạy thêm bước nào
+        called = []
+        offload.start_deadline(started_at=time.time() - 20 * 60)
+        try:
+            await offload.run_io(called.append, 1, stage='store')
+            raise AssertionError('expected StageTimeout')
+        except offload.StageTimeout:
+            pass
+        assert not called
+
+        # Deadline còn 0.1s: giới hạn của bước bị rút ngắn theo deadline
+        offload.start_deadline(0.1)
+        started = time.perf_counter()
+        try:
+            await offload.run_io(time.sleep, 0.5, stage='simulate')
+            raise AssertionError('expected StageTimeout')
+        except offload.StageTimeout:
+            pass
+        assert time.perf_counter() - started < 0.4
+
+    asyncio.run(scenario())
+    offload.shutdown(wait=True)
+    print("✅ PASS: Stages time out and expired commands are cancelled")
+
+
+if __name__ == '__main__':
+    try:
+        test_loop_stays_responsive()
+        test_stage_timeout_and_deadline()
+
+        print("\n" + "=" * 60)
+        print("✅ ALL TESTS PASSED")
+        print("=" * 60)
+    except AssertionError as e:
+        print(f"\n❌ TEST FAILED: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n❌ TEST ERROR: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -7,7 +7,12 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import numpy as np
-from poisson_model import score_matrix, top_scorelines, ou_probabilities, expected_goals
+from poisson_model import (score_matrix, top_scorelines, ou_probabilities, expected_goals, MatchDistribution,
+                           score_matrices, batch_totals, batch_goal_diff, batch_ou_probabilities,
+                           batch_one_x_two, batch_top_scorelines, compute_strengths,
+                           fit_dixon_coles, dixon_coles_strengths, goal_diff_pmf, ou_closed_form)
+import pandas as pd
+from poisson_kernels import poisson_pmf, poisson_tail, totals_from_matrix, totals_convolve, adaptive_max_goals
 
 
 def test_probability_sums_to_one():
@@ -86,6 +91,233 @@ def test_zero_line_ou():
     print("✅ PASS: Line 0.5 behaves correctly")
 
 
+def test_match_distribution_consistency():
+    """Test: MatchDistribution - các thị trường nhất quán với cùng một ma trận"""
+    print("\n=== Test: MatchDistribution Consistency ===")
+    dist = MatchDistribution(1.7, 1.1)
+    home, draw, away = dist.one_x_two()
+    print(f"1X2: {home:.3f} / {draw:.3f} / {away:.3f}, BTTS: {dist.btts():.3f}")
+    assert abs(home + draw + away - 1.0) < 1e-4, "1X2 should sum to ~1.0"
+    # Totals và goal diff tính dạng đóng riêng rẽ, chỉ lệch nhau phần đuôi bị cắt
+    assert abs(dist.totals.sum() - dist.goal_diff.sum()) < 1e-9
+
+    # O/U từ totals phải khớp với hàm ou_probabilities trên cùng ma trận
+    for line in [1.5, 2.5, 3.0, 3.5]:
+        expected = ou_probabilities(dist.matrix, line)
+        got = dist.over_under(line)
+        assert np.allclose(expected, got), f"O/U mismatch at {line}: {expected} vs {got}"
+
+    # BTTS = tổng - P(home=0) - P(away=0) + P(0-0)
+    m = dist.matrix
+    btts = m.sum() - m[0, :].sum() - m[:, 0].sum() + m[0, 0]
+    assert abs(dist.btts() - btts) < 1e-6
+    assert dist.top_scorelines(5) == top_scorelines(m, 5)
+    print("✅ PASS: All markets derive from the same distribution")
+
+
+
+def test_batch_matches_single():
+    """Test: batch API (N trận) cho kết quả giống hệt từng trận"""
+    print("\n=== Test: Batch Score Matrices ===")
+    lam_h = np.array([0.8, 1.5, 2.4, 1.2])
+    lam_a = np.array([1.9, 1.2, 0.6, 1.0])
+    mats = score_matrices(lam_h, lam_a, max_goals=8)
+    assert mats.shape == (4, 9, 9)
+    totals = batch_totals(mats)
+    over, under, push = batch_ou_probabilities(totals, 2.5)
+    outcomes = batch_one_x_two(batch_goal_diff(mats))
+    tops = batch_top_scorelines(mats, 5)
+    for n in range(len(lam_h)):
+        single = score_matrix(lam_h[n], lam_a[n], max_goals=8)
+        assert np.allclose(mats[n], single)
+        assert np.allclose((over[n], under[n], push[n]), ou_probabilities(single, 2.5))
+        assert np.allclose(outcomes[n], batch_one_x_two(batch_goal_diff(single[None]))[0])
+        assert tops[n] == top_scorelines(single, 5), f"Top-5 mismatch for fixture {n}"
+    print("✅ PASS: Batch reducers agree with single-fixture functions")
+
+
+
+def test_compute_strengths_decay_and_seasons():
+    """Test: group-by strengths - không decay = trung bình thường, decay nghiêng về trận gần"""
+    print("\n=== Test: Strengths Decay & Season Filter ===")
+    df = pd.DataFrame({
+        'Date': ['01/08/2022', '01/08/2022', '01/05/2024', '01/05/2024'],
+        'Season': [2223, 2223, 2324, 2324],
+        'HomeTeam': ['A', 'B', 'A', 'B'],
+        'AwayTeam': ['B', 'A', 'B', 'A'],
+        'FTHG': [0, 1, 4, 1],
+        'FTAG': [2, 1, 0, 1],
+    })
+    strengths, mu_home, mu_away = compute_strengths(df)
+    assert abs(mu_home - 1.5) < 1e-12 and abs(mu_away - 1.0) < 1e-12
+    assert abs(strengths['A']['home_attack'] - (2.0 / 1.5)) < 1e-12
+
+    decayed, dmu_home, _ = compute_strengths(df, half_life_days=30)
+    assert decayed['A']['home_attack'] > 0 and dmu_home > mu_home, "Recent 4-0 should dominate"
+
+    recent, rmu_home, _ = compute_strengths(df, seasons=[2324])
+    assert abs(rmu_home - 2.5) < 1e-12 and set(recent) == {'A', 'B'}
+    print("✅ PASS: Weighted group-by strengths behave as expected")
+
+
+
+def test_dixon_coles_fit_recovers_parameters():
+    """Test: MLE Dixon-Coles khôi phục được tham số trên dữ liệu giả lập; warm start hội tụ nhanh"""
+    print("\n=== Test: Dixon-Coles MLE ===")
+    rng = np.random.default_rng(42)
+    teams = ['A', 'B', 'C', 'D', 'E', 'F']
+    attack = np.array([0.4, 0.2, 0.0, 0.0, -0.2, -0.4])
+    defense = np.array([-0.3, -0.1, 0.0, 0.1, 0.1, 0.2])
+    rows = []
+    for _ in range(60):
+        for i, h in enumerate(teams):
+            for j, a in enumerate(teams):
+                if i == j:
+                    continue
+                lam = np.exp(0.1 + 0.25 + attack[i] + defense[j])
+                mu = np.exp(0.1 + attack[j] + defense[i])
+                rows.append((h, a, rng.poisson(lam), rng.poisson(mu)))
+    df = pd.DataFrame(rows, columns=['HomeTeam', 'AwayTeam', 'FTHG', 'FTAG'])
+
+    fit = fit_dixon_coles(df)
+    assert fit['converged']
+    assert abs(fit['home'] - 0.25) < 0.08, f"Home advantage off: {fit['home']}"
+    assert abs(fit['rho']) < 0.1
+    fitted = np.array(fit['attack'])[[fit['teams'].index(t) for t in teams]]
+    assert np.max(np.abs(fitted - attack)) < 0.12, f"Attack off: {fitted}"
+
+    strengths, mu_home, mu_away = dixon_coles_strengths(fit)
+    lam_h, _ = expected_goals('A', 'F', strengths, mu_home, mu_away)
+    assert abs(np.log(lam_h) - (fit['intercept'] + fit['home'] + fitted[0] + fit['defense'][fit['teams'].index('F')])) < 1e-9
+
+    warm = fit_dixon_coles(df, init=fit)
+    assert warm['iterations'] <= 3, f"Warm start should converge immediately, took {warm['iterations']}"
+    print("✅ PASS: Dixon-Coles MLE recovers parameters and warm-starts")
+
+
+
+def test_online_strength_update():
+    """Test: cập nhật online chỉ đổi hai đội, có dedupe, version tăng, refit định kỳ"""
+    print("\n=== Test: Online Strength Updates ===")
+    import tempfile
+    import poisson_model
+    original = poisson_model.CACHE_PATH, poisson_model.ONLINE_PATH
+    with tempfile.TemporaryDirectory() as tmp:
+        poisson_model.CACHE_PATH = os.path.join(tmp, 'strengths.pkl')
+        poisson_model.ONLINE_PATH = os.path.join(tmp, 'online.pkl')
+        try:
+            before, _, _ = poisson_model.load_or_fit_strengths()
+            v0 = poisson_model.strengths_version()
+            with open(poisson_model.CACHE_PATH, 'rb') as f:
+                fitted = f.read()
+            v1 = poisson_model.update_strengths_online('Arsenal', 'Chelsea', 4, 0, result_key='m1')
+            after, _, _ = poisson_model.load_or_fit_strengths()
+            assert v1 == v0 + 1 == poisson_model.strengths_version()
+            assert after['Arsenal']['home_attack'] > before['Arsenal']['home_attack']
+            assert after['Chelsea']['away_defense'] > before['Chelsea']['away_defense']
+            changed = [t for t in before if before[t] != after[t]]
+            assert sorted(changed) == ['Arsenal', 'Chelsea'], f"Only the two teams should move: {changed}"
+
+            assert poisson_model.update_strengths_online('Arsenal', 'Chelsea', 4, 0, result_key='m1') == v1, "Duplicate must be ignored"
+
+            # Cập nhật thứ 3 kể từ lần fit -> refit toàn bộ
+            for i in range(2):
+                poisson_model.update_strengths_online('Everton', 'Fulham', 1, 1, result_key=f'r{i}', refit_every=3)
+            data = poisson_model._read_cache(poisson_model.ONLINE_PATH)
+            assert data['updates_since_refit'] == 0 and len(data['online_results']) == 3
+            with open(poisson_model.CACHE_PATH, 'rb') as f:
+                assert f.read() == fitted, "Online updates must not rewrite the fitted cache"
+
+            # Fit thay đổi bên dưới (vd. pull pickle mới) -> overlay dựng lại, giữ kết quả online
+            base = poisson_model._read_cache()
+            base['version'] += 1
+            poisson_model._write_cache(base)
+            assert poisson_model.strengths_version() == base['version'], "Stale overlay must not be used"
+            layered, _, _ = poisson_model.load_or_fit_strengths()
+            data = poisson_model._read_cache(poisson_model.ONLINE_PATH)
+            assert data['base'] == poisson_model._base_id(base) and len(data['online_results']) == 3
+            assert layered['Arsenal'] != before['Arsenal']
+            assert poisson_model.strengths_version() > v1
+        finally:
+            poisson_model.CACHE_PATH, poisson_model.ONLINE_PATH = original
+    print("✅ PASS: Online updates are local, deduplicated, versioned and refit periodically")
+
+
+def _online_worker(cache_path, online_path, worker, n):
+    import poisson_model
+    poisson_model.CACHE_PATH = cache_path
+    for i in range(n):
+        poisson_model.update_strengths_online('Arsenal', 'Chelsea', 1, 0, result_key=f'w{worker}-{i}',
+                                              refit_every=10 ** 6, online_path=online_path)
+
+
+def test_online_updates_across_processes():
+    """Test: nhiều process cùng cập nhật online không làm mất kết quả của nhau"""
+    print("\n=== Test: Concurrent Online Updates ===")
+    import multiprocessing
+    import tempfile
+    import poisson_model
+    original = poisson_model.CACHE_PATH
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_path = os.path.join(tmp, 'strengths.pkl')
+        online_path = os.path.join(tmp, 'online.pkl')
+        poisson_model.CACHE_PATH = cache_path
+        try:
+            poisson_model.load_or_fit_strengths(online_path=online_path)
+            ctx = multiprocessing.get_context('spawn')
+            workers = [ctx.Process(target=_online_worker, args=(cache_path, online_path, w, 5)) for w in range(3)]
+            for p in workers:
+                p.start()
+            for p in workers:
+                p.join(120)
+                assert p.exitcode == 0
+            data = poisson_model._read_cache(online_path)
+            assert len(data['online_results']) == 15, f"Lost updates: {len(data['online_results'])}"
+            assert not [f for f in os.listdir(tmp) if f.endswith('.tmp')], "Temp files must not be left behind"
+        finally:
+            poisson_model.CACHE_PATH = original
+    print("✅ PASS: Concurrent processes keep every online update")
+
+
+def test_kernels_and_adaptive_truncation():
+    """Test: pmf recurrence, totals bằng diagonal sums = convolution, truncation tự động"""
+    print("\n=== Test: Poisson Kernels ===")
+    from math import exp, factorial
+    pmf = poisson_pmf([0.7, 3.2], 12)
+    ref = [[lam ** k * exp(-lam) / factorial(k) for k in range(13)] for lam in (0.7, 3.2)]
+    assert np.allclose(pmf, ref, rtol=1e-12)
+
+    m = np.outer(pmf[0], pmf[1])
+    assert np.allclose(totals_from_matrix(m), totals_convolve(pmf[0], pmf[1])[0])
+
+    g = adaptive_max_goals(4.0, 2.5, tol=1e-9)
+    assert poisson_tail(4.0, g)[0] + poisson_tail(2.5, g)[0] <= 1e-9
+    assert poisson_tail(4.0, g - 1)[0] > 5e-10, "Truncation should be the smallest that meets tol"
+    assert 1.0 - MatchDistribution(4.0, 2.5).matrix.sum() < 1e-9
+    print("✅ PASS: Kernels agree with reference and truncation meets tolerance")
+
+
+
+def test_closed_form_matches_matrix():
+    """Test: Poisson-sum / Skellam dạng đóng khớp với ma trận tỷ số (kể cả rho)"""
+    print("\n=== Test: Closed-Form Totals / Goal Diff ===")
+    lam_h = np.array([0.6, 1.7, 3.1])
+    lam_a = np.array([2.2, 1.1, 0.4])
+    lines = [0.5, 1.5, 2.0, 2.5, 3.0, 4.5]
+    for rho in (0.0, -0.1):
+        mats = score_matrices(lam_h, lam_a, max_goals=20, rho=rho)
+        assert np.allclose(goal_diff_pmf(lam_h, lam_a, 10, rho=rho), batch_goal_diff(mats)[:, 10:31], atol=1e-12)
+        over, under, push = ou_closed_form(lam_h, lam_a, lines, rho=rho)
+        assert over.shape == (3, len(lines))
+        for i, line in enumerate(lines):
+            expected = batch_ou_probabilities(batch_totals(mats), line)
+            assert np.allclose((over[:, i], under[:, i], push[:, i]), expected, atol=1e-12), f"line {line}, rho {rho}"
+        dist = MatchDistribution(1.7, 1.1, rho=rho)
+        assert dist._matrix is None, "Markets other than correct score must not build the matrix"
+        assert abs(dist.btts() - dist.matrix[1:, 1:].sum()) < 1e-9
+    print("✅ PASS: Closed forms agree with the score matrix")
+
+
 if __name__ == '__main__':
     print("=" * 60)
     print("Running Poisson Model Tests")
@@ -97,6 +329,14 @@ if __name__ == '__main__':
         test_top_scorelines_order()
         test_expected_goals_positive()
         test_zero_line_ou()
+        test_match_distribution_consistency()
+        test_batch_matches_single()
+        test_compute_strengths_decay_and_seasons()
+        test_dixon_coles_fit_recovers_parameters()
+        test_online_strength_update()
+        test_online_updates_across_processes()
+        test_kernels_and_adaptive_truncation()
+        test_closed_form_matches_matrix()
         
         print("\n" + "=" * 60)
         print("✅ ALL TESTS PASSED")
@@ -0,0 +1,85 @@
+"""
+test_prediction_archive.py - Unit tests cho archive predictions theo mùa (partition, đọc lại, aggregates)
+"""
+
+import sys
+import os
+import tempfile
+from datetime import date, timedelta
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import prediction_archive
+import prediction_store
+import prediction_tracker
+
+
+def test_archive_past_seasons():
+    """Test: chuyển predictions mùa cũ sang archive, đọc lại qua các partition, stats không đổi"""
+    print("\n=== Test: Season Archive ===")
+    with tempfile.TemporaryDirectory() as tmp:
+        archive_dir = os.path.join(tmp, 'archive')
+        store = prediction_store.PredictionStore(os.path.join(tmp, 'p.db'), legacy_json=None,
+                                                 archive_dir=archive_dir)
+        try:
+            records = []
+            start = date(2022, 8, 6)
+            for i in range(60):
+                day = start + timedelta(days=12 * i)  # 2022-23 -> 2024-25
+                records.append({'id': f'H_A_{i}', 'home_team': 'H', 'away_team': 'A',
+                                'match_date': f'{day.isoformat()}T15:00:00Z', 'prediction': i % 2,
+                                'confidence': 0.5 + (i % 5) / 10, 'handicap_value': -0.25,
+                                'ou_line': 2.5, 'ou_pick': 'Over', 'predicted_goals': 2.7,
+                                'actual_result': None})
+            store.insert_many(records)
+            for i, rec in enumerate(records[:55]):
+                prediction_tracker._apply_result(rec, i % 4, i % 3, rec['handicap_value'])
+                store.update(rec)
+            before = store.aggregates()
+
+            cutoff = date(2024, 7, 1)
+            archived = prediction_archive.archive_settled(store, before=cutoff, archive_dir=archive_dir,
+                                                          fmt='csv.gz')
+            old = [r for r in records[:55] if prediction_store.metric_day(r) < cutoff]
+            assert set(archived) == {'2022-23', '2023-24'} and sum(archived.values()) == len(old)
+            assert prediction_archive.partitions(archive_dir) == sorted(archived)
+            # Store chỉ còn pending + mùa hiện tại; aggregates vẫn tính cả lịch sử
+            assert store.count() == 60 and len(list(store.iter_all())) == 60 - len(old)
+            assert store.aggregates() == before
+
+            frame = prediction_archive.read_archive(archive_dir=archive_dir)
+            assert sorted(frame['id']) == sorted(r['id'] for r in old)
+            assert frame['correct'].dtype == 'boolean'
+            one = prediction_archive.read_archive(['2022-23'], columns=['id', 'correct'], archive_dir=archive_dir)
+            assert list(one.columns) == ['id', 'correct'] and len(one) == archived['2022-23']
+            restored = {r['id']: r for r in prediction_archive.iter_archived(archive_dir=archive_dir)}
+            assert restored[old[0]['id']] == old[0]
+
+            # Rebuild (vd. đổi AGGREGATES_VERSION) đọc lại archive
+            store.rebuild_aggregates()
+            rebuilt = store.aggregates()
+            for key, entry in before.items():
+                assert rebuilt[key]['n'] == entry['n'] and rebuilt[key]['hits'] == entry['hits'], key
+                assert abs(rebuilt[key]['total'] - entry['total']) < 1e-9, key
+
+            # Chạy lại không archive trùng
+            assert prediction_archive.archive_settled(store, before=cutoff, archive_dir=archive_dir) == {}
+        finally:
+            store.close()
+    print("✅ PASS: Past seasons archived, queryable and still counted in stats")
+
+
+if __name__ == '__main__':
+    try:
+        test_archive_past_seasons()
+
+        print("\n" + "=" * 60)
+        print("✅ ALL TESTS PASSED")
+        print("=" * 60)
+    except AssertionError as e:
+        print(f"\n❌ TEST FAILED: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n❌ TEST ERROR: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
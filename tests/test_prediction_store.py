@@ -0,0 +1,339 @@
+"""
+test_prediction_store.py - Unit tests cho SQLite prediction store (migrate JSON, log, chấm kết quả, writer nền)
+"""
+
+import sys
+import os
+import json
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import prediction_store
+import prediction_tracker
+
+
+def test_migrate_log_and_settle():
+    """Test: migrate predictions_log.json một lần, log + update_result giữ nguyên signature"""
+    print("\n=== Test: Prediction Store ===")
+    with tempfile.TemporaryDirectory() as tmp:
+        old_paths = (prediction_store.DB_PATH, prediction_store.LEGACY_JSON_PATH)
+        old_update_strengths = prediction_tracker._update_strengths
+        old_stats_file = prediction_tracker.STATS_FILE
+        prediction_store.DB_PATH = os.path.join(tmp, 'predictions.db')
+        prediction_store.LEGACY_JSON_PATH = os.path.join(tmp, 'predictions_log.json')
+        prediction_tracker.STATS_FILE = os.path.join(tmp, 'prediction_stats.csv')
+        prediction_tracker._update_strengths = lambda *args, **kwargs: None
+        try:
+            legacy = [
+                {'id': 'Arsenal_Chelsea_1', 'timestamp': '2024-01-01T12:00:00', 'home_team': 'Arsenal',
+                 'away_team': 'Chelsea', 'prediction': 1, 'confidence': 0.75, 'handicap_value': -0.5,
+                 'actual_result': 1, 'correct': True, 'ou_line': 2.5, 'ou_pick': 'Over',
+                 'ou_actual': 'Over', 'ou_correct': True},
+                {'id': 'Man_United_Spurs_1', 'timestamp': '2024-01-02T12:00:00', 'home_team': 'Man United',
+                 'away_team': 'Spurs', 'prediction': 0, 'confidence': 0.6, 'handicap_value': 0.0,
+                 'actual_result': None, 'correct': None},
+            ]
+            with open(prediction_store.LEGACY_JSON_PATH, 'w', encoding='utf-8') as f:
+                json.dump(legacy, f)
+
+            store = prediction_store.get_store()
+            assert store.count() == 2 and store.count(pending=True) == 1
+            assert not os.path.exists(prediction_store.LEGACY_JSON_PATH)
+            assert os.path.exists(prediction_store.LEGACY_JSON_PATH + '.migrated')
+
+            # Tên đội được chuẩn hóa giống !updateresult
+            found = prediction_tracker.find_pending_predictions('man united', 'Spurs')
+            assert [p['id'] for p in found] == ['Man_United_Spurs_1']
+
+            pred_id = prediction_tracker.log_prediction('Arsenal', 'Chelsea', prediction=0, confidence=0.5,
+                                                        handicap_value=0.5)
+            assert prediction_tracker.count_predictions() == 3
+            # Spurs thắng 0-2, chọn đội khách không chấp -> đúng
+            assert prediction_tracker.update_result('Man_United_Spurs_1', 0, 2, 0.0) is True
+            assert prediction_tracker.update_result('missing', 1, 0, 0.0) is False
+
+            stats = prediction_tracker.get_stats()
+            assert stats['total_predictions'] == 3
+            assert stats['completed_predictions'] == 2 and stats['correct_predictions'] == 2
+            assert [p['id'] for p in stats['recent_10']] == ['Arsenal_Chelsea_1', 'Man_United_Spurs_1']
+            assert prediction_tracker.get_ou_accuracy(2.5)['count'] == 1
+            assert [p['id'] for p in prediction_tracker.load_predictions()][-1] == pred_id
+        finally:
+            prediction_store.shutdown()
+            prediction_store.DB_PATH, prediction_store.LEGACY_JSON_PATH = old_paths
+            prediction_tracker._update_strengths = old_update_strengths
+            prediction_tracker.STATS_FILE = old_stats_file
+    print("✅ PASS: JSON log migrated once, lookups and stats served from SQLite")
+
+
+def test_write_behind_batches():
+    """Test: writer chạy nền gom records thành batch, flush trước khi đọc và khi đóng"""
+    print("\n=== Test: Write-Behind Writer ===")
+    with tempfile.TemporaryDirectory() as tmp:
+        old_paths = (prediction_store.DB_PATH, prediction_store.LEGACY_JSON_PATH)
+        prediction_store.DB_PATH = os.path.join(tmp, 'predictions.db')
+        prediction_store.LEGACY_JSON_PATH = os.path.join(tmp, 'predictions_log.json')
+        batches = []
+        original_insert_many = prediction_store.PredictionStore.insert_many
+
+        def counting_insert_many(self, records):
+            batches.append(len(records))
+            return original_insert_many(self, records)
+
+        prediction_store.PredictionStore.insert_many = counting_insert_many
+        try:
+            writer = prediction_store.get_writer()
+            for i in range(100):
+                writer.submit({'id': f'A_B_{i}', 'home_team': 'A', 'away_team': 'B', 'confidence': 0.6,
+                               'actual_result': None})
+            assert prediction_store.flush_writes()
+            assert prediction_store.get_store().count() == 100
+            assert sum(batches) == 100 and len(batches) < 100
+            assert max(batches) <= prediction_store.WRITER_MAX_BATCH
+
+            writer.submit({'id': 'A_B_last', 'home_team': 'A', 'away_team': 'B', 'actual_result': None})
+            writer.close()  # đóng = flush nốt hàng đợi
+            assert prediction_store.get_store().get('A_B_last') is not None
+        finally:
+            prediction_store.PredictionStore.insert_many = original_insert_many
+            prediction_store.shutdown()
+            prediction_store.DB_PATH, prediction_store.LEGACY_JSON_PATH = old_paths
+    print("✅ PASS: Records written in batches, nothing lost on close")
+
+
+def test_incremental_aggregates_match_rebuild():
+    """Test: aggregates cập nhật O(1) khi chốt kết quả khớp với tính lại từ đầu"""
+    print("\n=== Test: Incremental Aggregates ===")
+    import random
+    rng = random.Random(7)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = prediction_store.PredictionStore(os.path.join(tmp, 'p.db'), legacy_json=None)
+        try:
+            records = []
+            for i in range(60):
+                records.append({'id': f'H_A_{i}', 'home_team': 'H', 'away_team': 'A',
+                                'prediction': rng.randint(0, 1), 'confidence': rng.uniform(0.5, 0.95),
+                                'handicap_value': rng.choice([-0.5, -0.25, 0.0, 0.25]),
+                                'ou_line': rng.choice([1.5, 2.5, 3.5]), 'ou_pick': rng.choice(['Over', 'Under']),
+                                'predicted_goals': rng.uniform(1.5, 3.5), 'actual_result': None})
+            store.insert_many(records)
+            for rec in records[:45]:
+                prediction_tracker._apply_result(rec, rng.randint(0, 4), rng.randint(0, 3), rec['handicap_value'])
+                store.update(rec)
+            # Chốt lại một trận với tỉ số khác: delta phải trừ đóng góp cũ
+            prediction_tracker._apply_result(records[0], 0, 0, records[0]['handicap_value'])
+            store.update(records[0])
+
+            incremental = store.aggregates()
+            store.rebuild_aggregates()
+            rebuilt = store.aggregates()
+            assert set(incremental) == set(rebuilt)
+            for key, entry in rebuilt.items():
+                assert incremental[key]['n'] == entry['n'] and incremental[key]['hits'] == entry['hits'], key
+                assert abs(incremental[key]['total'] - entry['total']) < 1e-9, key
+            assert store.count() == 60 and store.count(pending=True) == 15
+
+            graded = [r for r in records if r.get('correct') is not None]
+            assert rebuilt['graded']['n'] == len(graded)
+            assert rebuilt['graded']['hits'] == sum(1 for r in graded if r['correct'])
+        finally:
+            store.close()
+    print("✅ PASS: Incremental aggregates equal a full recompute")
+
+
+def test_rolling_windows_from_buckets():
+    """Test: cửa sổ 7/30/90 ngày cộng từ buckets ngày/tuần khớp với quét toàn bộ"""
+    print("\n=== Test: Rolling Window Buckets ===")
+    import random
+    from datetime import date, timedelta
+    rng = random.Random(11)
+    today = date(2024, 5, 19)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = prediction_store.PredictionStore(os.path.join(tmp, 'p.db'), legacy_json=None)
+        try:
+            records = []
+            for i in range(120):
+                day = today - timedelta(days=rng.randint(0, 200))
+                records.append({'id': f'H_A_{i}', 'home_team': 'H', 'away_team': 'A',
+                                'match_date': f'{day.isoformat()}T15:00:00Z',
+                                'prediction': rng.randint(0, 1), 'confidence': rng.uniform(0.5, 0.95),
+                                'handicap_value': rng.choice([-0.5, 0.0, 0.25]),
+                                'ou_line': 2.5, 'ou_pick': rng.choice(['Over', 'Under']),
+                                'predicted_goals': rng.uniform(1.5, 3.5), 'actual_result': None})
+            store.insert_many(records)
+            for rec in records[:100]:
+                prediction_tracker._apply_result(rec, rng.randint(0, 4), rng.randint(0, 3), rec['handicap_value'])
+                store.update(rec)
+            # Sửa kết quả một trận: bucket của nó phải được trừ rồi cộng lại
+            prediction_tracker._apply_result(records[0], 2, 2, records[0]['handicap_value'])
+            store.update(records[0])
+
+            def brute(start, end):
+                rows = [r for r in records[:100] if start <= prediction_store.metric_day(r) <= end]
+                graded = [r for r in rows if r['correct'] is not None]
+                return len(rows), len(graded), sum(1 for r in graded if r['correct'])
+
+            for days in (1, 7, 30, 90, 150):
+                start = today - timedelta(days=days - 1)
+                agg = store.window_aggregates(start, today)
+                n, graded, hits = brute(start, today)
+                assert agg.get('completed', {}).get('n', 0) == n, days
+                assert agg.get('graded', {}).get('n', 0) == graded, days
+                assert agg.get('graded', {}).get('hits', 0) == hits, days
+
+            incremental = store.window_aggregates(today - timedelta(days=89), today)
+            store.rebuild_aggregates()
+            assert store.window_aggregates(today - timedelta(days=89), today) == incremental
+        finally:
+            store.close()
+    assert prediction_tracker.season_start(today) == date(2023, 7, 1)
+    assert prediction_tracker.season_start(date(2024, 8, 3)) == date(2024, 7, 1)
+    print("✅ PASS: Rolling windows equal a brute-force scan")
+
+
+def test_result_matching_by_fixture_key():
+    """Test: auto_fetch_results khớp trận theo (home, away, ngày) đã chuẩn hóa, không nhầm Man United / Man City"""
+    print("\n=== Test: Result Matching ===")
+
+    def api_match(match_id, home, away, day, hg, ag):
+        return {'id': match_id, 'homeTeam': {'name': home}, 'awayTeam': {'name': away},
+                'utcDate': f'{day}T15:00:00Z', 'score': {'fullTime': {'home': hg, 'away': ag}}}
+
+    matches = [
+        api_match(1, 'Manchester City FC', 'Manchester United FC', '2024-03-03', 3, 1),
+        api_match(2, 'Manchester United FC', 'Liverpool FC', '2024-04-07', 2, 2),
+        api_match(3, 'Tottenham Hotspur FC', 'Arsenal FC', '2024-04-28', 2, 3),
+        api_match(4, 'Arsenal FC', 'Tottenham Hotspur FC', '2024-09-15', 1, 0),
+        api_match(5, 'Chelsea FC', 'Everton FC', '2024-04-15', None, None),  # chưa có tỉ số
+    ]
+    by_fixture, by_teams = prediction_tracker._index_matches(matches)
+    find = lambda pred: prediction_tracker._find_match(pred, by_fixture, by_teams)
+
+    # Chiều sân khác nhau không được khớp nhầm
+    assert find({'home_team': 'Man United', 'away_team': 'Man City', 'timestamp': '2024-03-01T10:00:00'}) is None
+    assert find({'home_team': 'Man City', 'away_team': 'Man United', 'timestamp': '2024-03-01T10:00:00'})['id'] == 1
+    assert find({'home_team': 'Manchester United', 'away_team': 'Liverpool', 'timestamp': '2024-04-01'})['id'] == 2
+    # Biết ngày thi đấu (commence_time) -> khớp đúng ngày
+    pred = {'home_team': 'Spurs', 'away_team': 'Arsenal', 'timestamp': '2024-04-20T09:00:00',
+            'odds_data': {'source': 'the_odds_api', 'timestamp': '2024-04-28T13:30:00Z'}}
+    assert find(pred)['id'] == 3
+    pred['odds_data']['timestamp'] = '2024-05-05T13:30:00Z'
+    assert find(pred) is None
+    # Không biết ngày -> trận sớm nhất kể từ lúc log, bỏ qua trận trước đó
+    assert find({'home_team': 'Arsenal', 'away_team': 'Tottenham', 'timestamp': '2024-09-10T09:00:00'})['id'] == 4
+    assert find({'home_team': 'Arsenal', 'away_team': 'Tottenham', 'timestamp': '2024-09-20T09:00:00'}) is None
+    assert find({'home_team': 'Chelsea', 'away_team': 'Everton', 'timestamp': '2024-04-10'}) is None
+    print("✅ PASS: Pending predictions resolved by canonical fixture key")
+
+
+def test_settle_claims_once():
+    """Test: hai process cùng chốt một prediction -> chỉ một bên thắng và cập nhật strengths"""
+    print("\n=== Test: Settle Claim ===")
+    with tempfile.TemporaryDirectory() as tmp:
+        old_paths = (prediction_store.DB_PATH, prediction_store.LEGACY_JSON_PATH)
+        old_update_strengths = prediction_tracker._update_strengths
+        old_stats_file = prediction_tracker.STATS_FILE
+        prediction_store.DB_PATH = os.path.join(tmp, 'predictions.db')
+        prediction_store.LEGACY_JSON_PATH = os.path.join(tmp, 'predictions_log.json')
+        prediction_tracker.STATS_FILE = os.path.join(tmp, 'prediction_stats.csv')
+        learned = []
+        prediction_tracker._update_strengths = lambda pred, *args, **kwargs: learned.append(pred['id'])
+        other = None
+        try:
+            store = prediction_store.get_store()
+            store.insert_many([{'id': f'Arsenal_Chelsea_{i}', 'timestamp': '2024-04-20T09:00:00',
+                                'home_team': 'Arsenal', 'away_team': 'Chelsea', 'prediction': 1,
+                                'confidence': 0.7, 'handicap_value': -0.5, 'actual_result': None}
+                               for i in range(2)])
+            # "Process" khác mở cùng database và chốt trước
+            other = prediction_store.PredictionStore(prediction_store.DB_PATH, legacy_json=None)
+            stale = store.pending()
+            rec = other.get('Arsenal_Chelsea_0')
+            prediction_tracker._apply_result(rec, 2, 0, -0.5)
+            assert other.settle(rec) is True
+            assert other.settle(rec) is False, "Already settled: the claim must fail"
+
+            matches = [{'id': 9, 'homeTeam': {'name': 'Arsenal FC'}, 'awayTeam': {'name': 'Chelsea FC'},
+                        'utcDate': '2024-04-21T15:00:00Z', 'score': {'fullTime': {'home': 0, 'away': 1}}}]
+            store.pending = lambda: stale  # danh sách pending đọc trước khi process kia chốt
+            settled = prediction_tracker.settle_from_matches(matches)
+            assert [p['id'] for p in settled] == ['Arsenal_Chelsea_1']
+            assert learned == ['Arsenal_Chelsea_1'], f"Strengths must learn each match once: {learned}"
+            assert store.get('Arsenal_Chelsea_0')['home_goals'] == 2, "The winner's result must be kept"
+            assert store.count(pending=False) == 2
+
+            # Sửa kết quả prediction đã chốt: ghi đè nhưng không học lại
+            assert prediction_tracker.update_result('Arsenal_Chelsea_0', 0, 1, -0.5) is False
+            assert store.get('Arsenal_Chelsea_0')['home_goals'] == 0 and len(learned) == 1
+            assert store.aggregates()['graded']['n'] == 2
+        finally:
+            if other is not None:
+                other.close()
+            prediction_store.shutdown()
+            prediction_store.DB_PATH, prediction_store.LEGACY_JSON_PATH = old_paths
+            prediction_tracker._update_strengths = old_update_strengths
+            prediction_tracker.STATS_FILE = old_stats_file
+    print("✅ PASS: Only the caller that claims a pending prediction settles it")
+
+
+def _concurrent_writer(db_path, stats_path, worker, n):
+    """Một process ghi: log n predictions cùng cặp đấu rồi chốt một nửa"""
+    prediction_store.DB_PATH = db_path
+    prediction_store.LEGACY_JSON_PATH = db_path + '.json'
+    prediction_tracker.STATS_FILE = stats_path
+    prediction_tracker._update_strengths = lambda *args, **kwargs: None
+    ids = [prediction_tracker.log_prediction('Arsenal', 'Chelsea', prediction=worker % 2, confidence=0.6,
+                                             handicap_value=0.0) for _ in range(n)]
+    for pred_id in ids[: n // 2]:
+        prediction_tracker.update_result(pred_id, 1, 0, 0.0)
+    prediction_store.shutdown()
+
+
+def test_concurrent_processes():
+    """Test: nhiều process cùng log / chốt trên một database không mất record, aggregates vẫn đúng"""
+    print("\n=== Test: Concurrent Writer Processes ===")
+    import multiprocessing
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'predictions.db')
+        stats_path = os.path.join(tmp, 'prediction_stats.csv')
+        procs = [multiprocessing.Process(target=_concurrent_writer, args=(db_path, stats_path, w, 40))
+                 for w in range(4)]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join(120)
+            assert proc.exitcode == 0
+
+        store = prediction_store.PredictionStore(db_path, legacy_json=None)
+        try:
+            assert store.count() == 160 and store.count(pending=False) == 80
+            incremental = store.aggregates()
+            store.rebuild_aggregates()
+            assert {k: (v['n'], v['hits']) for k, v in incremental.items()} == \
+                   {k: (v['n'], v['hits']) for k, v in store.aggregates().items()}
+        finally:
+            store.close()
+    print("✅ PASS: Concurrent writers lose no records")
+
+
+if __name__ == '__main__':
+    try:
+        test_migrate_log_and_settle()
+        test_write_behind_batches()
+        test_incremental_aggregates_match_rebuild()
+        test_rolling_windows_from_buckets()
+        test_result_matching_by_fixture_key()
+        test_settle_claims_once()
+        test_concurrent_processes()
+
+        print("\n" + "=" * 60)
+        print("✅ ALL TESTS PASSED")
+        print("=" * 60)
+    except AssertionError as e:
+        print(f"\n❌ TEST FAILED: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n❌ TEST ERROR: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,81 @@
+"""
+test_settlement_scheduler.py - Unit tests cho lịch tự động chốt kết quả (kickoff + 2h, retry, backoff)
+"""
+
+import sys
+import os
+from datetime import datetime, timedelta, timezone
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+
+from settlement_scheduler import SettlementScheduler, retry_after_seconds
+
+
+def test_schedule_and_backoff():
+    """Test: chỉ fetch sau kickoff + 2h, thử lại theo retry_interval, backoff khi lỗi"""
+    print("\n=== Test: Settlement Schedule ===")
+    kickoff = datetime(2024, 4, 6, 14, 0, tzinfo=timezone.utc)
+    sched = SettlementScheduler()
+
+    assert not sched.is_due(kickoff + timedelta(minutes=90), [kickoff])
+    assert sched.is_due(kickoff + timedelta(hours=2), [kickoff])
+    sched.record_success(kickoff + timedelta(hours=2))
+    # Trận chưa chốt được: chờ retry_interval trước khi gọi lại
+    assert not sched.is_due(kickoff + timedelta(hours=2, minutes=10), [kickoff])
+    assert sched.is_due(kickoff + timedelta(hours=2, minutes=30), [kickoff])
+    # Một trận khác vừa xong -> fetch ngay
+    later = kickoff + timedelta(minutes=40)
+    assert sched.is_due(later + timedelta(hours=2), [kickoff, later])
+    # Không có trận nào (hoặc trận quá cũ) -> không gọi API
+    assert not sched.is_due(kickoff + timedelta(days=30), [kickoff])
+    assert not sched.is_due(kickoff, [])
+
+    # Không rõ giờ đá: dò định kỳ
+    idle = SettlementScheduler()
+    assert idle.is_due(kickoff, [], has_unknown=True)
+    idle.record_success(kickoff)
+    assert not idle.is_due(kickoff + timedelta(hours=1), [], has_unknown=True)
+    assert idle.is_due(kickoff + timedelta(hours=6), [], has_unknown=True)
+
+    # Backoff tăng gấp đôi, tôn trọng Retry-After, reset khi thành công
+    now = kickoff + timedelta(hours=3)
+    assert sched.record_failure(now) == timedelta(minutes=5)
+    assert not sched.is_due(now + timedelta(minutes=4), [kickoff])
+    assert sched.record_failure(now) == timedelta(minutes=10)
+    assert sched.record_failure(now, retry_after=3600) == timedelta(hours=1)
+    assert sched.is_due(now + timedelta(hours=1), [kickoff])
+    sched.record_success(now + timedelta(hours=1))
+    assert sched.failures == 0 and sched.backoff_until is None
+    print("✅ PASS: Fetch scheduled after kickoff, retried and backed off")
+
+
+def test_retry_after_headers():
+    """Test: đọc thời gian chờ từ header của provider"""
+    print("\n=== Test: Retry-After Headers ===")
+    response = requests.Response()
+    response.status_code = 429
+    response.headers['X-RequestCounter-Reset'] = '42'
+    assert retry_after_seconds(requests.exceptions.HTTPError(response=response)) == 42.0
+    response.headers['Retry-After'] = '7'
+    assert retry_after_seconds(requests.exceptions.HTTPError(response=response)) == 7.0
+    assert retry_after_seconds(requests.exceptions.ConnectionError('down')) is None
+    print("✅ PASS: Provider wait hints parsed")
+
+
+if __name__ == '__main__':
+    try:
+        test_schedule_and_backoff()
+        test_retry_after_headers()
+
+        print("\n" + "=" * 60)
+        print("✅ ALL TESTS PASSED")
+        print("=" * 60)
+    except AssertionError as e:
+        print(f"\n❌ TEST FAILED: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n❌ TEST ERROR: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,80 @@
+"""
+test_strength_snapshots.py - Unit tests cho snapshot sức mạnh đội theo vòng đấu
+"""
+
+import sys
+import os
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+from poisson_model import compute_strengths
+from strength_snapshots import build_snapshots, gameweek_cutoffs, StrengthSnapshots, _to_day
+
+
+def _synthetic_dataset(path):
+    rng = np.random.default_rng(3)
+    teams = ['Arsenal', 'Chelsea', 'Liverpool', 'Everton']
+    rows = []
+    start = pd.Timestamp('2022-08-06')
+    for week in range(12):
+        day = start + pd.Timedelta(days=7 * week)
+        for i, (h, a) in enumerate([(teams[week % 4], teams[(week + 1) % 4]), (teams[(week + 2) % 4], teams[(week + 3) % 4])]):
+            rows.append({'Date': (day + pd.Timedelta(days=i)).strftime('%d/%m/%Y'), 'Season': 2223,
+                         'HomeTeam': h, 'AwayTeam': a, 'FTHG': int(rng.poisson(1.5)), 'FTAG': int(rng.poisson(1.1))})
+    pd.DataFrame(rows).to_csv(path, index=False)
+    return pd.DataFrame(rows)
+
+
+def test_gameweek_cutoffs():
+    """Test: vòng đấu = chuỗi ngày có trận, tách nhau bởi khoảng nghỉ >= 2 ngày"""
+    print("\n=== Test: Gameweek Cutoffs ===")
+    days = np.array([100, 101, 103, 104, 104, 110])
+    assert gameweek_cutoffs(days).tolist() == [100, 103, 110]
+    print("✅ PASS: Gameweeks split on gaps")
+
+
+def test_snapshots_point_in_time():
+    """Test: snapshot chỉ dùng trận trước vòng đấu, tra cứu theo ngày đúng snapshot"""
+    print("\n=== Test: Strength Snapshots As-Of ===")
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'data.csv')
+        out_path = os.path.join(tmp, 'snap.npz')
+        df = _synthetic_dataset(csv_path)
+        summary = build_snapshots(csv_path, out_path, method='ratio', min_matches=4, workers=1)
+        snaps = StrengthSnapshots.load(out_path)
+        assert len(snaps) == summary['snapshots'] == 10  # vòng 1-2 chưa đủ 4 trận lịch sử
+
+        dates = pd.to_datetime(df['Date'], dayfirst=True)
+        assert snaps.as_of('01/08/2022') is None
+        # Chủ nhật của tuần thứ 6: snapshot bắt đầu thứ bảy cùng tuần, chưa gồm trận thứ bảy
+        query = pd.Timestamp('2022-08-06') + pd.Timedelta(days=7 * 5 + 1)
+        strengths, mu_home, mu_away = snaps.as_of(query)
+        expected, exp_home, exp_away = compute_strengths(df[dates < pd.Timestamp('2022-08-06') + pd.Timedelta(days=35)])
+        assert np.isclose(mu_home, exp_home) and np.isclose(mu_away, exp_away)
+        for team, values in expected.items():
+            for name, value in values.items():
+                assert np.isclose(strengths[team][name], value, rtol=1e-6), f"{team} {name}"
+        # Sau vòng cuối vẫn dùng snapshot cuối
+        assert snaps.index_for('2030-01-01') == len(snaps) - 1
+        assert _to_day('06/08/2022') == _to_day(pd.Timestamp('2022-08-06'))
+    print("✅ PASS: Snapshots are point-in-time and lookups are O(1)")
+
+
+if __name__ == '__main__':
+    try:
+        test_gameweek_cutoffs()
+        test_snapshots_point_in_time()
+
+        print("\n" + "=" * 60)
+        print("✅ ALL TESTS PASSED")
+        print("=" * 60)
+    except AssertionError as e:
+        print(f"\n❌ TEST FAILED: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n❌ TEST ERROR: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,95 @@
+"""
+test_tree_inference.py - Unit tests cho array-based tree backend
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from sklearn.ensemble import (
+    RandomForestClassifier, GradientBoostingClassifier,
+    RandomForestRegressor, GradientBoostingRegressor,
+)
+from sklearn.linear_model import LogisticRegression
+from tree_inference import compile_tree_model, verify_compiled
+
+
+def _make_data(n=300, n_features=10, seed=7):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n, n_features))
+    y_cls = (X[:, 0] + X[:, 1] * X[:, 2] > 0).astype(int)
+    y_reg = 2.7 + X[:, 0] - 0.5 * X[:, 3] + rng.normal(scale=0.3, size=n)
+    return X, y_cls, y_reg, rng
+
+
+def test_classifiers_match_predict_proba():
+    """Test: predict_proba của backend khớp sklearn (RF + GB)"""
+    print("\n=== Test: Compiled Classifiers ===")
+    X, y, _, rng = _make_data()
+    X_new = rng.normal(size=(200, X.shape[1]))
+    for model in [
+        RandomForestClassifier(n_estimators=50, max_depth=10, min_samples_split=5, random_state=42),
+        GradientBoostingClassifier(n_estimators=50, learning_rate=0.1, max_depth=5, random_state=42),
+    ]:
+        model.fit(X, y)
+        compiled = compile_tree_model(model)
+        assert compiled is not None, f"{type(model).__name__} should compile"
+        np.testing.assert_allclose(compiled.predict_proba(X_new), model.predict_proba(X_new), atol=1e-9)
+        assert (compiled.predict(X_new) == model.predict(X_new)).all()
+        # Rows sitting exactly on split thresholds
+        assert verify_compiled(compiled, model)
+        print(f"  {type(model).__name__}: {compiled.n_trees} trees ✅")
+    print("✅ PASS: Compiled classifiers match sklearn")
+
+
+def test_regressors_match_predict():
+    """Test: predict của backend khớp sklearn (RF + GB regressor)"""
+    print("\n=== Test: Compiled Regressors ===")
+    X, _, y, rng = _make_data()
+    X_new = rng.normal(size=(200, X.shape[1]))
+    for model in [
+        RandomForestRegressor(n_estimators=50, max_depth=10, min_samples_split=5, random_state=42),
+        GradientBoostingRegressor(n_estimators=50, learning_rate=0.1, max_depth=5, random_state=42),
+    ]:
+        model.fit(X, y)
+        compiled = compile_tree_model(model)
+        assert compiled is not None, f"{type(model).__name__} should compile"
+        np.testing.assert_allclose(compiled.predict(X_new), model.predict(X_new), atol=1e-9)
+        assert verify_compiled(compiled, model)
+        print(f"  {type(model).__name__}: {compiled.n_trees} trees ✅")
+    print("✅ PASS: Compiled regressors match sklearn")
+
+
+def test_single_row_and_unsupported():
+    """Test: một dòng (1D input) và model không phải cây → None"""
+    print("\n=== Test: Single Row + Unsupported ===")
+    X, y, _, _ = _make_data()
+    model = RandomForestClassifier(n_estimators=10, random_state=0).fit(X, y)
+    compiled = compile_tree_model(model)
+    assert compiled.predict_proba(X[0]).shape == (1, 2)
+    assert compile_tree_model(LogisticRegression().fit(X, y)) is None
+    print("✅ PASS: Single row works, LogisticRegression falls back to sklearn")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("Running Tree Inference Tests")
+    print("=" * 60)
+
+    try:
+        test_classifiers_match_predict_proba()
+        test_regressors_match_predict()
+        test_single_row_and_unsupported()
+
+        print("\n" + "=" * 60)
+        print("✅ ALL TESTS PASSED")
+        print("=" * 60)
+    except AssertionError as e:
+        print(f"\n❌ TEST FAILED: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n❌ TEST ERROR: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
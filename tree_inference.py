@@ -0,0 +1,241 @@
+"""
+tree_inference.py - Array-based inference backend for sklearn tree ensembles
+
+Flattens fitted RandomForest / ExtraTrees / GradientBoosting models into
+contiguous NumPy arrays (feature, threshold, children, leaf values) and
+evaluates every tree for N rows at once with a vectorized traversal.
+
+sklearn stays the reference implementation: `compile_tree_model` returns None
+for unsupported estimators and `verify_compiled` checks a compiled model
+against `predict_proba` / `predict` before it is used.
+"""
+
+from __future__ import annotations
+
+import logging
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+FOREST_CLASSIFIER = 'forest_classifier'
+FOREST_REGRESSOR = 'forest_regressor'
+GB_CLASSIFIER = 'gb_classifier'
+GB_REGRESSOR = 'gb_regressor'
+
+
+class CompiledTreeEnsemble:
+    """Flat-array representation of a fitted tree ensemble.
+
+    All trees share one node table; `roots[t]` is the global index of tree t's
+    root. Leaves point to themselves so traversal can run a fixed number of
+    steps (the maximum depth) without per-node branching.
+    """
+
+    def __init__(self, kind: str, feature: np.ndarray, threshold: np.ndarray,
+                 left: np.ndarray, right: np.ndarray, missing_left: np.ndarray,
+                 value: np.ndarray, roots: np.ndarray, max_depth: int,
+                 n_features: int, classes: Optional[np.ndarray] = None,
+                 init_raw: Optional[np.ndarray] = None, learning_rate: float = 1.0,
+                 n_groups: int = 1, loss: Optional[str] = None):
+        self.kind = kind
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.missing_left = missing_left
+        self.value = value
+        self.roots = roots
+        self.max_depth = max_depth
+        self.n_features = n_features
+        self.classes_ = classes
+        self.init_raw = init_raw
+        self.learning_rate = learning_rate
+        self.n_groups = n_groups
+        self.loss = loss
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    def _as_array(self, X) -> np.ndarray:
+        # sklearn trees compare float32 inputs against float64 thresholds
+        arr = np.asarray(X, dtype=np.float32)
+        if arr.ndim == 1:
+            arr = arr.reshape(1, -1)
+        if arr.shape[1] != self.n_features:
+            raise ValueError(f'Expected {self.n_features} features, got {arr.shape[1]}')
+        return arr
+
+    def apply(self, X) -> np.ndarray:
+        """Return global leaf indices, shape (n_rows, n_trees)."""
+        X = self._as_array(X)
+        n = X.shape[0]
+        rows = np.arange(n)[:, None]
+        node = np.broadcast_to(self.roots, (n, self.n_trees)).copy()
+        has_nan = bool(np.isnan(X).any())
+        for _ in range(self.max_depth):
+            x = X[rows, self.feature[node]]
+            go_left = x <= self.threshold[node]
+            if has_nan:
+                go_left |= np.isnan(x) & self.missing_left[node]
+            node = np.where(go_left, self.left[node], self.right[node])
+        return node
+
+    def _raw_predict(self, X) -> np.ndarray:
+        leaves = self.apply(X)
+        vals = self.value[leaves]  # (n, T) for boosting
+        n = vals.shape[0]
+        summed = vals.reshape(n, self.n_groups, -1).sum(axis=2)
+        return self.init_raw[None, :] + self.learning_rate * summed
+
+    def predict_proba(self, X) -> np.ndarray:
+        if self.kind == FOREST_CLASSIFIER:
+            return self.value[self.apply(X)].mean(axis=1)
+        if self.kind == GB_CLASSIFIER:
+            raw = self._raw_predict(X)
+            if self.n_groups == 1:
+                scale = 2.0 if self.loss == 'exponential' else 1.0
+                p1 = 1.0 / (1.0 + np.exp(-scale * raw[:, 0]))
+                return np.column_stack([1.0 - p1, p1])
+            raw = raw - raw.max(axis=1, keepdims=True)
+            e = np.exp(raw)
+            return e / e.sum(axis=1, keepdims=True)
+        raise AttributeError(f'{self.kind} does not support predict_proba')
+
+    def predict(self, X) -> np.ndarray:
+        if self.kind in (FOREST_CLASSIFIER, GB_CLASSIFIER):
+            return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+        if self.kind == FOREST_REGRESSOR:
+            return self.value[self.apply(X)].mean(axis=1)
+        return self._raw_predict(X)[:, 0]
+
+
+def _flatten(trees: List, normalize: bool) -> dict:
+    """Concatenate sklearn `tree_` objects into one global node table."""
+    features, thresholds, lefts, rights, missing, values, roots = [], [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for est in trees:
+        t = est.tree_
+        n_nodes = t.node_count
+        idx = np.arange(n_nodes) + offset
+        is_leaf = t.children_left == -1
+        left = np.where(is_leaf, idx, t.children_left + offset)
+        right = np.where(is_leaf, idx, t.children_right + offset)
+        feat = np.where(is_leaf, 0, t.feature)
+        mgl = getattr(t, 'missing_go_to_left', None)
+        missing.append(np.zeros(n_nodes, dtype=bool) if mgl is None else np.asarray(mgl, dtype=bool))
+        val = t.value[:, 0, :]
+        if normalize:
+            total = val.sum(axis=1, keepdims=True)
+            total[total == 0] = 1.0
+            val = val / total
+        else:
+            val = val[:, 0]
+        features.append(feat)
+        thresholds.append(t.threshold)
+        lefts.append(left)
+        rights.append(right)
+        values.append(val)
+        roots.append(offset)
+        max_depth = max(max_depth, int(t.max_depth))
+        offset += n_nodes
+    return {
+        'feature': np.ascontiguousarray(np.concatenate(features), dtype=np.intp),
+        'threshold': np.ascontiguousarray(np.concatenate(thresholds), dtype=np.float64),
+        'left': np.ascontiguousarray(np.concatenate(lefts), dtype=np.intp),
+        'right': np.ascontiguousarray(np.concatenate(rights), dtype=np.intp),
+        'missing_left': np.ascontiguousarray(np.concatenate(missing)),
+        'value': np.ascontiguousarray(np.concatenate(values), dtype=np.float64),
+        'roots': np.asarray(roots, dtype=np.intp),
+        'max_depth': max_depth,
+    }
+
+
+def compile_tree_model(model) -> Optional[CompiledTreeEnsemble]:
+    """Compile a fitted sklearn tree ensemble; returns None if unsupported."""
+    from sklearn.ensemble import (
+        RandomForestClassifier, RandomForestRegressor,
+        ExtraTreesClassifier, ExtraTreesRegressor,
+        GradientBoostingClassifier, GradientBoostingRegressor,
+    )
+    from sklearn.dummy import DummyClassifier, DummyRegressor
+
+    if not hasattr(model, 'estimators_'):
+        return None
+    n_features = int(getattr(model, 'n_features_in_', 0))
+    if getattr(model, 'n_outputs_', 1) != 1:
+        return None
+
+    try:
+        if isinstance(model, (RandomForestClassifier, ExtraTreesClassifier)):
+            arrays = _flatten(model.estimators_, normalize=True)
+            return CompiledTreeEnsemble(FOREST_CLASSIFIER, n_features=n_features,
+                                        classes=np.asarray(model.classes_), **arrays)
+
+        if isinstance(model, (RandomForestRegressor, ExtraTreesRegressor)):
+            arrays = _flatten(model.estimators_, normalize=False)
+            return CompiledTreeEnsemble(FOREST_REGRESSOR, n_features=n_features, **arrays)
+
+        if isinstance(model, (GradientBoostingClassifier, GradientBoostingRegressor)):
+            init = model.init_
+            if not (init == 'zero' or isinstance(init, (DummyClassifier, DummyRegressor))):
+                return None
+            # Default init estimators predict a constant, so one probe row is enough
+            init_raw = np.asarray(model._raw_predict_init(np.zeros((1, n_features), dtype=np.float32))[0],
+                                  dtype=np.float64)
+            n_groups = model.estimators_.shape[1]
+            # Class-major order so per-class sums are a reshape away
+            trees = [model.estimators_[i, k] for k in range(n_groups) for i in range(model.estimators_.shape[0])]
+            arrays = _flatten(trees, normalize=False)
+            if isinstance(model, GradientBoostingClassifier):
+                return CompiledTreeEnsemble(GB_CLASSIFIER, n_features=n_features,
+                                            classes=np.asarray(model.classes_), init_raw=init_raw,
+                                            learning_rate=float(model.learning_rate),
+                                            n_groups=n_groups, loss=model.loss, **arrays)
+            return CompiledTreeEnsemble(GB_REGRESSOR, n_features=n_features, init_raw=init_raw,
+                                        learning_rate=float(model.learning_rate),
+                                        n_groups=n_groups, loss=model.loss, **arrays)
+    except Exception as e:
+        logger.warning(f'Could not compile {type(model).__name__}: {e}')
+        return None
+
+    return None
+
+
+def probe_rows(compiled: CompiledTreeEnsemble, n: int = 64, seed: int = 0) -> np.ndarray:
+    """Build rows that sit on and around split thresholds to exercise both branches."""
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n, compiled.n_features))
+    internal = (compiled.left != np.arange(len(compiled.left))) & np.isfinite(compiled.threshold)
+    feats = compiled.feature[internal]
+    thrs = compiled.threshold[internal]
+    for f in np.unique(feats):
+        cand = thrs[feats == f]
+        picks = rng.choice(cand, size=n)
+        jitter = rng.choice([-1e-3, 0.0, 1e-3], size=n)
+        X[:, f] = picks + jitter
+    return X.astype(np.float32)
+
+
+def verify_compiled(compiled: CompiledTreeEnsemble, model, X=None, atol: float = 1e-9) -> bool:
+    """Check compiled output against sklearn on X (or on threshold probe rows)."""
+    if X is None:
+        X = probe_rows(compiled)
+    X = np.asarray(X, dtype=np.float32)
+    names = getattr(model, 'feature_names_in_', None)
+    X_ref = pd.DataFrame(X, columns=list(names)) if names is not None else X
+    try:
+        if compiled.kind in (FOREST_CLASSIFIER, GB_CLASSIFIER):
+            expected = model.predict_proba(X_ref)
+            got = compiled.predict_proba(X)
+        else:
+            expected = model.predict(X_ref)
+            got = compiled.predict(X)
+    except Exception as e:
+        logger.warning(f'Compiled model verification failed: {e}')
+        return False
+    return bool(np.allclose(expected, got, rtol=0.0, atol=atol))